@@ -0,0 +1,248 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional
+from .metrics import metrics
+from ..utils.logger import setup_logger
+
+logger = setup_logger('ai_admission')
+
+REASON_QUEUE_FULL = 'queue_full'
+REASON_QUEUE_TIMEOUT = 'queue_timeout'
+REASON_PREEMPTED = 'preempted'
+
+PRIORITY_EMERGENCY = 'emergency'
+PRIORITY_ROUTINE = 'routine'
+# Highest first
+PRIORITIES = (PRIORITY_EMERGENCY, PRIORITY_ROUTINE)
+
+
+class AdmissionRejected(Exception):
+    """
+    Raised when a generation cannot be admitted. `status` is the HTTP
+    status to answer with (429 when the wait queue is full, 503 when the
+    request's deadline passed while queued or it was preempted by
+    emergency work) and `retry_after` the number of seconds to put in the
+    Retry-After header.
+    """
+
+    def __init__(self, reason: str, retry_after: int, status: int):
+        super().__init__(f"Consultation rejected ({reason}), retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+
+class _Waiter:
+    __slots__ = ('event', 'granted', 'preempted', 'priority', 'enqueued')
+
+    def __init__(self, priority: str):
+        self.event = threading.Event()
+        self.granted = False
+        self.preempted = False
+        self.priority = priority
+        self.enqueued = time.monotonic()
+
+
+class Slot:
+    """
+    An admitted generation. release() is idempotent so it can be called
+    from both a stream's finally block and the response's close().
+    """
+
+    def __init__(self, controller: 'AdmissionController', priority: str = PRIORITY_ROUTINE, waited: float = 0.0):
+        self._controller = controller
+        self.priority = priority
+        self._waited = waited
+        self._started = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self._controller._release(self.priority, time.monotonic() - self._started, self._waited)
+
+
+class AdmissionController:
+    """
+    Priority-aware concurrency limiter in front of the LLM.
+
+    At most `max_concurrent` generations run at once; up to `max_queue`
+    more wait for at most `queue_timeout` seconds. Anything beyond that is
+    rejected immediately, so a burst degrades into fast 429/503 answers
+    instead of piling onto Ollama until every request times out together.
+
+    Waiters are served emergency first, FIFO within a class. The last
+    `emergency_reserved` slots only ever run emergency work, so an
+    emergency does not wait behind a saturating routine load, and an
+    emergency arriving at a full queue takes the place of the newest
+    queued routine request, which is rejected. A routine request that
+    has waited `starvation_timeout` seconds is served before newer
+    emergencies, so routine traffic keeps moving during a long spike.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, queue_timeout: float,
+                 emergency_reserved: int = 0, starvation_timeout: float = 10.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        # Routine work never takes the last slots, whatever max_concurrent is
+        self.emergency_reserved = min(emergency_reserved, max(max_concurrent - 1, 0))
+        self.starvation_timeout = starvation_timeout
+        self._lock = threading.Lock()
+        self._active = {priority: 0 for priority in PRIORITIES}
+        self._waiters = {priority: deque() for priority in PRIORITIES}
+        # Smoothed generation time, used to estimate Retry-After
+        self._service_time = None
+        metrics.register_collector(name, self.gauges)
+
+    def _queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def _can_start(self, priority: str) -> bool:
+        active = sum(self._active.values())
+        if priority == PRIORITY_EMERGENCY:
+            return active < self.max_concurrent
+        return active < self.max_concurrent - self.emergency_reserved
+
+    def _retry_after(self) -> int:
+        service_time = self._service_time or 1.0
+        backlog = (self._queued() + 1) / float(max(self.max_concurrent, 1))
+        return max(1, int(math.ceil(service_time * backlog)))
+
+    def _reject(self, reason: str, status: int, priority: str) -> AdmissionRejected:
+        metrics.incr(f'{self.name}_rejections', reason=reason, priority=priority)
+        logger.warning(f"{self.name}: rejected {priority} generation ({reason}), "
+                       f"{sum(self._active.values())} active, {self._queued()} queued")
+        return AdmissionRejected(reason, self._retry_after(), status)
+
+    def _preempt_routine(self) -> bool:
+        """
+        Reject the newest queued routine request to make room in the queue
+        """
+        routine = self._waiters[PRIORITY_ROUTINE]
+        if not routine:
+            return False
+        waiter = routine.pop()
+        waiter.preempted = True
+        waiter.event.set()
+        metrics.incr(f'{self.name}_preemptions')
+        return True
+
+    def acquire(self, timeout: Optional[float] = None, priority: str = PRIORITY_ROUTINE) -> Slot:
+        """
+        Take a generation slot for a request of the given priority class,
+        waiting in the queue for up to `timeout` seconds (default: the
+        controller's queue_timeout).
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}', expected one of {PRIORITIES}")
+        timeout = self.queue_timeout if timeout is None else timeout
+        started = time.monotonic()
+
+        with self._lock:
+            # Nobody of the same or a higher class is waiting ahead of us
+            ahead = self._waiters[PRIORITY_EMERGENCY] if priority == PRIORITY_EMERGENCY else self._queued()
+            if self._can_start(priority) and not ahead:
+                self._active[priority] += 1
+                metrics.observe(f'{self.name}_wait_seconds', 0.0, priority=priority)
+                return Slot(self, priority)
+            if self._queued() >= self.max_queue and not (
+                priority == PRIORITY_EMERGENCY and self._preempt_routine()
+            ):
+                raise self._reject(REASON_QUEUE_FULL, 429, priority)
+            waiter = _Waiter(priority)
+            self._waiters[priority].append(waiter)
+
+        waiter.event.wait(timeout)
+
+        with self._lock:
+            if waiter.preempted:
+                raise self._reject(REASON_PREEMPTED, 503, priority)
+            if not waiter.granted:
+                self._waiters[priority].remove(waiter)
+                raise self._reject(REASON_QUEUE_TIMEOUT, 503, priority)
+
+        waited = time.monotonic() - started
+        metrics.observe(f'{self.name}_wait_seconds', waited, priority=priority)
+        return Slot(self, priority, waited)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        emergency, routine = self._waiters[PRIORITY_EMERGENCY], self._waiters[PRIORITY_ROUTINE]
+        routine_ready = bool(routine) and self._can_start(PRIORITY_ROUTINE)
+        if routine_ready and time.monotonic() - routine[0].enqueued >= self.starvation_timeout:
+            if emergency:
+                metrics.incr(f'{self.name}_starvation_promotions')
+            return routine.popleft()
+        if emergency and self._can_start(PRIORITY_EMERGENCY):
+            return emergency.popleft()
+        if routine_ready:
+            return routine.popleft()
+        return None
+
+    def _release(self, priority: str, service_time: float, waited: float = 0.0):
+        metrics.observe(f'{self.name}_service_seconds', service_time, priority=priority)
+        metrics.observe(f'{self.name}_latency_seconds', waited + service_time, priority=priority)
+        with self._lock:
+            self._service_time = service_time if self._service_time is None else (
+                0.2 * service_time + 0.8 * self._service_time
+            )
+            self._active[priority] -= 1
+            # Hand freed slots straight to the next waiters in priority order
+            while True:
+                waiter = self._next_waiter()
+                if waiter is None:
+                    break
+                self._active[waiter.priority] += 1
+                waiter.granted = True
+                waiter.event.set()
+
+    @contextmanager
+    def admit(self, timeout: Optional[float] = None, priority: str = PRIORITY_ROUTINE):
+        slot = self.acquire(timeout, priority)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def gauges(self) -> Dict[str, float]:
+        with self._lock:
+            gauges = {
+                f'{self.name}_active': sum(self._active.values()),
+                f'{self.name}_queue_depth': self._queued(),
+                f'{self.name}_max_concurrent': self.max_concurrent,
+                f'{self.name}_max_queue': self.max_queue,
+                f'{self.name}_emergency_reserved': self.emergency_reserved,
+            }
+            for priority in PRIORITIES:
+                gauges[f'{self.name}_active{{priority={priority}}}'] = self._active[priority]
+                gauges[f'{self.name}_queue_depth{{priority={priority}}}'] = len(self._waiters[priority])
+            return gauges
+
+
+class ReleasingIterator:
+    """
+    Wrap a streaming response body so its admission slot is released when
+    the stream ends or the response is closed, even if the client
+    disconnected before the first chunk was requested.
+    """
+
+    def __init__(self, iterable: Iterable, slot: Slot):
+        self._iterator = iter(iterable)
+        self._slot = slot
+
+    def __iter__(self) -> Iterator:
+        try:
+            yield from self._iterator
+        finally:
+            self._slot.release()
+
+    def close(self):
+        close = getattr(self._iterator, 'close', None)
+        if close is not None:
+            close()
+        self._slot.release()
@@ -0,0 +1,263 @@
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+from .circuit_breaker import CircuitBreaker, STATE_VALUES
+from .http_client import OllamaHTTPClient, OllamaError
+from .metrics import metrics
+from ..utils.logger import setup_logger
+
+logger = setup_logger('ollama_backends')
+
+
+class NoHealthyBackendError(OllamaError):
+    """Raised when every configured Ollama backend is ejected"""
+
+
+def _model_names(payload: Dict[str, Any]) -> set:
+    names = set()
+    for model in payload.get('models', []):
+        name = model.get('name') or model.get('model') or ''
+        names.add(name)
+        names.add(name.split(':')[0])
+    return names
+
+
+class Backend:
+    """
+    One Ollama host plus the routing state the pool keeps about it
+    """
+
+    def __init__(self, url: str, client: OllamaHTTPClient, breaker: Optional[CircuitBreaker] = None):
+        self.url = url.rstrip('/')
+        self.client = client
+        self.breaker = breaker or CircuitBreaker(self.url)
+        self.in_flight = 0
+        self.healthy = True
+        self.model_available = None
+        self.model_resident = None
+        self.ewma_latency = None
+        self.requests = 0
+        self.failures = 0
+        self.last_error = ''
+        self.last_check = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'in_flight': self.in_flight,
+            'model_available': self.model_available,
+            'model_resident': self.model_resident,
+            'ewma_latency_seconds': round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+            'requests': self.requests,
+            'failures': self.failures,
+            'breaker': self.breaker.snapshot(),
+            'last_error': self.last_error,
+        }
+
+
+class BackendPool:
+    """
+    Least-outstanding-requests router over several Ollama hosts.
+
+    Requests go to the healthy backend with the fewest in-flight calls;
+    ties prefer the backend a session key hashes to (so a patient's
+    follow-ups tend to land where their prompt prefix is still in the KV
+    cache) and then the lowest EWMA latency. A backend is skipped while
+    its circuit breaker is open (consecutive failures or slow first
+    tokens) and ejected when an active health check fails; it is
+    re-admitted once /api/tags answers and lists the model.
+    """
+
+    def __init__(self, backends: List[Backend], model: str,
+                 health_interval: float = 10.0, health_timeout: float = 2.0, ewma_alpha: float = 0.3):
+        if not backends:
+            raise ValueError("BackendPool needs at least one backend")
+        self.backends = backends
+        self.model = model
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.ewma_alpha = ewma_alpha
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._stop = threading.Event()
+        metrics.register_collector(f'ollama_backends:{id(self)}', self.gauges)
+
+    @classmethod
+    def from_urls(cls, urls: Iterable[str], model: str, connect_timeout: float = 3.05,
+                  read_timeout: float = 300.0, pool_size: int = 10,
+                  breaker_options: Optional[Dict[str, Any]] = None, **kwargs) -> 'BackendPool':
+        backends = [
+            Backend(
+                url,
+                OllamaHTTPClient(url, connect_timeout=connect_timeout,
+                                 read_timeout=read_timeout, pool_size=pool_size),
+                CircuitBreaker(url.rstrip('/'), **(breaker_options or {}))
+            )
+            for url in urls
+        ]
+        return cls(backends, model, **kwargs)
+
+    def _preferred(self, candidates: List[Backend], affinity: Optional[Hashable]) -> Optional[Backend]:
+        if affinity is None:
+            return None
+        return candidates[zlib.crc32(str(affinity).encode('utf-8')) % len(candidates)]
+
+    def choose(self, affinity: Optional[Hashable] = None, exclude: Iterable[Backend] = ()) -> Backend:
+        """
+        Pick a backend and claim its breaker permit; raises
+        NoHealthyBackendError straight away when every circuit is open.
+        """
+        excluded = set(id(b) for b in exclude)
+        while True:
+            with self._lock:
+                candidates = [
+                    b for b in self.backends
+                    if b.healthy and id(b) not in excluded and b.breaker.available()
+                ]
+                if not candidates:
+                    raise NoHealthyBackendError("No healthy Ollama backend available")
+                preferred = self._preferred(candidates, affinity)
+                backend = min(candidates, key=lambda b: (
+                    b.in_flight,
+                    b is not preferred,
+                    b.ewma_latency if b.ewma_latency is not None else 0.0
+                ))
+            if backend.breaker.allow():
+                return backend
+            # Another caller took the half-open probe
+            excluded.add(id(backend))
+
+    def available_count(self, exclude: Iterable[Backend] = ()) -> int:
+        excluded = set(id(b) for b in exclude)
+        with self._lock:
+            return sum(
+                1 for b in self.backends
+                if b.healthy and id(b) not in excluded and b.breaker.available()
+            )
+
+    @contextmanager
+    def acquire(self, affinity: Optional[Hashable] = None, exclude: Iterable[Backend] = ()):
+        """
+        Reserve a backend for one request; the outcome updates its health
+        """
+        self.ensure_health_checks()
+        backend = self.choose(affinity, exclude)
+        with self._lock:
+            backend.in_flight += 1
+            backend.requests += 1
+
+        start = time.perf_counter()
+        try:
+            yield backend
+        except OllamaError as e:
+            self.record_failure(backend, e)
+            raise
+        except BaseException:
+            # Abandoned (e.g. a closed stream): says nothing about the host
+            backend.breaker.release()
+            raise
+        else:
+            self.record_success(backend, time.perf_counter() - start)
+        finally:
+            with self._lock:
+                backend.in_flight -= 1
+
+    def record_success(self, backend: Backend, latency: float):
+        metrics.observe('ollama_backend_latency_seconds', latency, backend=backend.url)
+        metrics.incr('ollama_backend_requests', backend=backend.url, result='ok')
+        backend.breaker.record_success()
+        with self._lock:
+            backend.ewma_latency = latency if backend.ewma_latency is None else (
+                self.ewma_alpha * latency + (1 - self.ewma_alpha) * backend.ewma_latency
+            )
+
+    def record_failure(self, backend: Backend, error: Exception):
+        metrics.incr('ollama_backend_requests', backend=backend.url, result='error')
+        with self._lock:
+            backend.failures += 1
+            backend.last_error = str(error)
+        backend.breaker.record_failure(str(error))
+
+    def record_first_token(self, backend: Backend, latency: float):
+        metrics.observe('ollama_first_token_seconds', latency)
+        metrics.observe('ollama_backend_first_token_seconds', latency, backend=backend.url)
+        backend.breaker.record_latency(latency)
+
+    def check_health(self, backend: Backend) -> bool:
+        """
+        Active check: the host answers /api/tags and has the model pulled.
+        Residency (loaded in memory) is reported from /api/ps when available.
+        """
+        try:
+            available = self.model in _model_names(backend.client.tags(timeout=self.health_timeout))
+            try:
+                resident = self.model in _model_names(backend.client.ps(timeout=self.health_timeout))
+            except OllamaError:
+                resident = None
+            error = '' if available else f"model '{self.model}' not available"
+        except OllamaError as e:
+            available, resident, error = False, None, str(e)
+
+        with self._lock:
+            was_healthy = backend.healthy
+            backend.model_available = available
+            backend.model_resident = resident
+            backend.last_check = time.time()
+            if available:
+                backend.healthy = True
+            else:
+                backend.healthy = False
+                backend.last_error = error
+
+        if available and not was_healthy:
+            metrics.incr('ollama_backend_readmissions', backend=backend.url)
+            logger.info(f"Re-admitted Ollama backend {backend.url}")
+        elif not available and was_healthy:
+            metrics.incr('ollama_backend_ejections', backend=backend.url)
+            logger.warning(f"Ejected Ollama backend {backend.url}: {error}")
+        return available
+
+    def check_all(self) -> List[Dict[str, Any]]:
+        for backend in self.backends:
+            self.check_health(backend)
+        return self.snapshot()
+
+    def ensure_health_checks(self):
+        if self.health_interval <= 0 or self._health_thread is not None:
+            return
+        with self._lock:
+            if self._health_thread is not None:
+                return
+            self._health_thread = threading.Thread(
+                target=self._health_loop, name='ollama-health-checks', daemon=True
+            )
+            self._health_thread.start()
+
+    def _health_loop(self):
+        while not self._stop.wait(self.health_interval):
+            for backend in self.backends:
+                try:
+                    self.check_health(backend)
+                except Exception as e:
+                    logger.error(f"Health check crashed for {backend.url}: {str(e)}", exc_info=True)
+
+    def stop(self):
+        self._stop.set()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [backend.snapshot() for backend in self.backends]
+
+    def gauges(self) -> Dict[str, float]:
+        values = {}
+        with self._lock:
+            for backend in self.backends:
+                values[f'ollama_backend_in_flight{{backend={backend.url}}}'] = backend.in_flight
+                values[f'ollama_backend_healthy{{backend={backend.url}}}'] = int(backend.healthy)
+                values[f'ollama_breaker_state{{backend={backend.url}}}'] = STATE_VALUES[backend.breaker.state]
+                if backend.ewma_latency is not None:
+                    values[f'ollama_backend_ewma_latency_seconds{{backend={backend.url}}}'] = round(backend.ewma_latency, 4)
+        return values
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from .conf import ai_setting
+from .metrics import metrics
+
+_WHITESPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCT_RE = re.compile(r'[\s\?\!\.\,;:]+$')
+
+
+def normalize_question(question: str) -> str:
+    """
+    Case-fold and collapse whitespace so trivially different phrasings of
+    the same question share a cache entry.
+    """
+    question = _WHITESPACE_RE.sub(' ', question.strip().lower())
+    return _TRAILING_PUNCT_RE.sub('', question)
+
+
+def record_fingerprint(medical_record: Dict[str, Any]) -> str:
+    """
+    Stable hash of the serialized record. Includes updated_at, so any save
+    of the record produces a new fingerprint.
+    """
+    payload = json.dumps(medical_record, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Thread-safe TTL + LRU cache of parsed consultation responses.
+
+    Keys embed the record fingerprint, so entries for an edited record can
+    never be served; invalidate_record() additionally frees them eagerly
+    when the record is saved in this process.
+    """
+
+    def __init__(self, max_entries: int = 512, ttl: float = 3600, name: str = 'response_cache'):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._by_record: Dict[Hashable, set] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(medical_record: Dict[str, Any], question: str) -> str:
+        raw = f"{record_fingerprint(medical_record)}:{normalize_question(question)}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                metrics.incr(f'{self.name}_requests', result='miss')
+                return None
+            self._entries.move_to_end(key)
+
+        metrics.incr(f'{self.name}_requests', result='hit')
+        return dict(entry[2])
+
+    def set(self, key: str, record_id: Hashable, value: Dict[str, Any]):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, record_id, dict(value))
+            self._by_record.setdefault(record_id, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                metrics.incr(f'{self.name}_evictions')
+
+    def invalidate_record(self, record_id: Hashable) -> int:
+        with self._lock:
+            keys = list(self._by_record.get(record_id, ()))
+            for key in keys:
+                self._remove(key)
+        if keys:
+            metrics.incr(f'{self.name}_invalidations', len(keys))
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_record.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        _, record_id, _ = self._entries.pop(key)
+        keys = self._by_record.get(record_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_record[record_id]
+
+
+response_cache = ResponseCache(
+    max_entries=ai_setting('RESPONSE_CACHE_MAX_ENTRIES'),
+    ttl=ai_setting('RESPONSE_CACHE_TTL')
+)
+
+metrics.register_collector('response_cache', lambda: {'response_cache_entries': len(response_cache)})
@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Any, Dict, Optional
+from .metrics import metrics
+from ..utils.logger import setup_logger
+
+logger = setup_logger('ollama_breaker')
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Per-backend circuit breaker.
+
+    Closed: requests flow; `failure_threshold` consecutive failures or
+    `slo_breaches` consecutive first-token latencies above `latency_slo`
+    trip it open. Open: requests fail fast for `reset_timeout` seconds.
+    Half-open: a single probe request is let through; success closes the
+    breaker, failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, latency_slo: Optional[float] = 30.0,
+                 slo_breaches: int = 3, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.latency_slo = latency_slo
+        self.slo_breaches = slo_breaches
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.consecutive_slow = 0
+        self.opened_at = None
+        self.last_reason = ''
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str, reason: str = ''):
+        # Caller holds the lock
+        previous, self.state = self.state, state
+        if state == STATE_OPEN:
+            self.opened_at = time.monotonic()
+            self.last_reason = reason
+        if state == STATE_CLOSED:
+            self.consecutive_failures = 0
+            self.consecutive_slow = 0
+        self._probe_in_flight = False
+        metrics.incr('ollama_breaker_transitions', backend=self.name, state=state)
+        log = logger.warning if state == STATE_OPEN else logger.info
+        log(f"Circuit for {self.name}: {previous} -> {state}" + (f" ({reason})" if reason else ''))
+
+    def available(self) -> bool:
+        """
+        Whether a request may be routed here right now (without claiming
+        the half-open probe)
+        """
+        with self._lock:
+            if self.state == STATE_OPEN:
+                return time.monotonic() - self.opened_at >= self.reset_timeout
+            if self.state == STATE_HALF_OPEN:
+                return not self._probe_in_flight
+            return True
+
+    def allow(self) -> bool:
+        """
+        Claim permission for one request; an expired open circuit moves to
+        half-open and hands out its single probe.
+        """
+        with self._lock:
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self._transition(STATE_HALF_OPEN)
+            if self.state == STATE_HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            if self.state == STATE_HALF_OPEN:
+                self._transition(STATE_CLOSED)
+
+    def record_failure(self, reason: str = ''):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == STATE_HALF_OPEN:
+                self._transition(STATE_OPEN, reason or 'probe failed')
+            elif self.state == STATE_CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._transition(STATE_OPEN, f"{self.consecutive_failures} consecutive failures: {reason}")
+
+    def release(self):
+        """
+        Give back a permit whose request was abandoned without an outcome
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_latency(self, seconds: float):
+        """
+        Feed a first-token latency; repeated SLO breaches trip the breaker
+        even though the requests eventually succeed.
+        """
+        if self.latency_slo is None:
+            return
+        with self._lock:
+            if seconds <= self.latency_slo:
+                self.consecutive_slow = 0
+                return
+            self.consecutive_slow += 1
+            if self.state == STATE_HALF_OPEN:
+                self._transition(STATE_OPEN, f"probe took {seconds:.1f}s to first token")
+            elif self.state == STATE_CLOSED and self.consecutive_slow >= self.slo_breaches:
+                self._transition(
+                    STATE_OPEN, f"{self.consecutive_slow} first tokens slower than {self.latency_slo}s SLO"
+                )
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'consecutive_slow': self.consecutive_slow,
+                'last_reason': self.last_reason,
+            }
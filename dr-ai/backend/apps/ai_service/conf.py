@@ -0,0 +1,149 @@
+from django.conf import settings
+
+# Defaults for the AI_SERVICE settings dict (see drai/settings.py)
+DEFAULTS = {
+    'OLLAMA_BASE_URL': 'http://localhost:11434',
+    'OLLAMA_MODEL': 'medllama2',
+    'OLLAMA_CONNECT_TIMEOUT': 3.05,
+    'OLLAMA_READ_TIMEOUT': 300.0,
+    'OLLAMA_POOL_SIZE': 10,
+    # Extra Ollama hosts to load-balance across; empty uses OLLAMA_BASE_URL only
+    'OLLAMA_BACKENDS': [],
+    # Per-backend circuit breaker: opens after this many consecutive failures
+    # or first tokens slower than BREAKER_LATENCY_SLO seconds, and lets a
+    # probe through after BREAKER_RESET_TIMEOUT seconds
+    'OLLAMA_BACKEND_FAILURE_THRESHOLD': 3,
+    'BREAKER_LATENCY_SLO': 30.0,
+    'BREAKER_SLO_BREACHES': 3,
+    'BREAKER_RESET_TIMEOUT': 30.0,
+    # Duplicate a request to a second backend when its first token is later
+    # than the HEDGE_PERCENTILE of recent first-token latencies
+    'HEDGE_ENABLED': False,
+    'HEDGE_PERCENTILE': 95.0,
+    'HEDGE_MIN_DELAY': 0.5,
+    'HEDGE_DEFAULT_DELAY': 5.0,
+    # Seconds between active /api/tags health checks (0 disables them)
+    'OLLAMA_HEALTH_INTERVAL': 10.0,
+    'OLLAMA_HEALTH_TIMEOUT': 2.0,
+    # 'text' (DIAGNOSIS:/TREATMENT PLAN: headers) or 'json' (Ollama structured
+    # output validated against a schema, with one re-ask on invalid JSON).
+    # STRUCTURED_OUTPUT_SCHEMA=False sends format='json' for Ollama < 0.5.
+    'OLLAMA_OUTPUT_FORMAT': 'text',
+    'STRUCTURED_OUTPUT_SCHEMA': True,
+    # Stop free-text answers at the sign-off after the treatment plan, and
+    # size num_predict per question type from recent answer lengths (p95 x
+    # headroom, within MIN..MAX, once MIN_SAMPLES answers have been seen)
+    'GENERATION_EARLY_STOP': True,
+    'GENERATION_ADAPTIVE_NUM_PREDICT': True,
+    'GENERATION_NUM_PREDICT_MIN': 256,
+    'GENERATION_NUM_PREDICT_MAX': 1024,
+    'GENERATION_NUM_PREDICT_HEADROOM': 1.25,
+    'GENERATION_NUM_PREDICT_MIN_SAMPLES': 20,
+    # Route questions by complexity: 'simple' record look-ups go to a small
+    # fast model with a short num_predict, 'complex' ones to OLLAMA_MODEL
+    # (a model of None). Classes missing from the table use OLLAMA_MODEL.
+    'MODEL_ROUTING_ENABLED': False,
+    'MODEL_ROUTES': {
+        'simple': {'model': 'llama3.2:1b', 'num_predict': 256},
+        'complex': {'model': None},
+    },
+    # Answer pure record look-ups ("blood type", "current medications")
+    # straight from the record when the intent match scores at least
+    # LOOKUP_FAST_PATH_THRESHOLD (0..1); lower scores go to the LLM
+    'LOOKUP_FAST_PATH_ENABLED': True,
+    'LOOKUP_FAST_PATH_THRESHOLD': 0.8,
+    # Retrieval over long medical histories: histories of more than
+    # HISTORY_RETRIEVAL_MIN_ENTRIES entries are cut to the RECENT newest plus
+    # the TOP_K that best match the question (BM25, blended with 'hashing'
+    # embeddings by EMBEDDING_WEIGHT when an embedder is set; needs numpy,
+    # see requirements-optional.txt).
+    # Indexes are kept for MAX_RECORDS records and updated on save.
+    'HISTORY_RETRIEVAL_ENABLED': True,
+    'HISTORY_RETRIEVAL_MIN_ENTRIES': 24,
+    'HISTORY_RETRIEVAL_TOP_K': 8,
+    'HISTORY_RETRIEVAL_RECENT': 5,
+    'HISTORY_RETRIEVAL_EMBEDDER': None,
+    'HISTORY_RETRIEVAL_DIM': 512,
+    'HISTORY_RETRIEVAL_EMBEDDING_WEIGHT': 0.5,
+    'HISTORY_RETRIEVAL_MAX_RECORDS': 1024,
+    # Conversation memory for follow-up questions (the client's `follow_up`
+    # flag, or questions like "what about the dose?"): the last
+    # CONVERSATION_MAX_TURNS consultations verbatim plus a compact summary of
+    # older ones (at most CONVERSATION_SUMMARY_TOKENS), CONVERSATION_MAX_TOKENS
+    # in all. A gap of CONVERSATION_IDLE_TIMEOUT seconds starts a new one.
+    'CONVERSATION_MEMORY_ENABLED': True,
+    'CONVERSATION_MAX_TURNS': 3,
+    'CONVERSATION_MAX_TOKENS': 600,
+    'CONVERSATION_SUMMARY_TOKENS': 200,
+    'CONVERSATION_IDLE_TIMEOUT': 1800,
+    # Standing AI risk summary per patient, regenerated in the background
+    # PATIENT_SUMMARY_DEBOUNCE seconds after the last change to the record
+    # by PATIENT_SUMMARY_WORKERS threads (at most MAX_PENDING records queued)
+    # and served with the public record and for "summarize this patient"
+    'PATIENT_SUMMARY_ENABLED': True,
+    'PATIENT_SUMMARY_DEBOUNCE': 5.0,
+    'PATIENT_SUMMARY_WORKERS': 1,
+    'PATIENT_SUMMARY_MAX_PENDING': 256,
+    # Store Ollama's timings (load, prompt prefill, generation, time to first
+    # token) for every generated consultation in ConsultationTelemetry
+    'GENERATION_TELEMETRY_STORE': True,
+    # Estimated prompt tokens; None derives it from num_ctx - num_predict - system prompt
+    'PROMPT_TOKEN_BUDGET': None,
+    # How long Ollama keeps the model (and its KV cache) resident after a call
+    'OLLAMA_KEEP_ALIVE': '30m',
+    # Preload the model on every backend when a server process starts, then
+    # re-send the preload every WARMUP_REFRESH_INTERVAL seconds (0 disables)
+    # so keep_alive never expires between consultations
+    'WARMUP_ON_STARTUP': False,
+    'WARMUP_REFRESH_INTERVAL': 600.0,
+    # Per-patient reuse of the evaluated prompt prefix via Ollama `context`
+    'PROMPT_SESSION_CACHE_ENABLED': True,
+    'PROMPT_SESSION_CACHE_MAX': 256,
+    'PROMPT_SESSION_CACHE_TTL': 1800,
+
+    # Admission control: concurrent generations, bounded wait queue and the
+    # seconds a request may wait for a slot before a 503
+    'ADMISSION_MAX_CONCURRENT': 4,
+    'ADMISSION_MAX_QUEUE': 16,
+    'ADMISSION_QUEUE_TIMEOUT': 30.0,
+    # Priority classes: slots only emergency work may take, and the seconds
+    # after which a queued routine request is served ahead of emergencies
+    'ADMISSION_EMERGENCY_RESERVED': 1,
+    'ADMISSION_STARVATION_TIMEOUT': 10.0,
+    # Class of the public NFC consultation endpoints ('emergency' or
+    # 'routine'); signed-in non-staff users are always routine
+    'PUBLIC_CONSULTATION_PRIORITY': 'emergency',
+
+    # Background consultation jobs
+    'JOB_WORKERS': 2,
+    'JOB_IN_PROCESS_WORKERS': True,
+    'JOB_POLL_INTERVAL': 2.0,
+    'JOB_STALE_AFTER': 900,
+
+    # Exact-match consultation response cache
+    'RESPONSE_CACHE_ENABLED': True,
+    'RESPONSE_CACHE_MAX_ENTRIES': 512,
+    'RESPONSE_CACHE_TTL': 3600,
+
+    # Semantic (paraphrase) cache; requires numpy (requirements-optional.txt)
+    'SEMANTIC_CACHE_ENABLED': False,
+    'SEMANTIC_CACHE_EMBEDDER': 'hashing',
+    'SEMANTIC_CACHE_EMBEDDING_MODEL': 'nomic-embed-text',
+    'SEMANTIC_CACHE_DIM': 512,
+    'SEMANTIC_CACHE_THRESHOLD': 0.85,
+    'SEMANTIC_CACHE_MAX_PER_RECORD': 1024,
+    'SEMANTIC_CACHE_MAX_RECORDS': 2048,
+    'SEMANTIC_CACHE_WARM_LIMIT': 100,
+
+    # Batch consultations: items per request and generations run at once
+    # (None uses ADMISSION_MAX_CONCURRENT)
+    'BATCH_MAX_ITEMS': 100,
+    'BATCH_CONCURRENCY': None,
+
+    # Seconds during which a repeated Idempotency-Key replays the stored consultation
+    'IDEMPOTENCY_WINDOW': 600,
+}
+
+
+def ai_setting(name: str):
+    return getattr(settings, 'AI_SERVICE', {}).get(name, DEFAULTS[name])
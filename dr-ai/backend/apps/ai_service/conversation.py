@@ -0,0 +1,137 @@
+import math
+import re
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+from .prompt_builder import compact_entry, estimate_tokens, _truncate_to_tokens
+
+CONVERSATION_HEADER = "**Earlier In This Consultation**:"
+CONVERSATION_FOOTER = "(Answer the new query in the context of this conversation; do not repeat earlier answers.)"
+
+# Questions that only make sense after an earlier answer: "what about
+# the dose?", "and if it gets worse?", "you mentioned an inhaler". Bare
+# pronouns are not enough: "is this rash from penicillin?" and "...for
+# this patient" stand on their own.
+_FOLLOW_UP = re.compile(
+    r"^\s*(?:and|but|also|what about|how about|what if|instead)\b|"
+    r"\b(?:you (?:said|mentioned|suggested|recommended|wrote)|your (?:last |previous )?(?:answer|advice|plan)|"
+    r"(?:the|that) (?:last|previous|earlier) (?:answer|question|plan)|as above|mentioned above)\b",
+    re.IGNORECASE
+)
+
+
+def is_follow_up(question: str, explicit: Optional[bool] = None) -> bool:
+    """
+    Whether a question continues the conversation. `explicit` is the
+    client's own follow-up flag and wins when given; otherwise only
+    questions that open with a connective or refer back to an earlier
+    answer count.
+    """
+    if explicit is not None:
+        return explicit
+    return bool(_FOLLOW_UP.search(question or ''))
+
+
+@dataclass
+class Turn:
+    question: str
+    diagnosis: str
+    treatment_plan: str
+
+
+@dataclass
+class ConversationContext:
+    """
+    Rendered conversation block for a prompt and what went into it
+    """
+    text: str = ''
+    turns: int = 0
+    summarised_turns: int = 0
+    tokens: int = 0
+    folded: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        del data['text']
+        return data
+
+
+class ConversationWindow:
+    """
+    Bounded memory of a patient conversation.
+
+    The last `max_turns` turns are kept verbatim (question, diagnosis and
+    treatment plan, each turn capped so they share what the summary leaves
+    of `max_tokens`). Older turns are folded into a compact summary, one
+    line per turn (the question and the first sentence of its diagnosis),
+    which is trimmed oldest-first to `summary_tokens`. Folding is
+    incremental: only turns leaving the verbatim window are added, so the
+    summary never has to be rebuilt from the whole conversation.
+    """
+
+    def __init__(self, max_turns: int = 3, max_tokens: int = 600, summary_tokens: int = 200,
+                 compact_chars: int = 120):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.summary_tokens = min(summary_tokens, max_tokens)
+        self.compact_chars = compact_chars
+
+    def compact(self, turn: Turn) -> str:
+        question = compact_entry(' '.join(turn.question.split()), self.compact_chars)
+        answer = compact_entry(' '.join(turn.diagnosis.split()), self.compact_chars)
+        return f"- Q: {question} -> {answer}"
+
+    def fold(self, summary: str, turns: List[Turn]) -> str:
+        """
+        Summary with `turns` appended, trimmed to summary_tokens by
+        dropping its oldest lines
+        """
+        lines = [line for line in summary.split('\n') if line.strip()]
+        lines.extend(self.compact(turn) for turn in turns)
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.summary_tokens:
+            lines.pop(0)
+        return _truncate_to_tokens('\n'.join(lines), self.summary_tokens)
+
+    def split(self, turns: List[Any]) -> Tuple[List[Any], List[Any]]:
+        """
+        (turns to fold into the summary, turns kept verbatim), oldest first
+        """
+        if len(turns) <= self.max_turns:
+            return [], turns
+        return turns[:-self.max_turns], turns[-self.max_turns:]
+
+    def render(self, summary: str, turns: List[Turn], summarised_turns: int = 0) -> ConversationContext:
+        """
+        Conversation block for the prompt: the summary of older turns, then
+        the recent turns verbatim, within max_tokens
+        """
+        if not summary and not turns:
+            return ConversationContext()
+
+        blocks = []
+        if summary:
+            blocks.append(f"Summary of {summarised_turns or 'the'} earlier questions:\n{summary}")
+        room = max(0, self.max_tokens - estimate_tokens(
+            '\n'.join([CONVERSATION_HEADER, *blocks, CONVERSATION_FOOTER])
+        ))
+        # Lower-case labels: the strict section headers belong to the answer only
+        turn_texts = [
+            f"Q: {' '.join(turn.question.split())}\n"
+            f"Assessment: {turn.diagnosis.strip()}\n"
+            f"Plan: {turn.treatment_plan.strip()}"
+            for turn in turns
+        ]
+        turn_cap = room // max(1, len(turns))
+        while True:
+            text = '\n'.join([
+                CONVERSATION_HEADER,
+                '\n\n'.join(blocks + [_truncate_to_tokens(turn, turn_cap) for turn in turn_texts]),
+                CONVERSATION_FOOTER
+            ])
+            # Joining can round the estimate up past the cap by a few tokens
+            excess = estimate_tokens(text) - self.max_tokens
+            if excess <= 0 or not turn_texts or turn_cap <= 0:
+                break
+            turn_cap = max(0, turn_cap - math.ceil(excess / len(turn_texts)) - 1)
+        return ConversationContext(
+            text=text, turns=len(turns), summarised_turns=summarised_turns, tokens=estimate_tokens(text)
+        )
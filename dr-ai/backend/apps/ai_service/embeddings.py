@@ -0,0 +1,95 @@
+import re
+import zlib
+from typing import List
+from ..utils.logger import setup_logger
+
+try:
+    import numpy as np
+except ImportError:
+    # Only the embedders need numpy (requirements-optional.txt);
+    # content_words, used by history retrieval, does not
+    np = None
+
+logger = setup_logger('embeddings')
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Function words only. Words that carry the question's intent ("why",
+# "for", "cause", "side effect", "related to") are kept: "What is
+# lisinopril for?" and "What are the side effects of lisinopril?" must not
+# embed to the same vector.
+STOPWORDS = frozenset("""
+a about after an and are as at be by can could do does from has have how i
+if in is it its know me my of on or should since started starting that the
+this to was what when which will with would you your patient patients
+""".split())
+
+
+def _stem(word: str) -> str:
+    for suffix in ('ing', 'ies', 'es', 'ed', 's'):
+        if len(word) > len(suffix) + 2 and word.endswith(suffix):
+            return word[:-len(suffix)]
+    return word
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError('Embeddings need numpy: pip install -r requirements-optional.txt')
+
+
+def content_words(text: str) -> List[str]:
+    """
+    Lower-cased, stemmed words of a text without stopwords
+    """
+    return [_stem(w) for w in _TOKEN_RE.findall(text.lower()) if w not in STOPWORDS]
+
+
+class HashingEmbedder:
+    """
+    Dependency-free CPU encoder: hashes stemmed content words and their
+    character trigrams into a fixed-size, L2-normalised vector. Good enough
+    to match paraphrases that share clinical vocabulary.
+    """
+
+    def __init__(self, dim: int = 512):
+        _require_numpy()
+        self.dim = dim
+
+    def _features(self, text: str):
+        for word in content_words(text):
+            yield word, 1.0
+            padded = f'#{word}#'
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], 0.35
+
+    def embed(self, text: str) -> 'np.ndarray':
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature, weight in self._features(text):
+            h = zlib.crc32(feature.encode('utf-8'))
+            vector[h % self.dim] += weight if (h >> 31) & 1 else -weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, texts: List[str]) -> 'np.ndarray':
+        return np.vstack([self.embed(text) for text in texts]) if texts else np.zeros((0, self.dim), np.float32)
+
+
+class OllamaEmbedder:
+    """
+    Embeddings from a local Ollama embedding model (e.g. nomic-embed-text)
+    """
+
+    def __init__(self, client, model: str):
+        _require_numpy()
+        self.client = client
+        self.model = model
+        self.dim = None
+
+    def embed(self, text: str) -> 'np.ndarray':
+        vector = np.asarray(self.client.embed(text, model=self.model), dtype=np.float32)
+        self.dim = vector.shape[0]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, texts: List[str]) -> 'np.ndarray':
+        return np.vstack([self.embed(text) for text in texts])
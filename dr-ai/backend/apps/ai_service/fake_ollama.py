@@ -0,0 +1,312 @@
+"""
+Local stand-in for the Ollama REST API, used by benchmarks and load tests.
+
+    python -m apps.ai_service.fake_ollama --port 11434
+"""
+import argparse
+import json
+import random
+import socket
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_RESPONSE = """DIAGNOSIS:
+Findings are consistent with a drug-induced maculopapular rash, most likely a delayed type IV hypersensitivity reaction to a beta-lactam antibiotic. Diagnostic criteria met: temporal relation to exposure, morphology, absence of systemic involvement. Differential diagnosis: viral exanthem, contact dermatitis. ICD-11: EH63.0
+
+TREATMENT PLAN:
+1. Discontinue the suspected agent and document the allergy; start an oral non-sedating antihistamine once daily.
+2. Apply a mid-potency topical corticosteroid twice daily for 7 days.
+3. Avoid hot showers and irritant soaps; use emollients.
+4. Review in 48-72 hours; monitor temperature, mucosal involvement and skin blistering.
+5. Seek immediate care for facial swelling, breathing difficulty, mucosal lesions or skin sloughing."""
+
+# Answer for requests that set `format` (JSON mode)
+_diagnosis, _treatment_plan = DEFAULT_RESPONSE[len('DIAGNOSIS:\n'):].split('\n\nTREATMENT PLAN:\n')
+DEFAULT_JSON_RESPONSE = json.dumps({
+    'diagnosis': _diagnosis.replace(' ICD-11: EH63.0', ''),
+    'treatment_plan': _treatment_plan,
+    'icd_code': 'EH63.0',
+})
+
+
+ERROR_MODES = ('status', 'disconnect')
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # Go's net/http (real Ollama) disables Nagle; do the same so small
+        # responses are not held back by delayed ACKs.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_one_request(self):
+        # A stopped server also drops its open keep-alive connections, so
+        # clients see it go down like a real host would.
+        if getattr(self.server, 'stopped', False):
+            self.close_connection = True
+            return
+        super().handle_one_request()
+
+    @property
+    def config(self):
+        return self.server.fake_config
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _timings(self, prompt_tokens, eval_tokens, started, load_seconds=0.0, prompt_seconds=0.0):
+        total_ns = int((time.perf_counter() - started) * 1e9)
+        load_ns, prompt_ns = int(load_seconds * 1e9), int(prompt_seconds * 1e9)
+        return {
+            'total_duration': total_ns,
+            'load_duration': load_ns,
+            'prompt_eval_count': prompt_tokens,
+            'prompt_eval_duration': prompt_ns,
+            'eval_count': eval_tokens,
+            'eval_duration': max(0, total_ns - load_ns - prompt_ns),
+        }
+
+    def _inject_error(self):
+        """
+        Whether this generation fails, per the configured error_rate
+        """
+        rate = self.config['error_rate']
+        if not rate:
+            return False
+        with self.server.random_lock:
+            return self.server.random.random() < rate
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json(200, {'models': [{'name': f"{name}:latest", 'model': f"{name}:latest"}
+                                             for name in self.config['models']]})
+        elif self.path == '/api/ps':
+            self._send_json(200, {'models': [{'name': f"{name}:latest", 'model': f"{name}:latest"}
+                                             for name in sorted(self.server.loaded)]})
+        elif self.path == '/':
+            self._send_json(200, {'status': 'Ollama is running'})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        started = time.perf_counter()
+        payload = self._read_json()
+        self.server.request_count += 1
+
+        if self.path in ('/api/embeddings', '/api/embed'):
+            text = payload.get('prompt') or payload.get('input') or ''
+            seed = zlib.crc32(text.encode('utf-8'))
+            vector = [((seed * (i + 1)) % 251) / 250.0 for i in range(64)]
+            key = 'embedding' if self.path == '/api/embeddings' else 'embeddings'
+            self._send_json(200, {key: vector if key == 'embedding' else [vector]})
+            return
+
+        if self.path not in ('/api/generate', '/api/chat'):
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        if payload.get('model', '').split(':')[0] not in self.config['models']:
+            self._send_json(404, {'error': f"model '{payload.get('model')}' not found"})
+            return
+
+        # The first call for a model pays its load time; /api/ps lists it afterwards
+        model = payload['model'].split(':')[0]
+        load_seconds = 0.0
+        if model not in self.server.loaded:
+            load_seconds = self.config['load_delay']
+            time.sleep(load_seconds)
+            self.server.loaded.add(model)
+
+        fail = self._inject_error()
+        if fail and self.config['error_mode'] == 'status':
+            self.server.error_count += 1
+            self._send_json(500, {'error': 'injected failure'})
+            return
+
+        is_chat = self.path == '/api/chat'
+        prompt = payload.get('prompt', '') if not is_chat else ' '.join(
+            m.get('content', '') for m in payload.get('messages', []))
+        prompt_tokens = max(1, len(prompt) // 4)
+        # A list of responses is served round-robin
+        response = self.config['json_response' if payload.get('format') else 'response']
+        if isinstance(response, (list, tuple)):
+            response = response[(self.server.request_count - 1) % len(response)]
+        if not is_chat and not payload.get('prompt'):
+            # An empty prompt only loads the model
+            response = ''
+        # Honour stop strings and num_predict like Ollama does
+        options = payload.get('options') or {}
+        for stop in options.get('stop') or ():
+            response = response.split(stop, 1)[0]
+        tokens = response.split(' ') if response else []
+        tokens = [t + ' ' for t in tokens[:-1]] + tokens[-1:]
+        done_reason = 'stop'
+        if options.get('num_predict', -1) >= 0 and len(tokens) > options['num_predict']:
+            tokens = tokens[:options['num_predict']]
+            done_reason = 'length'
+        token_delay = 1.0 / self.config['eval_rate'] if self.config['eval_rate'] else 0
+        # Prompt evaluation happens before the first token; a preload has none
+        prompt_seconds = self.config['prompt_delay'] if prompt else 0.0
+        if prompt and self.config['prompt_eval_rate']:
+            prompt_seconds += prompt_tokens / self.config['prompt_eval_rate']
+        time.sleep(prompt_seconds)
+
+        def chunk(text, done=False):
+            body = {'model': payload['model'], 'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ'), 'done': done}
+            if is_chat:
+                body['message'] = {'role': 'assistant', 'content': text}
+            else:
+                body['response'] = text
+            if done:
+                body.update(self._timings(prompt_tokens, len(tokens), started, load_seconds, prompt_seconds))
+                body['done_reason'] = done_reason
+                if not is_chat:
+                    body['context'] = list(range(prompt_tokens + len(tokens)))
+            return body
+
+        if fail:
+            # error_mode 'disconnect': drop the connection halfway through the answer
+            self.server.error_count += 1
+            self.close_connection = True
+            if payload.get('stream', True):
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for token in tokens[:len(tokens) // 2]:
+                    time.sleep(token_delay)
+                    self._write_chunk(chunk(token))
+            return
+
+        if not payload.get('stream', True):
+            time.sleep(token_delay * len(tokens))
+            self._send_json(200, chunk(''.join(tokens), done=True))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for token in tokens:
+                time.sleep(token_delay)
+                self._write_chunk(chunk(token))
+            self._write_chunk(chunk('', done=True))
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _write_chunk(self, body):
+        data = (json.dumps(body) + '\n').encode('utf-8')
+        self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+        self.wfile.flush()
+
+
+class FakeOllamaServer:
+    """
+    Threaded fake Ollama server. Use as a context manager or call
+    start()/stop(); port 0 picks a free port.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, models=('medllama2',),
+                 response=DEFAULT_RESPONSE, json_response=DEFAULT_JSON_RESPONSE, eval_rate: float = 0,
+                 load_delay: float = 0, preloaded: bool = True, prompt_eval_rate: float = 0,
+                 prompt_delay: float = 0, error_rate: float = 0, error_mode: str = 'status', seed=None):
+        # eval_rate: generated tokens per second (0 answers instantly);
+        # prompt_eval_rate / prompt_delay: prompt tokens per second and a fixed
+        # delay before the first token;
+        # load_delay: seconds the first request for a model spends loading it
+        # unless the server starts with its models preloaded;
+        # error_rate: fraction of generations that fail, with a 500
+        # (error_mode 'status') or a connection dropped mid-answer ('disconnect')
+        if error_mode not in ERROR_MODES:
+            raise ValueError(f"error_mode must be one of {', '.join(ERROR_MODES)}")
+        self.httpd = ThreadingHTTPServer((host, port), FakeOllamaHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.request_count = 0
+        self.httpd.error_count = 0
+        self.httpd.random = random.Random(seed)
+        self.httpd.random_lock = threading.Lock()
+        self.httpd.loaded = set(models) if preloaded else set()
+        self.httpd.fake_config = {
+            'models': list(models), 'response': response, 'json_response': json_response,
+            'eval_rate': eval_rate, 'load_delay': load_delay, 'prompt_eval_rate': prompt_eval_rate,
+            'prompt_delay': prompt_delay, 'error_rate': error_rate, 'error_mode': error_mode
+        }
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def request_count(self) -> int:
+        return self.httpd.request_count
+
+    @property
+    def error_count(self) -> int:
+        return self.httpd.error_count
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.stopped = True
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a fake Ollama server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=11434)
+    parser.add_argument('--model', action='append', dest='models', help='Model name to advertise (repeatable)')
+    parser.add_argument('--eval-rate', type=float, default=0, help='Generated tokens per second (0: instant)')
+    parser.add_argument('--prompt-eval-rate', type=float, default=0, help='Prompt tokens per second (0: instant)')
+    parser.add_argument('--prompt-delay', type=float, default=0, help='Fixed seconds before the first token')
+    parser.add_argument('--load-delay', type=float, default=0, help='Seconds the first request spends loading')
+    parser.add_argument('--error-rate', type=float, default=0, help='Fraction of generations that fail')
+    parser.add_argument('--error-mode', choices=ERROR_MODES, default='status')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for error injection')
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(
+        args.host, args.port, models=args.models or ['medllama2'], eval_rate=args.eval_rate,
+        prompt_eval_rate=args.prompt_eval_rate, prompt_delay=args.prompt_delay,
+        load_delay=args.load_delay, preloaded=not args.load_delay, error_rate=args.error_rate,
+        error_mode=args.error_mode, seed=args.seed
+    )
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
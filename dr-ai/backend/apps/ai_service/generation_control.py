@@ -0,0 +1,233 @@
+import math
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field, fields
+from typing import Any, Dict, Optional
+
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 768, 1024, 2048, float('inf'))
+RATE_BUCKETS = (1, 2.5, 5, 10, 20, 30, 50, 75, 100, 200, 500, float('inf'))
+
+QUESTION_MEDICATION = 'medication'
+QUESTION_LIFESTYLE = 'lifestyle'
+QUESTION_DIAGNOSTIC = 'diagnostic'
+QUESTION_GENERAL = 'general'
+
+# First matching type wins
+_QUESTION_TYPES = (
+    (QUESTION_MEDICATION, re.compile(
+        r'\b(?:dos(?:e|age|ing)|medications?|medicines?|drugs?|pills?|tablets?|mg|side[ -]effects?|'
+        r'interact\w*|prescri\w*|refill|antibiotics?|take)\b', re.IGNORECASE)),
+    (QUESTION_LIFESTYLE, re.compile(
+        r'\b(?:diet|eat\w*|food|exercis\w*|sleep\w*|lifestyle|alcohol|smok\w*|weight|sport|travel)\b',
+        re.IGNORECASE)),
+    (QUESTION_DIAGNOSTIC, re.compile(
+        r'\b(?:why|cause[sd]?|diagnos\w*|symptoms?|pain|rash|fever|ache\w*|what is|could (?:it|this)|'
+        r'is it|test\w*|results?)\b', re.IGNORECASE)),
+)
+
+# Stop strings handed to Ollama in free-text mode; they only occur in the
+# sign-off the prompt already forbids
+STOP_SEQUENCES = ('[Your signature]', '[Your name]', 'Sincerely,', 'Best regards,', 'Kind regards,')
+
+_TREATMENT_HEADER = re.compile(r'(?im)^[ \t#>*_-]*(?:\d+[.)][ \t]*)?treatment[ \t]*plan\b')
+_NUMBERED_STEP = re.compile(r'(?m)^[ \t*_-]*\d+[.)][ \t]')
+_PARAGRAPH_BREAK = re.compile(r'\n[ \t]*\n\s*')
+# Paragraphs that follow a finished plan without adding to it
+_TRAILER = re.compile(
+    r'(?:[*_#]+[ \t]*)?(?:thank|i hope|hope this|disclaimer|sincerely|(?:best|kind|warm) regards|'
+    r'regards\b|\[your|dr\.|this (?:information|advice|response) (?:is|does)|as an ai|i am not a)',
+    re.IGNORECASE
+)
+# Characters of the next paragraph needed before it can be classified
+_TRAILER_LOOKAHEAD = 24
+
+
+def classify_question(question: str) -> str:
+    for question_type, pattern in _QUESTION_TYPES:
+        if pattern.search(question or ''):
+            return question_type
+    return QUESTION_GENERAL
+
+
+class EarlyStopDetector:
+    """
+    Watches a free-text completion and says when to stop: once the
+    TREATMENT PLAN has at least one numbered step, a following paragraph
+    that is a sign-off, disclaimer or pleasantry ends the answer.
+
+    feed() returns the part of the text that is safe to pass on; after a
+    paragraph break inside the plan, the next few characters are held back
+    until they can be classified, so a cut never leaks the trailer.
+    """
+
+    def __init__(self):
+        self.text = ''
+        self.released = 0
+        self.stopped = False
+        self._plan_at = None
+        self._armed_at = None
+
+    def feed(self, chunk: str) -> str:
+        if self.stopped:
+            return ''
+        # Searching from shortly before the new text keeps this linear
+        scan_from = max(0, len(self.text) - 64)
+        self.text += chunk
+
+        if self._plan_at is None:
+            match = _TREATMENT_HEADER.search(self.text, scan_from)
+            if match is not None:
+                self._plan_at = match.end()
+                scan_from = self._plan_at
+        if self._plan_at is not None and self._armed_at is None:
+            match = _NUMBERED_STEP.search(self.text, max(scan_from, self._plan_at))
+            if match is not None:
+                self._armed_at = match.end()
+
+        if self._armed_at is None:
+            return self._release(len(self.text))
+
+        position = max(self.released, self._armed_at)
+        while True:
+            match = _PARAGRAPH_BREAK.search(self.text, position)
+            if match is None:
+                return self._release(len(self.text))
+            following = self.text[match.end():match.end() + _TRAILER_LOOKAHEAD]
+            if _TRAILER.match(following):
+                self.stopped = True
+                return self._release(match.start())
+            if len(following) < _TRAILER_LOOKAHEAD and '\n' not in following:
+                # Not enough of the paragraph yet to tell
+                return self._release(match.start())
+            position = match.end()
+
+    def flush(self) -> str:
+        """
+        Text still held back when the completion ended on its own
+        """
+        return '' if self.stopped else self._release(len(self.text))
+
+    def _release(self, end: int) -> str:
+        if end <= self.released:
+            return ''
+        text, self.released = self.text[self.released:end], end
+        return text
+
+
+class OutputLengthPolicy:
+    """
+    Adaptive num_predict per question type: the `percentile` of recent
+    generated lengths for that type plus `headroom`, clamped to
+    [minimum, maximum]. Until `min_samples` answers have been seen the
+    maximum is used. An answer cut off by the limit is recorded as needing
+    half again as many tokens, so a type that starts truncating climbs
+    back up quickly.
+    """
+
+    def __init__(self, maximum: int = 1024, minimum: int = 256, headroom: float = 1.25,
+                 percentile: float = 95.0, min_samples: int = 20, window: int = 200):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.headroom = headroom
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.window = window
+        self._samples: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+
+    def num_predict(self, question_type: str) -> int:
+        with self._lock:
+            samples = sorted(self._samples.get(question_type, ()))
+        if len(samples) < self.min_samples:
+            return self.maximum
+        value = samples[min(len(samples) - 1, int(round(self.percentile / 100.0 * (len(samples) - 1))))]
+        return max(self.minimum, min(self.maximum, int(math.ceil(value * self.headroom))))
+
+    def record(self, question_type: str, tokens: int, limit: int, truncated: bool = False):
+        if truncated:
+            tokens = max(tokens, limit) * 1.5
+        with self._lock:
+            self._samples.setdefault(question_type, deque(maxlen=self.window)).append(tokens)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            types = {question_type: len(samples) for question_type, samples in self._samples.items()}
+        return {
+            question_type: {'samples': count, 'num_predict': self.num_predict(question_type)}
+            for question_type, count in types.items()
+        }
+
+    def gauges(self) -> Dict[str, float]:
+        return {
+            f'generation_num_predict{{question_type={question_type}}}': state['num_predict']
+            for question_type, state in self.snapshot().items()
+        }
+
+
+def _seconds(nanoseconds) -> Optional[float]:
+    return None if nanoseconds is None else round(nanoseconds / 1e9, 4)
+
+
+@dataclass
+class GenerationStats:
+    """
+    One generation: tokens produced, the num_predict it ran under, why it
+    ended ('stop', 'length' or 'early_stop') and where its time went.
+
+    The timings come from Ollama's final chunk (load_duration,
+    prompt_eval_*, eval_*); first_token_seconds is measured by the client
+    from the request start. A stream closed by early stopping never gets
+    the final chunk, so its eval time is taken from the wall clock and the
+    load and prompt timings stay unknown (None).
+    """
+    question_type: str
+    num_predict: int
+    model: str = ''
+    tokens: int = 0
+    done_reason: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    load_seconds: Optional[float] = None
+    prompt_eval_seconds: Optional[float] = None
+    eval_seconds: Optional[float] = None
+    total_seconds: Optional[float] = None
+    first_token_seconds: Optional[float] = None
+    started: float = field(default_factory=time.perf_counter, repr=False)
+
+    def add_chunk(self, chunk: Dict[str, Any]):
+        if chunk.get('response'):
+            if self.first_token_seconds is None:
+                self.first_token_seconds = round(time.perf_counter() - self.started, 4)
+            # Ollama streams one token per chunk; the final count replaces this
+            self.tokens += 1
+        if chunk.get('done'):
+            self.tokens = chunk.get('eval_count', self.tokens)
+            self.done_reason = chunk.get('done_reason', self.done_reason)
+            self.prompt_tokens = chunk.get('prompt_eval_count')
+            self.load_seconds = _seconds(chunk.get('load_duration'))
+            self.prompt_eval_seconds = _seconds(chunk.get('prompt_eval_duration'))
+            self.eval_seconds = _seconds(chunk.get('eval_duration'))
+
+    def finish(self):
+        """
+        Close the wall-clock timings once the generation has ended
+        """
+        self.total_seconds = round(time.perf_counter() - self.started, 4)
+        if self.eval_seconds is None and self.first_token_seconds is not None:
+            self.eval_seconds = round(self.total_seconds - self.first_token_seconds, 4)
+
+    @property
+    def truncated(self) -> bool:
+        return self.done_reason == 'length'
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        if not self.eval_seconds or not self.tokens:
+            return None
+        return round(self.tokens / self.eval_seconds, 2)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {f.name: getattr(self, f.name) for f in fields(self) if f.name != 'started'}
+        data['tokens_per_second'] = self.tokens_per_second
+        return data
@@ -0,0 +1,188 @@
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional
+from .backends import Backend, BackendPool
+from .http_client import StreamCancelled, StreamHandle
+from .metrics import metrics
+from ..utils.logger import setup_logger
+
+logger = setup_logger('ollama_hedging')
+
+_CHUNK, _DONE, _ERROR = 'chunk', 'done', 'error'
+
+_stats_lock = threading.Lock()
+_stats = {'fired': 0, 'hedge_wins': 0}
+
+
+class HedgePolicy:
+    """
+    When to fire the duplicate request: after the `percentile` of recent
+    first-token latencies (never sooner than `min_delay`), or after
+    `default_delay` until `min_samples` latencies have been seen.
+    """
+
+    def __init__(self, percentile: float = 95.0, min_delay: float = 0.5,
+                 default_delay: float = 5.0, min_samples: int = 20):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.default_delay = default_delay
+        self.min_samples = min_samples
+
+    def delay(self) -> float:
+        hist = metrics.histogram('ollama_first_token_seconds')
+        if hist.count < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, hist.percentile(self.percentile))
+
+
+class _Attempt(threading.Thread):
+    """
+    One copy of the request, streaming into the shared queue until it
+    finishes or is cancelled because the other copy won. Cancelling closes
+    its connection straight away, even while it is still waiting for its
+    first token, and the backend is released as the thread exits.
+    """
+
+    def __init__(self, label: str, pool: BackendPool,
+                 call: Callable[[Backend, StreamHandle], Iterator[Dict[str, Any]]],
+                 affinity: Optional[Hashable], exclude, events: queue.Queue):
+        super().__init__(name=f'ollama-hedge-{label}', daemon=True)
+        self.label = label
+        self.pool = pool
+        self.call = call
+        self.affinity = affinity
+        self.exclude = exclude
+        self.events = events
+        self.handle = StreamHandle()
+        self.failed = False
+        self.backend = None
+        self.chosen = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.handle.cancelled.is_set()
+
+    def cancel(self):
+        self.handle.cancel()
+
+    def run(self):
+        try:
+            # acquire() releases the backend's in-flight slot however this ends
+            with self.pool.acquire(affinity=self.affinity, exclude=self.exclude) as backend:
+                self.backend = backend
+                self.chosen.set()
+                started = time.perf_counter()
+                first = True
+                stream = self.call(backend, self.handle)
+                try:
+                    for chunk in stream:
+                        if first:
+                            self.pool.record_first_token(backend, time.perf_counter() - started)
+                            first = False
+                        if self.cancelled:
+                            break
+                        self.events.put((self, _CHUNK, chunk))
+                except StreamCancelled:
+                    # Cut off mid-answer the copy still counts as a success;
+                    # before its first token it says nothing about the host
+                    if first:
+                        raise
+                finally:
+                    stream.close()
+            self.events.put((self, _DONE, None))
+        except Exception as e:
+            self.chosen.set()
+            self.events.put((self, _ERROR, e))
+
+
+def hedged_stream(pool: BackendPool, call: Callable[[Backend], Iterator[Dict[str, Any]]],
+                  policy: HedgePolicy, affinity: Optional[Hashable] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the chunks of whichever of two copies of a streamed request
+    produces its first token first. `call(backend, handle)` starts the
+    request on a backend; `handle` must be passed on to the HTTP client
+    so the copy can be cancelled.
+
+    The primary goes to the pool's usual pick; if it has not produced a
+    token within the policy delay (or fails before producing one) a hedge
+    is sent to a different backend. The losing copy is cancelled, which
+    closes its connection so Ollama stops generating.
+    """
+    events = queue.Queue()
+    primary = _Attempt('primary', pool, call, affinity, (), events)
+    primary.start()
+    attempts = [primary]
+    winner = None
+    delay = policy.delay()
+    hedge_deadline = time.monotonic() + delay
+
+    def launch_hedge():
+        primary.chosen.wait()
+        exclude = (primary.backend,) if primary.backend is not None else ()
+        if pool.available_count(exclude=exclude) == 0:
+            return False
+        hedge = _Attempt('hedge', pool, call, None, exclude, events)
+        hedge.start()
+        attempts.append(hedge)
+        metrics.incr('ollama_hedge_requests')
+        with _stats_lock:
+            _stats['fired'] += 1
+        logger.info(f"Hedging request to another backend ({delay:.2f}s delay, primary "
+                    f"{'failed' if primary.failed else 'has no first token yet'})")
+        return True
+
+    try:
+        while True:
+            timeout = None
+            if winner is None and len(attempts) == 1:
+                timeout = max(0.0, hedge_deadline - time.monotonic())
+            try:
+                attempt, kind, payload = events.get(timeout=timeout)
+            except queue.Empty:
+                if not launch_hedge():
+                    # Nowhere to hedge to; just wait for the primary
+                    hedge_deadline = float('inf')
+                continue
+
+            if winner is None:
+                if kind == _ERROR:
+                    attempt.failed = True
+                    if len(attempts) == 1 and launch_hedge():
+                        continue
+                    if all(a.failed for a in attempts):
+                        raise payload
+                    continue
+                winner = attempt
+                for other in attempts:
+                    if other is not winner:
+                        other.cancel()
+                if len(attempts) > 1:
+                    metrics.incr('ollama_hedge_wins', winner=winner.label)
+                    if winner is not primary:
+                        with _stats_lock:
+                            _stats['hedge_wins'] += 1
+
+            if attempt is not winner:
+                continue
+            if kind == _CHUNK:
+                yield payload
+            elif kind == _DONE:
+                return
+            else:
+                raise payload
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
+
+
+def hedge_stats() -> Dict[str, float]:
+    with _stats_lock:
+        fired, wins = _stats['fired'], _stats['hedge_wins']
+    return {
+        'ollama_hedges_fired': fired,
+        'ollama_hedge_win_rate': round(wins / fired, 4) if fired else 0.0,
+    }
+
+
+metrics.register_collector('ollama_hedging', hedge_stats)
@@ -0,0 +1,224 @@
+import json
+import socket
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class OllamaError(Exception):
+    """Raised when Ollama is unreachable, times out or returns an error"""
+
+
+class StreamCancelled(Exception):
+    """Raised by a streaming request whose StreamHandle was cancelled"""
+
+
+# The handle of the streaming request this thread is sending, if any
+_sending = threading.local()
+
+
+class StreamHandle:
+    """
+    Lets another thread abort a streaming request.
+
+    Ollama only sends the response headers with the first token, so a
+    request stalled in prompt evaluation has no Response to close yet.
+    The handle therefore holds the connection the request was sent on:
+    cancel() shuts its socket down, which fails the blocked read at once
+    and drops the connection, so Ollama stops generating. The reading
+    thread then raises StreamCancelled and closes its response.
+    """
+
+    def __init__(self):
+        self.cancelled = threading.Event()
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def attach(self, connection):
+        with self._lock:
+            self._connection = connection
+            cancelled = self.cancelled.is_set()
+        if cancelled:
+            self._shutdown(connection)
+
+    def detach(self):
+        # Under the lock, so cancel() never touches a connection that is
+        # back in the pool serving another request
+        with self._lock:
+            self._connection = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled.set()
+            if self._connection is not None:
+                self._shutdown(self._connection)
+
+    @staticmethod
+    def _shutdown(connection):
+        sock = getattr(connection, 'sock', None)
+        if sock is None:
+            return
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class _TrackedConnectionMixin:
+    """
+    Hands the connection a streaming request is sent on to its handle
+    """
+
+    def _get_conn(self, timeout=None):
+        connection = super()._get_conn(timeout)
+        handle = getattr(_sending, 'handle', None)
+        if handle is not None:
+            handle.attach(connection)
+        return connection
+
+
+class _TrackedHTTPConnectionPool(_TrackedConnectionMixin, HTTPConnectionPool):
+    pass
+
+
+class _TrackedHTTPSConnectionPool(_TrackedConnectionMixin, HTTPSConnectionPool):
+    pass
+
+
+class _CancellableAdapter(HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _TrackedHTTPConnectionPool, 'https': _TrackedHTTPSConnectionPool
+        }
+
+
+class OllamaHTTPClient:
+    """
+    Minimal first-party client for the Ollama REST API.
+
+    A single requests.Session with a sized connection pool keeps TCP
+    connections alive between calls; connect and read timeouts are explicit
+    so a stalled Ollama host fails a request instead of hanging a worker.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:11434", connect_timeout: float = 3.05,
+                 read_timeout: float = 300.0, pool_size: int = 10):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+
+        self.session = requests.Session()
+        adapter = _CancellableAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                 stream: bool = False, timeout=None) -> requests.Response:
+        try:
+            response = self.session.request(
+                method,
+                f"{self.base_url}{path}",
+                json=payload,
+                stream=stream,
+                timeout=timeout or self.timeout
+            )
+        except requests.RequestException as e:
+            raise OllamaError(f"Ollama request to {path} failed: {e}") from e
+
+        if response.status_code >= 400:
+            try:
+                detail = response.json().get('error', response.text)
+            except ValueError:
+                detail = response.text
+            response.close()
+            raise OllamaError(f"Ollama {path} returned {response.status_code}: {detail}")
+        return response
+
+    def _stream_json(self, path: str, payload: Dict[str, Any],
+                     handle: Optional[StreamHandle] = None) -> Iterator[Dict[str, Any]]:
+        response = None
+        try:
+            _sending.handle = handle
+            try:
+                response = self._request('POST', path, payload, stream=True)
+            finally:
+                _sending.handle = None
+            if handle is not None and handle.cancelled.is_set():
+                raise StreamCancelled(f"Ollama stream from {path} cancelled")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if 'error' in chunk:
+                    raise OllamaError(f"Ollama {path} stream error: {chunk['error']}")
+                yield chunk
+        except (requests.RequestException, OllamaError) as e:
+            # A cancelled request fails because we shut it down, not the host
+            if handle is not None and handle.cancelled.is_set():
+                raise StreamCancelled(f"Ollama stream from {path} cancelled") from e
+            if isinstance(e, OllamaError):
+                raise
+            raise OllamaError(f"Ollama stream from {path} failed: {e}") from e
+        finally:
+            if handle is not None:
+                handle.detach()
+            # Closing mid-stream drops the connection, which makes Ollama
+            # abort the generation instead of finishing it for nobody.
+            if response is not None:
+                response.close()
+
+    @staticmethod
+    def _payload(model: str, stream: bool, options: Optional[Dict[str, Any]], **fields) -> Dict[str, Any]:
+        payload = {'model': model, 'stream': stream}
+        if options:
+            payload['options'] = options
+        payload.update({key: value for key, value in fields.items() if value is not None})
+        return payload
+
+    def generate(self, prompt: str, model: str, system: Optional[str] = None,
+                 options: Optional[Dict[str, Any]] = None, **fields) -> Dict[str, Any]:
+        """
+        POST /api/generate without streaming. Returns the full response
+        object including Ollama's timing fields and `context`.
+        """
+        payload = self._payload(model, False, options, prompt=prompt, system=system, **fields)
+        return self._request('POST', '/api/generate', payload).json()
+
+    def generate_stream(self, prompt: str, model: str, system: Optional[str] = None,
+                        options: Optional[Dict[str, Any]] = None, handle: Optional[StreamHandle] = None,
+                        **fields) -> Iterator[Dict[str, Any]]:
+        """
+        POST /api/generate with streaming. Yields each chunk object; the
+        last one has done=True and carries the timing fields. `handle`
+        lets another thread cancel the request.
+        """
+        payload = self._payload(model, True, options, prompt=prompt, system=system, **fields)
+        return self._stream_json('/api/generate', payload, handle)
+
+    def chat(self, messages: List[Dict[str, str]], model: str,
+             options: Optional[Dict[str, Any]] = None, **fields) -> Dict[str, Any]:
+        payload = self._payload(model, False, options, messages=messages, **fields)
+        return self._request('POST', '/api/chat', payload).json()
+
+    def chat_stream(self, messages: List[Dict[str, str]], model: str,
+                    options: Optional[Dict[str, Any]] = None, **fields) -> Iterator[Dict[str, Any]]:
+        payload = self._payload(model, True, options, messages=messages, **fields)
+        return self._stream_json('/api/chat', payload)
+
+    def embeddings(self, prompt: str, model: str) -> List[float]:
+        return self._request('POST', '/api/embeddings', {'model': model, 'prompt': prompt}).json()['embedding']
+
+    def tags(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return self._request('GET', '/api/tags', timeout=timeout).json()
+
+    def ps(self, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        GET /api/ps: models currently loaded in memory
+        """
+        return self._request('GET', '/api/ps', timeout=timeout).json()
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,184 @@
+import re
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Dict, List, Optional
+from .routing import CLINICAL_QUESTION
+
+INTENT_ALLERGIES = 'allergies'
+INTENT_MEDICATIONS = 'medications'
+INTENT_BLOOD_TYPE = 'blood_type'
+INTENT_CONDITIONS = 'chronic_conditions'
+INTENT_HISTORY = 'medical_history'
+INTENT_DATE_OF_BIRTH = 'date_of_birth'
+
+# Intents in the order their answers are listed
+_INTENTS = (
+    (INTENT_BLOOD_TYPE, re.compile(r'\bblood[ -]?(?:type|group)\b', re.IGNORECASE)),
+    (INTENT_ALLERGIES, re.compile(r'\ballerg(?:y|ies)\b', re.IGNORECASE)),
+    (INTENT_MEDICATIONS, re.compile(r'\b(?:medications?|meds|medicines|prescriptions|drugs)\b', re.IGNORECASE)),
+    (INTENT_CONDITIONS, re.compile(r'\b(?:conditions?|diseases|illnesses|problem list)\b', re.IGNORECASE)),
+    (INTENT_HISTORY, re.compile(r'\b(?:history|surgeries|operations)\b', re.IGNORECASE)),
+    (INTENT_DATE_OF_BIRTH, re.compile(r'\b(?:date of birth|dob|birthday|age|how old|born)\b', re.IGNORECASE)),
+)
+
+# A field name as a whole, never a clause about it
+_FIELD = (
+    r"(?:blood[ -]?(?:type|group)|allerg(?:y|ies)(?: list)?|"
+    r"(?:current |active )?(?:medications?|meds|medicines|prescriptions|drugs)(?: list)?|"
+    r"(?:chronic |existing |known )?(?:conditions?|diseases|illnesses)|problem list|"
+    r"(?:medical |past |surgical )?history|(?:past |previous )?(?:surgeries|operations)|"
+    r"date of birth|dob|birthday|age)"
+)
+# "blood type and allergies": a list of fields, not a second question
+_FIELDS = rf"{_FIELD}(?:\s*,\s*{_FIELD}){{0,2}}(?:,?\s+and\s+{_FIELD})?"
+_OWNER = r"(?:(?:the |this )?patient'?s|my|his|her|their|the)"
+_SUBJECT = r"(?:the patient|this patient|he|she|they|i)"
+_SUFFIX = (
+    r"(?:\s+(?:on (?:record|file)|in (?:the|my|his|her|their) (?:record|chart|file)|"
+    r"(?:of|for) (?:the|this) patient|recorded|listed))?"
+)
+_END = r"\s*[?.!]?\s*"
+# The only phrasings answered from the record: a field request and nothing
+# after it. Anything else, however close, goes to the LLM.
+_FIELD_REQUESTS = tuple(re.compile(pattern, re.IGNORECASE) for pattern in (
+    # "blood type", "what are the patient's allergies", "list my current medications"
+    rf"(?:(?:what|which) (?:is|are)\s+|what's\s+|(?:list|show(?: me)?|give me|tell me|display)\s+)?"
+    rf"(?:all (?:of )?)?(?:{_OWNER}\s+)?(?:recorded |known )?{_FIELDS}{_SUFFIX}{_END}",
+    # "does the patient have any allergies", "do i take any medications"
+    rf"(?:does|do|has|have) {_SUBJECT} (?:have|take|got) (?:any )?(?:recorded |known )?{_FIELDS}{_SUFFIX}{_END}",
+    # "is she on any medications"
+    rf"(?:is|are|am) {_SUBJECT} on any (?:current )?(?:medications?|meds|medicines|drugs){_SUFFIX}{_END}",
+    # "what medications is the patient on"
+    rf"(?:what|which) (?:medications?|meds|medicines|drugs) (?:is|are|am|does|do) {_SUBJECT} "
+    rf"(?:on|taking|take){_END}",
+    # "how old is the patient", "when was she born"
+    rf"(?:how old (?:is|am) {_SUBJECT}|when was {_SUBJECT} born|when were they born){_END}",
+))
+# Facts the record does not hold
+_OUT_OF_RECORD = re.compile(r'\b(?:family|mother|father|parents?|sibling\w*|children|kids?|partner)\b', re.IGNORECASE)
+
+MAX_INTENTS = 3
+# Mentions a field but asks something else about it
+PARTIAL_CONFIDENCE = 0.3
+
+
+@dataclass
+class LookupMatch:
+    intents: List[str]
+    confidence: float
+    # Set when the match cleared the threshold
+    response: Optional[Dict[str, str]] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'intents': self.intents, 'confidence': self.confidence}
+
+
+def is_field_request(question: str) -> bool:
+    """
+    Whether the whole question is a request for record fields ("what are
+    her allergies"), with no clause asking for interpretation or advice
+    """
+    question = ' '.join((question or '').split())
+    return any(pattern.fullmatch(question) for pattern in _FIELD_REQUESTS)
+
+
+def match_intents(question: str) -> LookupMatch:
+    """
+    Record-lookup intents in a question and how sure we are that the
+    record's fields answer it (0..1). Only pure field requests score 1;
+    a question that mentions a field but asks something about it ("which
+    drugs are contraindicated") scores PARTIAL_CONFIDENCE, and anything
+    clinical scores 0.
+    """
+    question = (question or '').strip()
+    intents = [name for name, pattern in _INTENTS if pattern.search(question)]
+    if not intents or len(intents) > MAX_INTENTS or CLINICAL_QUESTION.search(question) \
+            or _OUT_OF_RECORD.search(question):
+        return LookupMatch(intents, 0.0)
+    return LookupMatch(intents, 1.0 if is_field_request(question) else PARTIAL_CONFIDENCE)
+
+
+def _text(value) -> str:
+    return (value or '').strip() if isinstance(value, str) else ''
+
+
+def _history_entries(value) -> List[str]:
+    if isinstance(value, str):
+        return [line.strip() for line in value.splitlines() if line.strip()]
+    entries = []
+    for entry in value or ():
+        if isinstance(entry, dict):
+            entry = ': '.join(str(part) for part in entry.values() if part)
+        if str(entry).strip():
+            entries.append(str(entry).strip())
+    return entries
+
+
+def _age(date_of_birth: str, today: Optional[date] = None) -> Optional[int]:
+    try:
+        born = date.fromisoformat(str(date_of_birth)[:10])
+    except ValueError:
+        return None
+    today = today or date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+def _answer(intent: str, record: Dict[str, Any]):
+    """
+    (finding, plan step) for one intent, taken verbatim from the record
+    """
+    if intent == INTENT_BLOOD_TYPE:
+        blood_type = _text(record.get('blood_type'))
+        if not blood_type:
+            return 'No blood type is recorded.', 'Type and crossmatch before any transfusion.'
+        return f'Blood type on record: {blood_type}.', 'Confirm with a crossmatch before any transfusion.'
+    if intent == INTENT_ALLERGIES:
+        allergies = _text(record.get('allergies'))
+        if not allergies or allergies.lower() in ('none', 'no', 'nkda', 'n/a'):
+            return ('No allergies are recorded.',
+                    'Confirm allergy status with the patient before prescribing.')
+        return (f'Recorded allergies: {allergies}.',
+                'Avoid the listed allergens and check every new prescription against them.')
+    if intent == INTENT_MEDICATIONS:
+        medications = _text(record.get('medications'))
+        if not medications or medications.lower() in ('none', 'no', 'n/a'):
+            return 'No current medications are recorded.', 'Confirm current medications with the patient.'
+        return (f'Current medications on record: {medications}.',
+                'Check any new prescription for interactions with the current medications.')
+    if intent == INTENT_CONDITIONS:
+        conditions = _text(record.get('chronic_conditions'))
+        if not conditions or conditions.lower() in ('none', 'no', 'n/a'):
+            return 'No chronic conditions are recorded.', 'No condition-specific follow-up is recorded.'
+        return (f'Recorded chronic conditions: {conditions}.',
+                'Continue routine follow-up for the recorded conditions.')
+    if intent == INTENT_HISTORY:
+        entries = _history_entries(record.get('medical_history'))
+        if not entries:
+            return 'No medical history entries are recorded.', 'Take a history from the patient.'
+        return ('Medical history on record:\n' + '\n'.join(f'- {entry}' for entry in entries),
+                'Review the history entries for relevance to the current presentation.')
+    date_of_birth = record.get('date_of_birth')
+    age = _age(date_of_birth) if date_of_birth else None
+    if age is None:
+        return 'No date of birth is recorded.', 'Confirm the date of birth with the patient.'
+    return f'Date of birth on record: {date_of_birth} (age {age}).', 'Use the recorded age for any age-based dosing.'
+
+
+def answer_lookup(record: Dict[str, Any], question: str, threshold: float = 0.8) -> LookupMatch:
+    """
+    Answer a record-lookup question straight from the serialized record in
+    the diagnosis / treatment_plan shape. The match's response stays None
+    when its confidence is below `threshold` and the question should go
+    to the LLM.
+    """
+    match = match_intents(question)
+    if not match.intents or match.confidence < threshold:
+        return match
+
+    findings, steps = zip(*(_answer(intent, record) for intent in match.intents))
+    match.response = {
+        'diagnosis': '\n'.join(findings) + '\n\nAnswered directly from the medical record; no clinical assessment '
+                                           'was made. Ask a clinical question for an assessment.',
+        'treatment_plan': '\n'.join(f'{number}. {step}' for number, step in enumerate(steps, 1)),
+    }
+    return match
@@ -0,0 +1,126 @@
+import json
+import random
+import threading
+import time
+from django.core.management.base import BaseCommand
+from apps.ai_service.admission import AdmissionController, AdmissionRejected, PRIORITY_EMERGENCY, PRIORITY_ROUTINE
+from .benchmark_ollama_client import _percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Simulate routine traffic saturating the generation slots while emergency consultations '
+        'arrive, and compare emergency and routine wait times under plain FIFO admission and under '
+        'priority scheduling (reserved emergency slots, queue preemption, starvation protection). '
+        'Generations are simulated with sleeps, so no Ollama is needed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10.0, help='Duration of each run')
+        parser.add_argument('--max-concurrent', type=int, default=4, help='Generation slots')
+        parser.add_argument('--max-queue', type=int, default=16, help='Wait queue size')
+        parser.add_argument('--queue-timeout', type=float, default=30.0, help='Seconds a request may wait')
+        parser.add_argument('--service-time', type=float, default=0.2,
+                            help='Mean simulated generation seconds (uniform 0.5x-1.5x)')
+        parser.add_argument('--routine-clients', type=int, default=24,
+                            help='Closed-loop routine callers (enough to keep the queue full)')
+        parser.add_argument('--emergency-rate', type=float, default=2.0, help='Emergency arrivals per second')
+        parser.add_argument('--reserved', type=int, default=1, help='Slots reserved for emergencies')
+        parser.add_argument('--starvation-timeout', type=float, default=10.0,
+                            help='Seconds after which queued routine work goes first')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def _run(self, controller, options, prioritised):
+        rng = random.Random(options['seed'])
+        rng_lock = threading.Lock()
+        samples = {PRIORITY_EMERGENCY: [], PRIORITY_ROUTINE: []}
+        rejected = {PRIORITY_EMERGENCY: {}, PRIORITY_ROUTINE: {}}
+        deadline = time.monotonic() + options['seconds']
+
+        def service_time():
+            with rng_lock:
+                return options['service_time'] * rng.uniform(0.5, 1.5)
+
+        def consult(priority):
+            started = time.monotonic()
+            try:
+                # FIFO admission has a single class
+                with controller.admit(priority=priority if prioritised else PRIORITY_ROUTINE):
+                    waited = time.monotonic() - started
+                    time.sleep(service_time())
+            except AdmissionRejected as rejection:
+                rejected[priority][rejection.reason] = rejected[priority].get(rejection.reason, 0) + 1
+                return False
+            samples[priority].append((waited, time.monotonic() - started))
+            return True
+
+        def routine_client():
+            while time.monotonic() < deadline:
+                if not consult(PRIORITY_ROUTINE):
+                    time.sleep(0.05)
+
+        threads = [threading.Thread(target=routine_client, daemon=True) for _ in range(options['routine_clients'])]
+        for thread in threads:
+            thread.start()
+        # Let the routine load fill the slots and the queue first
+        time.sleep(min(1.0, options['seconds'] / 5))
+        while time.monotonic() < deadline:
+            thread = threading.Thread(target=consult, args=(PRIORITY_EMERGENCY,), daemon=True)
+            thread.start()
+            threads.append(thread)
+            with rng_lock:
+                gap = rng.expovariate(options['emergency_rate'])
+            time.sleep(gap)
+        for thread in threads:
+            thread.join()
+
+        results = {}
+        for priority, values in samples.items():
+            waits = [wait for wait, _ in values]
+            latencies = [latency for _, latency in values]
+            results[priority] = {
+                'completed': len(values),
+                'rejected': rejected[priority],
+                'wait_p50': round(_percentile(waits, 50), 4) if waits else None,
+                'wait_p95': round(_percentile(waits, 95), 4) if waits else None,
+                'wait_p99': round(_percentile(waits, 99), 4) if waits else None,
+                'latency_p99': round(_percentile(latencies, 99), 4) if latencies else None,
+            }
+        return results
+
+    def handle(self, *args, **options):
+        common = dict(
+            max_concurrent=options['max_concurrent'], max_queue=options['max_queue'],
+            queue_timeout=options['queue_timeout']
+        )
+        results = {
+            'fifo': self._run(AdmissionController('benchmark_admission_fifo', **common), options, False),
+            'priority': self._run(AdmissionController(
+                'benchmark_admission_priority', emergency_reserved=options['reserved'],
+                starvation_timeout=options['starvation_timeout'], **common
+            ), options, True),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Admission under saturation ({options['routine_clients']} routine callers, "
+            f"{options['emergency_rate']:g} emergencies/s, {options['max_concurrent']} slots, "
+            f"{options['service_time'] * 1000:.0f}ms generations, {options['seconds']:g}s per run)"
+        ))
+
+        def ms(value):
+            return '    n/a' if value is None else f"{value * 1000:7.1f}"
+
+        for mode, classes in results.items():
+            for priority, stats in classes.items():
+                rejected = ', '.join(f"{reason} {count}" for reason, count in sorted(stats['rejected'].items()))
+                self.stdout.write(
+                    f"  {mode:<8} {priority:<9} done {stats['completed']:>4} | wait p50 {ms(stats['wait_p50'])}ms"
+                    f" | p95 {ms(stats['wait_p95'])}ms | p99 {ms(stats['wait_p99'])}ms"
+                    f" | latency p99 {ms(stats['latency_p99'])}ms"
+                    + (f" | rejected: {rejected}" if rejected else '')
+                )
@@ -0,0 +1,108 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from apps.ai_service.fake_ollama import FakeOllamaServer
+from apps.ai_service.generation_control import OutputLengthPolicy
+from apps.ai_service.ollama_client import OllamaClient
+from .benchmark_ollama_client import SAMPLE_RECORD
+from .benchmark_response_parser import CORPUS_PATH
+from .benchmark_structured_output import QUESTIONS
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure tokens and seconds saved by early stopping and adaptive num_predict: the same '
+        'consultations are generated with generation control off and on. Runs against a fake Ollama '
+        'serving the parser corpus at --eval-rate tokens/s unless --url points at a real Ollama.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Ollama base URL (default: a local fake server)')
+        parser.add_argument('--corpus', default=CORPUS_PATH, help='Completions served by the fake server')
+        parser.add_argument('--eval-rate', type=float, default=500.0, help='Fake server tokens per second')
+        parser.add_argument('--requests', type=int, default=None,
+                            help='Consultations per pass (default: one per corpus entry)')
+        parser.add_argument('--warmup', type=int, default=None,
+                            help='Unmeasured consultations first, so num_predict can adapt (default: --requests)')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def _run(self, client, total, warmup):
+        for i in range(warmup):
+            client.generate_medical_response(SAMPLE_RECORD, QUESTIONS[i % len(QUESTIONS)])
+
+        tokens, seconds, reasons = 0, 0.0, {}
+        for i in range(total):
+            start = time.perf_counter()
+            response = client.generate_medical_response(SAMPLE_RECORD, QUESTIONS[i % len(QUESTIONS)])
+            seconds += time.perf_counter() - start
+            generation = response['meta']['generation']
+            tokens += generation['tokens']
+            reason = generation['done_reason'] or 'unknown'
+            reasons[reason] = reasons.get(reason, 0) + 1
+        client.pool.stop()
+        return {
+            'requests': total,
+            'tokens': tokens,
+            'avg_tokens': round(tokens / total, 1),
+            'seconds': round(seconds, 3),
+            'avg_seconds': round(seconds / total, 4),
+            'done_reasons': reasons,
+        }
+
+    def handle(self, *args, **options):
+        server = None
+        base_url = options['url']
+        total = options['requests']
+        if not base_url:
+            with open(options['corpus'], encoding='utf-8') as corpus_file:
+                texts = [case['text'] for case in json.load(corpus_file)]
+            server = FakeOllamaServer(response=texts, eval_rate=options['eval_rate']).start()
+            base_url = server.url
+            total = total or len(texts)
+        total = total or 40
+        warmup = total if options['warmup'] is None else options['warmup']
+
+        try:
+            baseline = self._run(OllamaClient(base_url=base_url, session_cache=None), total, warmup)
+            if server is not None:
+                # Serve the second pass the same completions in the same order
+                server.httpd.request_count = 0
+            controlled_client = OllamaClient(
+                base_url=base_url, session_cache=None, early_stop=True, length_policy=OutputLengthPolicy()
+            )
+            controlled = self._run(controlled_client, total, warmup)
+            num_predict = controlled_client.length_policy.snapshot()
+        finally:
+            if server is not None:
+                server.stop()
+
+        results = {
+            'baseline': baseline,
+            'controlled': controlled,
+            'num_predict': num_predict,
+            'saved': {
+                'tokens': baseline['tokens'] - controlled['tokens'],
+                'tokens_pct': round(1 - controlled['tokens'] / baseline['tokens'], 4) if baseline['tokens'] else 0.0,
+                'seconds': round(baseline['seconds'] - controlled['seconds'], 3),
+            },
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        source = base_url if server is None else f"fake Ollama at {options['eval_rate']:.0f} tokens/s"
+        self.stdout.write(self.style.SUCCESS(f"Generation control benchmark ({total} consultations, {source})"))
+        for label in ('baseline', 'controlled'):
+            stats = results[label]
+            reasons = ', '.join(f"{reason} {count}" for reason, count in sorted(stats['done_reasons'].items()))
+            self.stdout.write(
+                f"  {label:<10} {stats['tokens']:>7} tokens | {stats['avg_tokens']:7.1f}/answer"
+                f" | {stats['seconds']:8.2f}s | ended: {reasons}"
+            )
+        for question_type, state in sorted(num_predict.items()):
+            self.stdout.write(f"  num_predict[{question_type}] = {state['num_predict']} ({state['samples']} samples)")
+        saved = results['saved']
+        self.stdout.write(
+            f"  saved {saved['tokens']} tokens ({saved['tokens_pct']:.1%}) and {saved['seconds']:.2f}s"
+        )
@@ -0,0 +1,169 @@
+import json
+import random
+import time
+from django.core.management.base import BaseCommand
+from apps.ai_service.conf import ai_setting
+from apps.ai_service.fake_ollama import FakeOllamaServer
+from apps.ai_service.ollama_client import OllamaClient
+from apps.ai_service.retrieval import HistoryRetriever
+from .benchmark_ollama_client import SAMPLE_RECORD, _percentile
+
+# Filler that makes up most of a long history
+_ROUTINE = (
+    '{year}: Annual physical examination, no acute findings. Routine bloods within normal limits.',
+    '{year}: Seasonal influenza vaccination administered, no adverse reaction.',
+    '{year}: Dental extraction of lower molar under local anaesthetic, uneventful.',
+    '{year}: Ankle sprain after a fall while jogging; RICE and physiotherapy, full recovery.',
+    '{year}: Eye examination, mild myopia, glasses prescription updated.',
+    '{year}: Lipid panel borderline; dietary advice given, recheck in twelve months.',
+    '{year}: Skin check, benign seborrhoeic keratosis on the back, no action.',
+    '{year}: Lower back strain lifting furniture; NSAIDs for five days, resolved.',
+    '{year}: Travel consultation, hepatitis A vaccine given before a trip abroad.',
+    '{year}: Upper respiratory tract infection, symptomatic treatment, resolved in a week.',
+    '{year}: Colonoscopy screening, two small benign polyps removed.',
+    '{year}: Hearing test normal for age.',
+)
+
+# One entry each question depends on, buried among the filler
+PLANTED = (
+    ('Could penicillin cause my rash?',
+     '2009: Generalised urticarial rash and lip swelling on day 3 of amoxicillin; penicillin allergy recorded.'),
+    ('What is causing my morning headaches?',
+     '2016: Recurrent morning headaches with loud snoring; sleep study suggested obstructive sleep apnoea.'),
+    ('Should my blood pressure medication be adjusted?',
+     '2012: Home blood pressure averaging 150/95 on lisinopril 10mg; dose increase discussed, patient declined.'),
+    ('Why do I feel short of breath when climbing stairs?',
+     '2013: Exertional breathlessness on stairs; echocardiogram showed mild left ventricular dysfunction.'),
+)
+
+
+def long_history(entries: int, seed: int = 7):
+    """
+    A synthetic history of `entries` dated entries with the planted ones
+    spread through its older half
+    """
+    rng = random.Random(seed)
+    history = [rng.choice(_ROUTINE).format(year=rng.randint(1985, 2024)) for _ in range(entries)]
+    for number, (_, entry) in enumerate(PLANTED):
+        history[(number + 1) * entries // (2 * len(PLANTED) + 1)] = entry
+    return history
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare full-history prompting with history retrieval (recent entries plus the top-k '
+        'relevant ones) on a long synthetic medical history: prompt tokens, prefill latency, '
+        'end-to-end latency and whether the entry each question needs reached the prompt. Runs '
+        'against a fake Ollama that charges prompt tokens at --prompt-eval-rate unless --url is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=300, help='History entries in the test record')
+        parser.add_argument('--requests', type=int, default=20, help='Consultations per mode')
+        parser.add_argument('--top-k', type=int, default=ai_setting('HISTORY_RETRIEVAL_TOP_K'))
+        parser.add_argument('--recent', type=int, default=ai_setting('HISTORY_RETRIEVAL_RECENT'))
+        parser.add_argument('--embedder', choices=('none', 'hashing'), default='none',
+                            help="Blend in local 'hashing' embeddings (needs numpy)")
+        parser.add_argument('--prompt-eval-rate', type=float, default=400.0,
+                            help='Fake server prompt tokens per second (CPU prefill is a few hundred)')
+        parser.add_argument('--url', help='Ollama base URL (default: a local fake server)')
+        parser.add_argument('--model', default=None, help='Model name (default: OLLAMA_MODEL)')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def _run(self, client, record, total):
+        prompt_tokens, estimated, prefill, latencies, found = [], [], [], [], 0
+        for i in range(total):
+            question, needed = PLANTED[i % len(PLANTED)]
+            if needed in client.build_prompt(record, question):
+                found += 1
+            started = time.perf_counter()
+            response = client.generate_medical_response(record, question)
+            latencies.append(time.perf_counter() - started)
+            meta = response['meta']
+            estimated.append(meta['prompt']['used'])
+            if meta['generation'].get('prompt_tokens') is not None:
+                prompt_tokens.append(meta['generation']['prompt_tokens'])
+            if meta['generation'].get('prompt_eval_seconds') is not None:
+                prefill.append(meta['generation']['prompt_eval_seconds'])
+
+        def stats(values, digits=4):
+            if not values:
+                return None
+            return {'p50': round(_percentile(values, 50), digits), 'p95': round(_percentile(values, 95), digits)}
+
+        return {
+            'requests': total,
+            'estimated_prompt_tokens': stats(estimated, 0),
+            'prompt_tokens': stats(prompt_tokens, 0),
+            'prefill_seconds': stats(prefill),
+            'latency_seconds': stats(latencies),
+            'needed_entry_recall': round(found / total, 3),
+        }
+
+    def handle(self, *args, **options):
+        record = {**SAMPLE_RECORD, 'medical_history': long_history(options['entries'])}
+        server = None
+        base_url = options['url']
+        if not base_url:
+            server = FakeOllamaServer(prompt_eval_rate=options['prompt_eval_rate']).start()
+            base_url = server.url
+
+        embedder = None
+        if options['embedder'] == 'hashing':
+            from apps.ai_service.embeddings import HashingEmbedder
+            embedder = HashingEmbedder(ai_setting('HISTORY_RETRIEVAL_DIM'))
+        retriever = HistoryRetriever(
+            min_entries=ai_setting('HISTORY_RETRIEVAL_MIN_ENTRIES'), top_k=options['top_k'],
+            recent=options['recent'], embedder=embedder,
+            embedding_weight=ai_setting('HISTORY_RETRIEVAL_EMBEDDING_WEIGHT')
+        )
+        model = options['model'] or ai_setting('OLLAMA_MODEL')
+        results = {}
+        try:
+            for mode, history_retriever in (('full_history', None), ('retrieval', retriever)):
+                # No prompt-prefix reuse, so every request prefills its whole prompt
+                client = OllamaClient(base_url=base_url, model=model, session_cache=None,
+                                      history_retriever=history_retriever)
+                try:
+                    results[mode] = self._run(client, record, options['requests'])
+                finally:
+                    client.pool.stop()
+        finally:
+            if server is not None:
+                server.stop()
+
+        started = time.perf_counter()
+        retriever.index('benchmark_rebuild', record['medical_history'])
+        full_build = time.perf_counter() - started
+        edited = record['medical_history'] + ['2025: Follow-up visit, blood pressure 132/84 on current regimen.']
+        started = time.perf_counter()
+        retriever.index('benchmark_rebuild', edited)
+        incremental_build = time.perf_counter() - started
+        results['index_build_seconds'] = {'full': round(full_build, 5), 'incremental': round(incremental_build, 5)}
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"History retrieval vs full history ({options['entries']} entries, {options['requests']} requests, "
+            f"top {options['top_k']} + {options['recent']} recent, embedder {options['embedder']})"
+        ))
+
+        def pair(stats, unit='', digits=0):
+            if stats is None:
+                return 'n/a'
+            return f"{stats['p50']:.{digits}f}{unit} / {stats['p95']:.{digits}f}{unit}"
+
+        for mode in ('full_history', 'retrieval'):
+            stats = results[mode]
+            self.stdout.write(
+                f"  {mode:<13} prompt tokens p50/p95 {pair(stats['prompt_tokens'])} "
+                f"(estimated {pair(stats['estimated_prompt_tokens'])}) | prefill {pair(stats['prefill_seconds'], 's', 2)}"
+                f" | latency {pair(stats['latency_seconds'], 's', 2)} | needed entry in prompt "
+                f"{stats['needed_entry_recall']:.0%}"
+            )
+        self.stdout.write(
+            f"  index build: {results['index_build_seconds']['full'] * 1000:.1f}ms from scratch, "
+            f"{results['index_build_seconds']['incremental'] * 1000:.1f}ms after adding one entry"
+        )
@@ -0,0 +1,103 @@
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.ai_service.fake_ollama import FakeOllamaServer
+from apps.ai_service.ollama_client import OllamaClient
+
+SAMPLE_RECORD = {
+    'full_name': 'Benchmark Patient',
+    'date_of_birth': '1980-01-01',
+    'blood_type': 'O+',
+    'allergies': 'Penicillin',
+    'chronic_conditions': 'Hypertension',
+    'medications': 'Lisinopril 10mg daily',
+    'medical_history': ['2018: Hypertension diagnosis', '2015: Appendectomy'],
+}
+
+IMPORT_SNIPPETS = {
+    'native': 'import apps.ai_service.http_client',
+    'langchain': 'from langchain_community.llms import Ollama',
+}
+
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the native Ollama client with the LangChain wrapper against a local fake Ollama server. '
+        'The LangChain run needs langchain-community, which is no longer a runtime dependency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Requests per client')
+        parser.add_argument('--concurrency', type=int, default=4, help='Concurrent callers')
+
+    def _import_seconds(self, snippet):
+        code = f"import time; t = time.perf_counter(); {snippet}; print(time.perf_counter() - t)"
+        result = subprocess.run(
+            [sys.executable, '-W', 'ignore', '-c', code],
+            cwd=settings.BASE_DIR, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            return None
+        return float(result.stdout.strip().splitlines()[-1])
+
+    def _run(self, label, call, total, concurrency):
+        call()  # warm the connection and any lazy imports
+        latencies = []
+
+        def timed(_):
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(timed, range(total)))
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"  {label:<10} {total / elapsed:8.1f} req/s | "
+            f"p50 {_percentile(latencies, 50) * 1000:6.2f}ms | "
+            f"p95 {_percentile(latencies, 95) * 1000:6.2f}ms | "
+            f"p99 {_percentile(latencies, 99) * 1000:6.2f}ms"
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Cold import time (fresh interpreter)'))
+        for label, snippet in IMPORT_SNIPPETS.items():
+            seconds = self._import_seconds(snippet)
+            self.stdout.write(f"  {label:<10} {'unavailable' if seconds is None else f'{seconds * 1000:.0f}ms'}")
+
+        with FakeOllamaServer() as server:
+            self.stdout.write(self.style.SUCCESS(
+                f"\nPer-request overhead against fake Ollama at {server.url} "
+                f"({options['requests']} requests, concurrency {options['concurrency']})"
+            ))
+
+            native = OllamaClient(base_url=server.url, pool_size=options['concurrency'])
+            self._run(
+                'native',
+                lambda: native.generate_medical_response(SAMPLE_RECORD, 'Could penicillin cause my rash?'),
+                options['requests'], options['concurrency']
+            )
+
+            try:
+                from langchain_community.llms import Ollama
+            except ImportError:
+                self.stdout.write(self.style.WARNING('  langchain  skipped (langchain_community not installed)'))
+                return
+
+            legacy = Ollama(base_url=server.url, model=native.model, system=native.system_prompt, **native.options)
+            prompt = native.build_prompt(SAMPLE_RECORD, 'Could penicillin cause my rash?')
+            self._run(
+                'langchain',
+                lambda: native.parse_response(legacy.invoke(prompt)),
+                options['requests'], options['concurrency']
+            )
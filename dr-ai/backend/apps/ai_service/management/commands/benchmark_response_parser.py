@@ -0,0 +1,168 @@
+import json
+import os
+import re
+import time
+from django.core.management.base import BaseCommand, CommandError
+from apps.ai_service.response_parser import OUTCOME_FALLBACK_RAW, OUTCOME_SECTIONS, parse_with_outcome
+
+CORPUS_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'corpus', 'medical_responses.json'
+)
+
+
+def legacy_parse(response):
+    """
+    The original multi-pass OllamaClient._parse_medical_response, kept
+    only as the benchmark baseline. Returns (result, outcome).
+    """
+    try:
+        response = re.sub(r'\[Your\s*(signature|name|credentials?)\]\s*', '', response, flags=re.IGNORECASE)
+        response = re.sub(r'[\n\s]+[A-Z]+\s*$', '', response)
+        normalized_response = re.sub(r'(?i)(\bdifferential\s*)?diagnosis\s*[:]?', 'DIAGNOSIS:', response)
+        normalized_response = re.sub(r'(?i)treatment\s*plan\s*[:]?', 'TREATMENT PLAN:', normalized_response)
+        sections = re.split(r'(?i)(DIAGNOSIS:|TREATMENT PLAN:)', normalized_response)
+
+        diagnosis_pos = None
+        treatment_pos = None
+        for idx, section in enumerate(sections):
+            if section.upper() == "DIAGNOSIS:":
+                diagnosis_pos = idx
+            elif section.upper() == "TREATMENT PLAN:":
+                treatment_pos = idx
+        if diagnosis_pos is None or treatment_pos is None or treatment_pos <= diagnosis_pos:
+            raise ValueError("section headers not found in order")
+
+        diagnosis_content = ''.join(sections[diagnosis_pos + 1:treatment_pos]).strip()
+        treatment_content = ''.join(sections[treatment_pos + 1:]).strip()
+        icd_match = re.search(r"ICD-11:\s*([A-Z0-9\.]+)", response, re.IGNORECASE)
+        diagnosis_content = re.sub(
+            r'Thank you for providing the patient\'s details\.?\s*', '', diagnosis_content, flags=re.IGNORECASE
+        )
+        result = {"diagnosis": diagnosis_content, "treatment_plan": treatment_content}
+        if icd_match:
+            result["icd_code"] = icd_match.group(1).strip()
+        return result, OUTCOME_SECTIONS
+
+    except Exception:
+        for pattern in (
+            r'TREATMENT PLAN:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
+            r'MANAGEMENT:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
+            r'RECOMMENDATIONS:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
+            r'PLAN:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)'
+        ):
+            treatment_match = re.search(pattern, response, re.IGNORECASE | re.DOTALL)
+            if treatment_match:
+                return {
+                    "diagnosis": response.replace(treatment_match.group(0), '').strip(),
+                    "treatment_plan": treatment_match.group(1).strip()
+                }, 'fallback_pattern'
+        return {
+            "diagnosis": response.strip(),
+            "treatment_plan": "See diagnosis section for complete clinical assessment"
+        }, 'fallback_raw'
+
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))]
+
+
+def _mismatches(case, result, outcome):
+    expected = case['expected']
+    problems = []
+    if outcome != expected['outcome']:
+        problems.append(f"outcome {outcome} != {expected['outcome']}")
+    if not result['diagnosis'].startswith(expected['diagnosis_prefix']):
+        problems.append('diagnosis')
+    if not result['treatment_plan'].startswith(expected['treatment_prefix']):
+        problems.append('treatment plan')
+    if result.get('icd_code') != expected.get('icd_code'):
+        problems.append(f"icd {result.get('icd_code')} != {expected.get('icd_code')}")
+    for needle in expected.get('must_not_contain', []):
+        if needle in result['diagnosis'] or needle in result['treatment_plan']:
+            problems.append(f"contains {needle!r}")
+    return problems
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the response parser against the original multi-pass parser on the corpus of real '
+        'medllama2 outputs and adversarial completions, and report parse success rates. Expected '
+        'results come from the original parser, except for entries whose legacy_difference says '
+        'why the output is meant to differ. Fails if the parser finds sections in, or splits, fewer '
+        'completions than the original parser.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200, help='Parses per corpus entry')
+        parser.add_argument('--corpus', default=CORPUS_PATH, help='JSON corpus of completions')
+        parser.add_argument('--verbose', action='store_true', help='List corpus entries each parser gets wrong')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        with open(options['corpus'], encoding='utf-8') as corpus_file:
+            corpus = json.load(corpus_file)
+
+        results = {}
+        for label, parse in (('legacy', legacy_parse), ('single_pass', parse_with_outcome)):
+            timings, sections, split, failures = [], 0, 0, {}
+            for case in corpus:
+                result, outcome = parse(case['text'])
+                sections += outcome == OUTCOME_SECTIONS
+                split += outcome != OUTCOME_FALLBACK_RAW
+                problems = _mismatches(case, result, outcome)
+                if problems:
+                    failures[case['name']] = problems
+
+                start = time.perf_counter()
+                for _ in range(options['iterations']):
+                    parse(case['text'])
+                timings.append((time.perf_counter() - start) / options['iterations'])
+
+            shared = [case['name'] for case in corpus if 'legacy_difference' not in case]
+            results[label] = {
+                'cases': len(corpus),
+                'sections_rate': round(sections / len(corpus), 4),
+                'split_rate': round(split / len(corpus), 4),
+                'shared_cases': len(shared),
+                'shared_expected_rate': round(1 - sum(name in failures for name in shared) / len(shared), 4),
+                'expected_rate': round(1 - len(failures) / len(corpus), 4),
+                'mean_us': round(sum(timings) / len(timings) * 1e6, 2),
+                'p50_us': round(_percentile(timings, 50) * 1e6, 2),
+                'p95_us': round(_percentile(timings, 95) * 1e6, 2),
+                'max_us': round(max(timings) * 1e6, 2),
+                'failures': failures,
+            }
+
+        regressions = [
+            f"{rate} {results['single_pass'][rate]:.1%} is below legacy {results['legacy'][rate]:.1%}"
+            for rate in ('sections_rate', 'split_rate')
+            if results['single_pass'][rate] < results['legacy'][rate]
+        ]
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+        else:
+            self._report(corpus, results, options['verbose'])
+
+        if regressions:
+            raise CommandError('Parse quality regressed: ' + '; '.join(regressions))
+
+    def _report(self, corpus, results, verbose):
+        differences = len(corpus) - results['legacy']['shared_cases']
+        self.stdout.write(self.style.SUCCESS(
+            f"Response parser benchmark ({len(corpus)} completions, {differences} documented differences from legacy)"
+        ))
+        for label, stats in results.items():
+            self.stdout.write(
+                f"  {label:<12} parse (us): mean {stats['mean_us']:.1f} | p50 {stats['p50_us']:.1f}"
+                f" | p95 {stats['p95_us']:.1f} | max {stats['max_us']:.1f}"
+            )
+            self.stdout.write(
+                f"  {'':<12} sections found {stats['sections_rate']:.1%} | split into diagnosis and plan"
+                f" {stats['split_rate']:.1%} | matches legacy on shared cases {stats['shared_expected_rate']:.1%}"
+                f" | matches all expectations {stats['expected_rate']:.1%}"
+            )
+            if verbose:
+                for name, problems in stats['failures'].items():
+                    self.stdout.write(f"    {name}: {', '.join(problems)}")
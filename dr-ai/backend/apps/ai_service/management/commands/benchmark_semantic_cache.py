@@ -0,0 +1,137 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+import numpy as np
+from apps.ai_service.embeddings import HashingEmbedder
+from apps.ai_service.semantic_cache import SemanticCache
+
+TOPICS = [
+    ('rash', 'penicillin'), ('headache', 'lisinopril'), ('nausea', 'metformin'),
+    ('dizziness', 'amlodipine'), ('cough', 'lisinopril'), ('bleeding', 'aspirin'),
+    ('muscle pain', 'atorvastatin'), ('low blood sugar', 'glimepiride'),
+    ('insomnia', 'sertraline'), ('swelling', 'amlodipine'), ('fatigue', 'methotrexate'),
+    ('heartburn', 'aspirin'), ('diarrhea', 'metformin'), ('palpitations', 'albuterol'),
+]
+
+# Cached questions, then rewordings of them that ask the same thing
+TEMPLATES = [
+    "is this {symptom} from {drug}?",
+    "could {drug} cause my {symptom}",
+]
+PARAPHRASES = [
+    "does {drug} cause {symptom}",
+    "can {drug} cause the {symptom}?",
+    "is my {symptom} from {drug}",
+]
+
+# Questions that share their vocabulary but not their intent; each must
+# miss when the other one is cached
+MUST_MISS = [
+    ("What are the side effects of lisinopril?", "What is lisinopril for?"),
+    ("Is the rash caused by penicillin?", "Is the rash a side effect of penicillin?"),
+    ("Why do I take metformin?", "Is metformin causing my nausea?"),
+    ("Is the cough related to lisinopril?", "Is the cough due to my asthma?"),
+]
+
+UNRELATED = [
+    "what diet should I follow for {symptom}",
+    "how often should I check my blood pressure",
+    "when is my next vaccination due",
+    "should I see a cardiologist about chest pain",
+    "what exercise is safe with {symptom}",
+]
+
+
+def _percentile(samples, q):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))]
+
+
+class Command(BaseCommand):
+    help = 'Benchmark semantic cache hit rate and lookup latency on synthetic consultations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entries', type=int, default=20000, help='Cached consultations per record')
+        parser.add_argument('--records', type=int, default=1, help='Number of records to populate')
+        parser.add_argument('--queries', type=int, default=2000, help='Lookups to time')
+        parser.add_argument('--dim', type=int, default=512, help='Embedding dimension')
+        parser.add_argument('--threshold', type=float, default=0.85, help='Cosine similarity threshold')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        embedder = HashingEmbedder(options['dim'])
+        cache = SemanticCache(
+            embedder,
+            threshold=options['threshold'],
+            max_entries_per_record=options['entries'],
+            max_records=options['records']
+        )
+
+        # Populate: every (topic, template) pair once per record, padded with
+        # unrelated questions up to the requested size.
+        start = time.perf_counter()
+        for record_id in range(options['records']):
+            questions = [t.format(symptom=s, drug=d) for s, d in TOPICS for t in TEMPLATES]
+            while len(questions) < options['entries']:
+                s, _ = rng.choice(TOPICS)
+                questions.append(f"{rng.choice(UNRELATED).format(symptom=s)} #{len(questions)}")
+            vectors = embedder.embed_many(questions[:options['entries']])
+            cache.warm(record_id, 'bench', vectors, range(len(vectors)))
+        build_seconds = time.perf_counter() - start
+
+        # Query: half paraphrases of cached topics (should hit), half novel
+        # questions about unseen drug/symptom pairs (should miss).
+        hits = false_hits = expected_hits = 0
+        embed_times, lookup_times = [], []
+        for _ in range(options['queries']):
+            record_id = rng.randrange(options['records'])
+            symptom, drug = rng.choice(TOPICS)
+            if rng.random() < 0.5:
+                question = rng.choice(PARAPHRASES).format(symptom=symptom, drug=drug)
+                expect_hit = True
+            else:
+                other_drug = rng.choice([d for _, d in TOPICS if d != drug])
+                question = f"is {other_drug} safe to combine with {symptom} treatment"
+                expect_hit = False
+
+            t0 = time.perf_counter()
+            vector = embedder.embed(question)
+            t1 = time.perf_counter()
+            match = cache.lookup(record_id, 'bench', vector)
+            t2 = time.perf_counter()
+
+            embed_times.append(t1 - t0)
+            lookup_times.append(t2 - t1)
+            expected_hits += expect_hit
+            if match is not None:
+                if expect_hit:
+                    hits += 1
+                else:
+                    false_hits += 1
+
+        # Colliding pairs, each side cached alone and queried with the other
+        pairs = SemanticCache(embedder, threshold=options['threshold'], max_records=2 * len(MUST_MISS))
+        colliding = []
+        for number, (first, second) in enumerate(MUST_MISS):
+            for record_id, (cached, asked) in enumerate(((first, second), (second, first)), 2 * number):
+                pairs.warm(record_id, 'bench', embedder.embed_many([cached]), [0])
+                if pairs.lookup(record_id, 'bench', embedder.embed(asked)) is not None:
+                    colliding.append(f'{asked!r} served {cached!r}')
+
+        expected_misses = options['queries'] - expected_hits
+        self.stdout.write(self.style.SUCCESS('Semantic cache benchmark'))
+        self.stdout.write(f"  records x entries     : {options['records']} x {options['entries']} (dim {options['dim']})")
+        self.stdout.write(f"  index build           : {build_seconds:.2f}s")
+        self.stdout.write(f"  paraphrase hit rate   : {hits / max(expected_hits, 1):.1%}")
+        self.stdout.write(f"  false hit rate        : {false_hits / max(expected_misses, 1):.1%}")
+        self.stdout.write(f"  colliding pairs hit   : {len(colliding)} of {2 * len(MUST_MISS)}")
+        for collision in colliding:
+            self.stdout.write(f"    {collision}")
+        for label, samples in (('embed', embed_times), ('lookup', lookup_times)):
+            self.stdout.write(
+                f"  {label:<6} latency (ms)   : p50 {_percentile(samples, 50) * 1000:.3f}"
+                f" | p95 {_percentile(samples, 95) * 1000:.3f}"
+                f" | p99 {_percentile(samples, 99) * 1000:.3f}"
+            )
+        self.stdout.write(f"  index memory          : {options['records'] * options['entries'] * options['dim'] * np.dtype(np.float32).itemsize / 1e6:.1f} MB")
@@ -0,0 +1,143 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from apps.ai_service.conf import ai_setting
+from apps.ai_service.fake_ollama import FakeOllamaServer
+from apps.ai_service.metrics import metrics
+from apps.ai_service.ollama_client import OllamaClient
+from apps.ai_service.response_parser import OUTCOME_SECTIONS, parse_with_outcome
+from apps.ai_service.structured_output import OUTPUT_JSON, OUTPUT_TEXT
+from .benchmark_ollama_client import SAMPLE_RECORD, _percentile
+from .benchmark_response_parser import CORPUS_PATH
+
+QUESTIONS = (
+    'Could penicillin cause my rash?',
+    'What is causing my morning headaches?',
+    'Should my blood pressure medication be adjusted?',
+    'Why do I feel short of breath when climbing stairs?',
+)
+
+
+def _counter(snapshot, key):
+    return snapshot['counters'].get(key, 0)
+
+
+def _tokens(snapshot, output_format):
+    hist = snapshot['histograms'].get(f'llm_eval_tokens{{format={output_format}}}')
+    return (hist['sum'], hist['count']) if hist else (0, 0)
+
+
+def _fake_responses(corpus_path):
+    """
+    Free-text completions from the parser corpus, and the same content as
+    JSON for the structured mode
+    """
+    with open(corpus_path, encoding='utf-8') as corpus_file:
+        texts = [case['text'] for case in json.load(corpus_file)]
+    as_json = []
+    for text in texts:
+        result, _ = parse_with_outcome(text)
+        as_json.append(json.dumps(result))
+    return texts, as_json
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare free-text and JSON (structured output) consultations: parse failures and re-asks, '
+        'generated tokens and latency. Runs against a fake Ollama fed with the parser corpus unless '
+        '--url points at a real Ollama.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=40, help='Consultations per output format')
+        parser.add_argument('--url', help='Ollama base URL (default: a local fake server)')
+        parser.add_argument('--model', default=None, help='Model name (default: OLLAMA_MODEL)')
+        parser.add_argument('--corpus', default=CORPUS_PATH, help='Completions served by the fake server')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def _run(self, base_url, model, output_format, total):
+        client = OllamaClient(base_url=base_url, model=model or ai_setting('OLLAMA_MODEL'),
+                              output_format=output_format, session_cache=None,
+                              structured_schema=ai_setting('STRUCTURED_OUTPUT_SCHEMA'))
+        before = metrics.snapshot()
+        latencies, errors = [], 0
+        for i in range(total):
+            start = time.perf_counter()
+            try:
+                client.generate_medical_response(SAMPLE_RECORD, QUESTIONS[i % len(QUESTIONS)])
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+        after = metrics.snapshot()
+        client.pool.stop()
+
+        if output_format == OUTPUT_TEXT:
+            parsed = _counter(after, f'response_parse{{outcome={OUTCOME_SECTIONS}}}') - \
+                _counter(before, f'response_parse{{outcome={OUTCOME_SECTIONS}}}')
+            # A consultation whose sections were not found is the one a
+            # clinician re-asks
+            retries = (total - errors) - parsed
+            fallbacks = retries
+        else:
+            retries = _counter(after, 'structured_output_reasks') - _counter(before, 'structured_output_reasks')
+            fallbacks = _counter(after, 'structured_output{outcome=fallback}') - \
+                _counter(before, 'structured_output{outcome=fallback}')
+
+        token_sum = _tokens(after, output_format)[0] - _tokens(before, output_format)[0]
+        token_sum += _counter(after, 'structured_output_reask_tokens') - \
+            _counter(before, 'structured_output_reask_tokens')
+        return {
+            'requests': total,
+            'errors': errors,
+            'retries': retries,
+            'retry_rate': round(retries / total, 4),
+            'fallback_parses': fallbacks,
+            'avg_generated_tokens': round(token_sum / total, 1),
+            'mean_seconds': round(sum(latencies) / total, 4),
+            'p50_seconds': round(_percentile(latencies, 50), 4),
+            'p95_seconds': round(_percentile(latencies, 95), 4),
+        }
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        server = None
+        base_url = options['url']
+        if not base_url:
+            texts, as_json = _fake_responses(options['corpus'])
+            server = FakeOllamaServer(response=texts, json_response=as_json).start()
+            base_url = server.url
+
+        try:
+            results = {
+                output_format: self._run(base_url, options['model'], output_format, total)
+                for output_format in (OUTPUT_TEXT, OUTPUT_JSON)
+            }
+        finally:
+            if server is not None:
+                server.stop()
+
+        text, structured = results[OUTPUT_TEXT], results[OUTPUT_JSON]
+        results['reduction'] = {
+            'retries': text['retries'] - structured['retries'],
+            'avg_generated_tokens': round(text['avg_generated_tokens'] - structured['avg_generated_tokens'], 1),
+        }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        source = base_url if server is None else 'fake Ollama serving the parser corpus'
+        self.stdout.write(self.style.SUCCESS(f"Structured output benchmark ({total} consultations each, {source})"))
+        for output_format in (OUTPUT_TEXT, OUTPUT_JSON):
+            stats = results[output_format]
+            self.stdout.write(
+                f"  {output_format:<5} retries {stats['retries']:>3} ({stats['retry_rate']:.1%})"
+                f" | fallback parses {stats['fallback_parses']:>3}"
+                f" | tokens/answer {stats['avg_generated_tokens']:7.1f}"
+                f" | p50 {stats['p50_seconds'] * 1000:7.1f}ms | p95 {stats['p95_seconds'] * 1000:7.1f}ms"
+                + (f" | errors {stats['errors']}" if stats['errors'] else '')
+            )
+        self.stdout.write(
+            f"  json vs text: {-results['reduction']['retries']:+d} retries, "
+            f"{-results['reduction']['avg_generated_tokens']:+.1f} generated tokens per answer"
+        )
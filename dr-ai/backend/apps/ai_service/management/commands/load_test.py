@@ -0,0 +1,320 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from apps.ai_service.fake_ollama import ERROR_MODES, FakeOllamaServer
+from .benchmark_ollama_client import SAMPLE_RECORD, _percentile
+from .benchmark_structured_output import QUESTIONS
+
+API_PREFIX = '/api/medical-records'
+ENDPOINTS = ('consultation', 'record', 'record_pdf', 'consultation_pdf')
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _git_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return result.stdout.strip() or None
+
+
+def _summary(samples, elapsed):
+    """
+    Throughput and latency percentiles for one endpoint's (seconds, status, source) samples
+    """
+    latencies = [seconds for seconds, _, _ in samples]
+    status_codes, sources = {}, {}
+    for _, status, source in samples:
+        key = str(status or 'connection_error')
+        status_codes[key] = status_codes.get(key, 0) + 1
+        if source:
+            sources[source] = sources.get(source, 0) + 1
+    errors = sum(1 for _, status, _ in samples if not status or status >= 400)
+    summary = {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4),
+        'status_codes': status_codes,
+        'seconds': round(elapsed, 3),
+        'throughput_rps': round(len(samples) / elapsed, 2),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies) * 1000, 2),
+            'p50': round(_percentile(latencies, 50) * 1000, 2),
+            'p95': round(_percentile(latencies, 95) * 1000, 2),
+            'p99': round(_percentile(latencies, 99) * 1000, 2),
+            'max': round(max(latencies) * 1000, 2),
+        },
+    }
+    if sources:
+        summary['sources'] = sources
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test the consultation, public record and PDF endpoints over HTTP at a given concurrency '
+        'and report throughput and p50/p95/p99 latencies. By default it starts a fake Ollama and a '
+        'runserver pointed at it, with a throwaway patient record; --server targets a running '
+        'deployment instead. Save results with --output and compare versions with --compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f"Comma-separated subset of {', '.join(ENDPOINTS)}")
+        parser.add_argument('--requests', type=int, default=100, help='Measured requests per endpoint')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--warmup', type=int, default=2, help='Unmeasured requests per endpoint first')
+        parser.add_argument('--repeat-questions', action='store_true',
+                            help='Cycle a few fixed questions, so the response cache answers most of them')
+        parser.add_argument('--server', help='Base URL of a running server (default: start a local runserver)')
+        parser.add_argument('--nfc-id', help='Existing record to use instead of creating a throwaway one')
+        parser.add_argument('--consultation-id', help='Existing consultation for the consultation_pdf endpoint')
+        parser.add_argument('--timeout', type=float, default=120.0, help='Per-request timeout in seconds')
+        # Fake Ollama behind the local server
+        parser.add_argument('--eval-rate', type=float, default=0, help='Fake Ollama tokens per second (0: instant)')
+        parser.add_argument('--prompt-eval-rate', type=float, default=0,
+                            help='Fake Ollama prompt tokens per second (0: instant)')
+        parser.add_argument('--prompt-delay', type=float, default=0, help='Fake Ollama seconds before the first token')
+        parser.add_argument('--error-rate', type=float, default=0, help='Fraction of fake Ollama generations that fail')
+        parser.add_argument('--error-mode', choices=ERROR_MODES, default='status')
+        parser.add_argument('--seed', type=int, default=0, help='Seed for fake Ollama error injection')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='Earlier results JSON to compare against')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    # Throwaway data ---------------------------------------------------------
+
+    @transaction.atomic
+    def _create_fixture(self):
+        from apps.medical_records.models import AIConsultation, MedicalRecord
+
+        suffix = uuid.uuid4().hex[:6].upper()
+        user = get_user_model().objects.create_user(
+            username=f'loadtest_{suffix.lower()}', email=f'loadtest_{suffix.lower()}@example.invalid'
+        )
+        record = MedicalRecord.objects.create(
+            user=user,
+            nfc_id=f'LT{suffix}',
+            full_name=SAMPLE_RECORD['full_name'],
+            date_of_birth=date.fromisoformat(SAMPLE_RECORD['date_of_birth']),
+            blood_type=SAMPLE_RECORD['blood_type'],
+            allergies=SAMPLE_RECORD['allergies'],
+            chronic_conditions=SAMPLE_RECORD['chronic_conditions'],
+            medications=SAMPLE_RECORD['medications'],
+            medical_history=list(SAMPLE_RECORD['medical_history']),
+        )
+        consultation = AIConsultation.objects.create(
+            medical_record=record,
+            question=QUESTIONS[0],
+            diagnosis='Load test diagnosis',
+            treatment_plan='1. Load test treatment plan'
+        )
+        return user, record.nfc_id, str(consultation.pk)
+
+    # Local server -----------------------------------------------------------
+
+    def _start_server(self, ollama_url, log_file):
+        port = _free_port()
+        env = dict(os.environ, OLLAMA_BASE_URL=ollama_url, OLLAMA_BACKENDS='',
+                   OLLAMA_WARMUP_ON_STARTUP='', PYTHONUNBUFFERED='1')
+        process = subprocess.Popen(
+            [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload'],
+            cwd=settings.BASE_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT
+        )
+        base_url = f'http://127.0.0.1:{port}'
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                log_file.seek(0)
+                raise CommandError(f"runserver exited with {process.returncode}:\n{log_file.read()[-2000:]}")
+            try:
+                requests.get(f'{base_url}/admin/login/', timeout=1)
+                return process, base_url
+            except requests.RequestException:
+                time.sleep(0.2)
+        process.terminate()
+        raise CommandError('runserver did not start within 60 seconds')
+
+    # Load -------------------------------------------------------------------
+
+    def _requests(self, base_url, nfc_id, consultation_id, run_id, repeat_questions):
+        def question(i):
+            text = QUESTIONS[i % len(QUESTIONS)]
+            # Distinct questions miss the response cache and reach the model
+            return text if repeat_questions else f"{text} (load test {run_id}, request {i})"
+
+        return {
+            'consultation': lambda session, i, timeout: session.post(
+                f'{base_url}{API_PREFIX}/consultation/{nfc_id}/', json={'question': question(i)}, timeout=timeout
+            ),
+            'record': lambda session, i, timeout: session.get(
+                f'{base_url}{API_PREFIX}/record/{nfc_id}/', timeout=timeout
+            ),
+            'record_pdf': lambda session, i, timeout: session.get(
+                f'{base_url}{API_PREFIX}/record/{nfc_id}/generate-pdf/', timeout=timeout
+            ),
+            'consultation_pdf': lambda session, i, timeout: session.get(
+                f'{base_url}{API_PREFIX}/consultation/{consultation_id}/pdf/', timeout=timeout
+            ),
+        }
+
+    def _load(self, send, total, warmup, concurrency, timeout):
+        local = threading.local()
+
+        def one(i):
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            start = time.perf_counter()
+            status, source = None, None
+            try:
+                response = send(session, i, timeout)
+                status = response.status_code
+                if response.headers.get('Content-Type', '').startswith('application/json'):
+                    source = response.json().get('source') if status < 400 else None
+            except (requests.RequestException, ValueError):
+                pass
+            return time.perf_counter() - start, status, source
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(one, range(-warmup, 0)))
+            start = time.perf_counter()
+            samples = list(executor.map(one, range(total)))
+        return _summary(samples, time.perf_counter() - start)
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+        if options['requests'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--requests and --concurrency must be at least 1')
+
+        fake, process, user, log_file = None, None, None, None
+        nfc_id, consultation_id = options['nfc_id'], options['consultation_id']
+        try:
+            if not nfc_id:
+                user, nfc_id, created_consultation_id = self._create_fixture()
+                consultation_id = consultation_id or created_consultation_id
+            if 'consultation_pdf' in endpoints and not consultation_id:
+                raise CommandError('--consultation-id is required for consultation_pdf with --nfc-id')
+
+            base_url = options['server']
+            if not base_url:
+                fake = FakeOllamaServer(
+                    eval_rate=options['eval_rate'], prompt_eval_rate=options['prompt_eval_rate'],
+                    prompt_delay=options['prompt_delay'], error_rate=options['error_rate'],
+                    error_mode=options['error_mode'], seed=options['seed']
+                ).start()
+                log_file = tempfile.TemporaryFile(mode='w+')
+                process, base_url = self._start_server(fake.url, log_file)
+            base_url = base_url.rstrip('/')
+
+            senders = self._requests(base_url, nfc_id, consultation_id, uuid.uuid4().hex[:8],
+                                     options['repeat_questions'])
+            results = {}
+            for name in endpoints:
+                results[name] = self._load(senders[name], options['requests'], options['warmup'],
+                                           options['concurrency'], options['timeout'])
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=10)
+            if log_file is not None:
+                log_file.close()
+            if fake is not None:
+                fake.stop()
+            if user is not None:
+                user.delete()
+
+        report = {
+            'revision': _git_revision(),
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'config': {
+                'server': options['server'] or 'local runserver',
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'warmup': options['warmup'],
+                'repeat_questions': options['repeat_questions'],
+                'fake_ollama': None if options['server'] else {
+                    'eval_rate': options['eval_rate'],
+                    'prompt_eval_rate': options['prompt_eval_rate'],
+                    'prompt_delay': options['prompt_delay'],
+                    'error_rate': options['error_rate'],
+                    'error_mode': options['error_mode'],
+                    'errors_injected': fake.error_count,
+                },
+            },
+            'endpoints': results,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output_file:
+                json.dump(report, output_file, indent=2)
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Load test: {options['requests']} requests per endpoint, concurrency {options['concurrency']}, "
+            f"{report['config']['server']} (revision {report['revision'] or 'unknown'})"
+        ))
+        for name, stats in results.items():
+            latency = stats['latency_ms']
+            self.stdout.write(
+                f"  {name:<17} {stats['throughput_rps']:8.1f} req/s | p50 {latency['p50']:8.1f}ms"
+                f" | p95 {latency['p95']:8.1f}ms | p99 {latency['p99']:8.1f}ms"
+                f" | errors {stats['errors']}/{stats['requests']}"
+                + (f" | {', '.join(f'{k} {v}' for k, v in sorted(stats['sources'].items()))}"
+                   if stats.get('sources') else '')
+            )
+        if baseline is not None:
+            self._compare(results, baseline)
+        if options['output']:
+            self.stdout.write(f"  results written to {options['output']}")
+
+    def _compare(self, results, baseline):
+        self.stdout.write(self.style.SUCCESS(
+            f"Compared with {baseline.get('revision') or 'baseline'} ({baseline.get('timestamp', '?')})"
+        ))
+
+        def change(now, before):
+            return f"{(now - before) / before:+7.1%}" if before else '    n/a'
+
+        for name, stats in results.items():
+            before = baseline.get('endpoints', {}).get(name)
+            if before is None:
+                self.stdout.write(f"  {name:<17} not in baseline")
+                continue
+            self.stdout.write(
+                f"  {name:<17} req/s {change(stats['throughput_rps'], before['throughput_rps'])}"
+                + ''.join(
+                    f" | {q} {change(stats['latency_ms'][q], before['latency_ms'][q])}"
+                    for q in ('p50', 'p95', 'p99')
+                )
+                + f" | errors {stats['errors'] - before['errors']:+d}"
+            )
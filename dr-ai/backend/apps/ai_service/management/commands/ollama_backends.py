@@ -0,0 +1,53 @@
+import json
+from django.core.management.base import BaseCommand
+from apps.ai_service.backends import BackendPool
+from apps.ai_service.conf import ai_setting
+from apps.ai_service.fake_ollama import FakeOllamaServer
+
+
+class Command(BaseCommand):
+    help = (
+        'Health-check the configured Ollama backends (OLLAMA_BACKENDS or OLLAMA_BASE_URL). '
+        'With --fake N, check N local fake servers instead, the last one missing the model.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fake', type=int, default=0, help='Start N fake Ollama servers and check those')
+        parser.add_argument('--json', action='store_true', help='Print the raw snapshot as JSON')
+
+    def handle(self, *args, **options):
+        model = ai_setting('OLLAMA_MODEL')
+        fakes = []
+        if options['fake']:
+            fakes = [
+                FakeOllamaServer(models=(model,) if i < options['fake'] - 1 or options['fake'] == 1 else ('other-model',)).start()
+                for i in range(options['fake'])
+            ]
+            urls = [fake.url for fake in fakes]
+        else:
+            urls = ai_setting('OLLAMA_BACKENDS') or [ai_setting('OLLAMA_BASE_URL')]
+
+        pool = BackendPool.from_urls(
+            urls, model=model,
+            connect_timeout=ai_setting('OLLAMA_CONNECT_TIMEOUT'),
+            health_interval=0,
+            health_timeout=ai_setting('OLLAMA_HEALTH_TIMEOUT')
+        )
+        try:
+            snapshot = pool.check_all()
+        finally:
+            for fake in fakes:
+                fake.stop()
+
+        if options['json']:
+            self.stdout.write(json.dumps(snapshot, indent=2))
+            return
+
+        self.stdout.write(f"Model: {model}")
+        for backend in snapshot:
+            status = self.style.SUCCESS('healthy') if backend['healthy'] else self.style.ERROR('ejected')
+            resident = {True: 'loaded', False: 'not loaded', None: 'unknown'}[backend['model_resident']]
+            line = f"  {backend['url']:<32} {status}  model {resident}"
+            if backend['last_error']:
+                line += f"  ({backend['last_error']})"
+            self.stdout.write(line)
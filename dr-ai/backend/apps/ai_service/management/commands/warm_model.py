@@ -0,0 +1,58 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+from apps.ai_service.warmup import ModelWarmer
+
+
+class Command(BaseCommand):
+    help = (
+        'Load the consultation model, and the model of every MODEL_ROUTES route, on every '
+        'configured Ollama backend with the configured keep_alive and run a one-token priming '
+        'prompt. Reports whether each model was already resident and how long loading took. '
+        'With --refresh N, keep them resident by re-sending the preloads every N seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-alive', help='Override OLLAMA_KEEP_ALIVE (e.g. 1h, -1 for forever)')
+        parser.add_argument('--no-prime', action='store_true', help='Only load the model, skip the priming prompt')
+        parser.add_argument('--refresh', type=float, default=0, help='Keep running, refreshing every N seconds')
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        from apps.medical_records.services import model_router, ollama_client
+
+        clients = model_router.clients(create=True)
+        if options['keep_alive']:
+            for client in clients:
+                client.keep_alive = options['keep_alive']
+        warmer = ModelWarmer(ollama_client, clients=lambda: clients)
+        results = warmer.warm_all(prime=not options['no_prime'])
+        self._report(ollama_client, results, options['json'])
+
+        while options['refresh'] > 0:
+            time.sleep(options['refresh'])
+            self._report(ollama_client, warmer.warm_all(prime=False), options['json'])
+
+        if any(result.error for result in results):
+            raise SystemExit(1)
+
+    def _report(self, client, results, as_json):
+        if as_json:
+            self.stdout.write(json.dumps([result.to_dict() for result in results], indent=2))
+            return
+
+        model = None
+        for result in results:
+            if result.model != model:
+                model = result.model
+                self.stdout.write(f"Model: {model} (keep_alive {client.keep_alive})")
+            if result.error:
+                self.stdout.write(f"  {result.url:<32} {self.style.ERROR('failed')}  {result.error}")
+                continue
+            resident = {True: 'already resident', False: 'was not loaded', None: 'residency unknown'}[
+                result.was_resident
+            ]
+            self.stdout.write(
+                f"  {result.url:<32} {self.style.SUCCESS('ready')}  {resident} | load {result.load_seconds:.2f}s"
+                f" | priming {result.prime_seconds:.2f}s | total {result.total_seconds:.2f}s"
+            )
@@ -0,0 +1,160 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Any, Optional
+from ..utils.logger import setup_logger
+
+logger = setup_logger('ai_metrics')
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, float('inf')
+)
+
+
+def _metric_key(name: str, labels: Dict[str, Any]) -> str:
+    if not labels:
+        return name
+    label_str = ','.join(f'{k}={labels[k]}' for k in sorted(labels))
+    return f'{name}{{{label_str}}}'
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram plus a bounded reservoir of recent samples
+    used for percentile estimates.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, reservoir_size: int = 1024):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._recent = deque(maxlen=reservoir_size)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.bucket_counts[bisect_left(self.buckets, value)] += 1
+            self.count += 1
+            self.sum += value
+            self._recent.append(value)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._recent)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            samples = sorted(self._recent)
+            count, total = self.count, self.sum
+            cumulative, buckets = 0, {}
+            for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+                cumulative += bucket_count
+                buckets['+Inf' if bound == float('inf') else str(bound)] = cumulative
+
+        def pct(q):
+            if not samples:
+                return None
+            return round(samples[min(len(samples) - 1, int(round(q / 100.0 * (len(samples) - 1))))], 6)
+
+        return {
+            'count': count,
+            'sum': round(total, 6),
+            'avg': round(total / count, 6) if count else None,
+            'p50': pct(50),
+            'p95': pct(95),
+            'p99': pct(99),
+            'buckets': buckets,
+        }
+
+
+class MetricsRegistry:
+    """
+    In-process counters, gauges and histograms for the AI service.
+    Values are per worker process and exposed as JSON by the metrics view.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+        self._histograms: Dict[str, Histogram] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        key = _metric_key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def histogram(self, name: str, buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+        key = _metric_key(name, labels)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram(buckets)
+            return hist
+
+    def average(self, name: str, **labels) -> Optional[float]:
+        """
+        Mean of a histogram's observations, None if it has none yet
+        """
+        with self._lock:
+            hist = self._histograms.get(_metric_key(name, labels))
+        if hist is None or not hist.count:
+            return None
+        return hist.sum / hist.count
+
+    def observe(self, name: str, value: float, **labels):
+        self.histogram(name, **labels).observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def register_collector(self, name: str, collector: Callable[[], Dict[str, float]]):
+        """
+        Register a callable returning gauge values computed at snapshot time
+        (e.g. queue depth read from the database).
+        """
+        with self._lock:
+            self._collectors[name] = collector
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = dict(self._histograms)
+            collectors = dict(self._collectors)
+
+        for name, collector in collectors.items():
+            try:
+                gauges.update(collector())
+            except Exception as e:
+                # The exception stays in the log; snapshots are served over HTTP
+                gauges[_metric_key('collector_error', {'collector': name})] = 1
+                logger.error(f"Metrics collector {name} failed: {str(e)}", exc_info=True)
+
+        return {
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': {key: hist.snapshot() for key, hist in histograms.items()},
+        }
+
+
+metrics = MetricsRegistry()
@@ -1,23 +1,88 @@
-import re
-from typing import Dict, Any
-from langchain_community.llms import Ollama
-from langchain.prompts import PromptTemplate
+import hashlib
+import time
+from typing import Callable, Dict, Any, Hashable, Iterator, List, Optional, Tuple
+from .backends import Backend, BackendPool
+from .generation_control import (
+    RATE_BUCKETS, STOP_SEQUENCES, TOKEN_BUCKETS, EarlyStopDetector, GenerationStats, OutputLengthPolicy,
+    classify_question
+)
+from .hedging import HedgePolicy, hedged_stream
+from .http_client import OllamaError, StreamHandle
+from .metrics import metrics
+from .prompt_builder import PromptBuilder, PromptBudget, estimate_tokens, history_entries
+from .response_parser import parse_medical_response
+from .retrieval import HistoryRetriever
+from .session_cache import SessionContextCache
+from .structured_output import (
+    CONSULTATION_SCHEMA, JSON_FOLLOW_UP_INSTRUCTIONS, JSON_OUTPUT_INSTRUCTIONS, JSON_SYSTEM_PROMPT,
+    OUTPUT_FORMATS, OUTPUT_JSON, OUTPUT_TEXT, REPAIR_MAX_CHARS, REPAIR_PROMPT,
+    StructuredOutputError, parse_structured_response
+)
 from ..utils.logger import setup_logger
 
 logger = setup_logger('ollama_client')
 
+# Everything before this marker depends only on the patient record, so it
+# forms a stable prefix that Ollama can keep evaluated between questions.
+QUESTION_MARKER = "**Consultation Query**:"
+
+PRIMING_SUFFIX = "\n\nThe consultation query follows in the next message. Reply only with: OK"
+
+FOLLOW_UP_TEMPLATE = QUESTION_MARKER + """ {question}
+
+Answer using the DIAGNOSIS: and TREATMENT PLAN: format required above."""
+
 class OllamaClient:
-    def __init__(self, base_url: str = "http://localhost:11434"):
-        self.ollama = Ollama(
-            base_url=base_url,
-            model="medllama2",
-            temperature=0.05,
-            num_ctx=4096,
-            top_k=40,
-            top_p=0.9,
-            repeat_penalty=1.2,
-            num_predict=1024,
-            system="""You are a chief medical specialist with 20+ years of experience. 
+    def __init__(self, base_url: str = "http://localhost:11434", model: str = "medllama2",
+                 connect_timeout: float = 3.05, read_timeout: float = 300.0, pool_size: int = 10,
+                 prompt_token_budget: Optional[int] = None, keep_alive: Optional[str] = "30m",
+                 session_cache: Optional[SessionContextCache] = None,
+                 backend_urls: Optional[List[str]] = None, breaker_options: Optional[Dict[str, Any]] = None,
+                 health_interval: float = 10.0, health_timeout: float = 2.0,
+                 hedge_policy: Optional[HedgePolicy] = None, output_format: str = OUTPUT_TEXT,
+                 structured_schema: bool = True, length_policy: Optional[OutputLengthPolicy] = None,
+                 early_stop: bool = False, options: Optional[Dict[str, Any]] = None,
+                 history_retriever: Optional[HistoryRetriever] = None):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{output_format}', expected one of {OUTPUT_FORMATS}")
+        self.base_url = base_url
+        self.model = model
+        # Every call is routed to one of these hosts; a single URL behaves
+        # like the old direct client plus health tracking.
+        self.pool = BackendPool.from_urls(
+            backend_urls or [base_url],
+            model=model,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
+            pool_size=pool_size,
+            breaker_options=breaker_options,
+            health_interval=health_interval,
+            health_timeout=health_timeout
+        )
+        # Duplicate slow requests to a second backend; None disables hedging
+        self.hedge_policy = hedge_policy
+        self.keep_alive = keep_alive
+        # Per-patient Ollama context for the stable prompt prefix; None disables reuse
+        self.session_cache = session_cache
+        # Recent plus question-relevant entries of long histories; None sends the whole history
+        self.history_retriever = history_retriever
+        # Adaptive num_predict per question type; None always allows options['num_predict']
+        self.length_policy = length_policy
+        if length_policy is not None:
+            metrics.register_collector('generation_length_policy', length_policy.gauges)
+        # Stop free-text answers once the treatment plan is followed by a sign-off
+        self.early_stop = early_stop
+        self.options = {
+            'temperature': 0.05,
+            'num_ctx': 4096,
+            'top_k': 40,
+            'top_p': 0.9,
+            'repeat_penalty': 1.2,
+            'num_predict': 1024,
+            # e.g. a smaller num_predict for a fast model behind the router
+            **(options or {}),
+        }
+        self.system_prompt = """You are a chief medical specialist with 20+ years of experience. 
 Provide authoritative diagnoses and evidence-based treatment plans. 
 Structure responses EXACTLY as:
 
@@ -38,11 +103,9 @@ CRITICAL FORMATTING RULES:
 8. NEVER include placeholders like [Your signature]
 9. NEVER include your name or credentials
 10. Provide ONLY clinical content"""
-        )
-        logger.info(f"Initialized enhanced medical specialist client with model: medllama2")
+        logger.info(f"Initialized enhanced medical specialist client with model: {model}")
         
-        self.prompt_template = PromptTemplate(
-            template="""**Medical Analysis Request**
+        self.prompt_template = """**Medical Analysis Request**
 Patient: {full_name} | DOB: {date_of_birth} | Blood: {blood_type}
 **Critical Alerts**: 
 - Allergies: {allergies}
@@ -52,8 +115,6 @@ Patient: {full_name} | DOB: {date_of_birth} | Blood: {blood_type}
 **Clinical History**:
 {medical_history}
 
-**Consultation Query**: {question}
-
 **Required Output Format**:
 DIAGNOSIS:
 [Your clinical assessment including: 
@@ -77,34 +138,289 @@ TREATMENT PLAN:
 - Never include section headers in middle of sentences
 - Do NOT include placeholders like [Your signature]
 - Do NOT include your name or credentials
-- Provide ONLY clinical content""",
-            input_variables=["full_name", "date_of_birth", "blood_type", "allergies", 
-                           "chronic_conditions", "medications", "medical_history", "question"]
+- Provide ONLY clinical content
+
+""" + QUESTION_MARKER + " {question}"
+        self.follow_up_template = FOLLOW_UP_TEMPLATE
+
+        # JSON mode: Ollama constrains decoding to the schema (or to any JSON
+        # object when structured_schema is off, for older Ollama versions)
+        # and the header-format rules are replaced by the JSON contract.
+        self.output_format = output_format
+        self.response_format = None
+        if output_format == OUTPUT_JSON:
+            self.response_format = CONSULTATION_SCHEMA if structured_schema else 'json'
+            self.system_prompt = JSON_SYSTEM_PROMPT
+            self.prompt_template = (
+                self.prompt_template.split("**Required Output Format**", 1)[0]
+                + JSON_OUTPUT_INSTRUCTIONS + "\n\n" + QUESTION_MARKER + " {question}"
+            )
+            self.follow_up_template = QUESTION_MARKER + " {question}\n\n" + JSON_FOLLOW_UP_INSTRUCTIONS
+
+        # Whatever the context window has left after the system prompt and
+        # the room reserved for the answer is available to the prompt.
+        if prompt_token_budget is None:
+            prompt_token_budget = (
+                self.options['num_ctx'] - self.options['num_predict'] - estimate_tokens(self.system_prompt)
+            )
+        self.prompt_builder = PromptBuilder(self.prompt_template, prompt_token_budget)
+
+    def assemble_prompt(self, medical_record: Dict[str, Any], question: str,
+                        reserved: Optional[Dict[str, int]] = None) -> Tuple[str, PromptBudget]:
+        return self.prompt_builder.build(medical_record, question, reserved)
+
+    def build_prompt(self, medical_record: Dict[str, Any], question: str) -> str:
+        """
+        The full prompt sent for a question without a session
+        """
+        return self._request_fields(medical_record, question, None)[0]
+
+    def _session_context(self, session_key: Hashable, prefix: str) -> Optional[List[int]]:
+        """
+        Return Ollama context tokens for the patient prefix, evaluating
+        (priming) it once per record version. Failures fall back to
+        sending the full prompt.
+        """
+        fingerprint = hashlib.sha1(f"{self.model}\0{prefix}".encode('utf-8')).hexdigest()
+        context = self.session_cache.get(session_key, fingerprint)
+        if context is not None:
+            return context
+
+        try:
+            with metrics.timer('prompt_session_prime_seconds'), \
+                    self.pool.acquire(affinity=session_key) as backend:
+                result = backend.client.generate(
+                    prefix + PRIMING_SUFFIX,
+                    model=self.model,
+                    system=self.system_prompt,
+                    options={**self.options, 'num_predict': 1},
+                    keep_alive=self.keep_alive
+                )
+        except OllamaError as e:
+            logger.warning(f"Prompt prefix priming failed, sending full prompt: {str(e)}")
+            return None
+
+        context = result.get('context')
+        if context:
+            self.session_cache.set(session_key, fingerprint, context)
+            logger.info(f"Primed patient prefix: {result.get('prompt_eval_count', '?')} tokens evaluated")
+        return context
+
+    def _request_fields(self, medical_record: Dict[str, Any], question: str, session_key: Optional[Hashable],
+                        conversation: Optional[str] = None) -> Tuple[str, PromptBudget, Dict[str, Any]]:
+        """
+        Build the prompt for a question and the extra /api/generate fields.
+        With a session key, only the question is sent on top of the cached
+        patient-prefix context. History entries retrieved for the question
+        and the conversation so far go after the patient prefix, right
+        before the question, so they never invalidate the cached context.
+        """
+        selection = None
+        if self.history_retriever is not None:
+            selection = self.history_retriever.select(
+                history_entries(medical_record.get('medical_history')), question, key=session_key
+            )
+        reserved = {}
+        if selection is not None:
+            # The prefix keeps only the most recent entries
+            medical_record = {**medical_record, 'medical_history': selection.recent}
+            reserved['retrieved_history'] = estimate_tokens(selection.block())
+        if conversation:
+            reserved['conversation'] = estimate_tokens(conversation)
+        context_text = '\n\n'.join(
+            block for block in (selection.block() if selection is not None else '', conversation) if block
         )
 
-    def generate_medical_response(self, medical_record: Dict[str, Any], question: str) -> Dict[str, str]:
+        prompt, budget = self.assemble_prompt(medical_record, question, reserved or None)
+        if selection is not None:
+            budget.history_total = selection.total
+            budget.history_retrieved = len(selection.relevant)
+            budget.history_dropped += selection.total - len(selection.recent) - len(selection.relevant)
+        logger.info(
+            f"Prompt budget: ~{budget.used}/{budget.budget} tokens | history "
+            f"{budget.history_verbatim} verbatim, {budget.history_compacted} compacted, "
+            f"{budget.history_retrieved} retrieved, {budget.history_dropped} dropped of {budget.history_total}"
+        )
+        fields = {'keep_alive': self.keep_alive}
+        if self.response_format is not None:
+            fields['format'] = self.response_format
+
+        # History lines never start a paragraph, so the first blank line
+        # followed by the marker is the template's own.
+        prefix, query = prompt.split("\n\n" + QUESTION_MARKER, 1)
+        if session_key is not None and self.session_cache is not None:
+            context = self._session_context(session_key, prefix)
+            if context:
+                fields['context'] = context
+                prompt = self.follow_up_template.format(question=question)
+                if context_text:
+                    prompt = context_text + "\n\n" + prompt
+                return prompt, budget, fields
+
+        if context_text:
+            prompt = prefix + "\n\n" + context_text + "\n\n" + QUESTION_MARKER + query
+        return prompt, budget, fields
+
+    def _generation_options(self, question: str) -> Tuple[Dict[str, Any], GenerationStats]:
+        """
+        Options for one answer: num_predict sized for the question type,
+        plus stop strings for the sign-off in free-text mode
+        """
+        question_type = classify_question(question)
+        num_predict = self.options['num_predict']
+        if self.length_policy is not None:
+            num_predict = min(num_predict, self.length_policy.num_predict(question_type))
+        options = {**self.options, 'num_predict': num_predict}
+        if self.early_stop and self.output_format == OUTPUT_TEXT:
+            options['stop'] = list(STOP_SEQUENCES)
+        return options, GenerationStats(question_type, num_predict, model=self.model)
+
+    def _record_generation(self, stats: GenerationStats):
+        stats.finish()
+        self._record_timings(stats)
+        metrics.histogram('llm_eval_tokens', buckets=TOKEN_BUCKETS, format=self.output_format).observe(stats.tokens)
+        metrics.histogram('generation_tokens', buckets=TOKEN_BUCKETS, question_type=stats.question_type).observe(
+            stats.tokens
+        )
+        metrics.incr('generation_done', question_type=stats.question_type, reason=stats.done_reason or 'unknown')
+        if self.length_policy is not None:
+            self.length_policy.record(stats.question_type, stats.tokens, stats.num_predict, stats.truncated)
+
+    def _record_timings(self, stats: GenerationStats):
+        """
+        Histograms that split a generation's latency into model loading,
+        prompt prefill and token generation
+        """
+        timings = {
+            'llm_load_seconds': stats.load_seconds,
+            'llm_prompt_eval_seconds': stats.prompt_eval_seconds,
+            'llm_eval_seconds': stats.eval_seconds,
+            'llm_time_to_first_token_seconds': stats.first_token_seconds,
+            'llm_generation_seconds': stats.total_seconds,
+        }
+        for name, value in timings.items():
+            if value is not None:
+                metrics.observe(name, value, model=stats.model)
+        if stats.prompt_tokens is not None:
+            metrics.histogram('llm_prompt_tokens', buckets=TOKEN_BUCKETS, model=stats.model).observe(
+                stats.prompt_tokens
+            )
+        if stats.tokens_per_second is not None:
+            metrics.histogram('llm_tokens_per_second', buckets=RATE_BUCKETS, model=stats.model).observe(
+                stats.tokens_per_second
+            )
+        if stats.load_seconds:
+            metrics.incr('llm_model_loads', model=stats.model)
+
+    def _hedging(self) -> bool:
+        return self.hedge_policy is not None and len(self.pool.backends) > 1
+
+    def _stream_chunks(self, prompt: str, fields: Dict[str, Any], session_key: Optional[Hashable],
+                       options: Dict[str, Any], stopped=lambda: False) -> Iterator[Dict[str, Any]]:
+        """
+        Stream /api/generate chunks from the pool, hedged when enabled.
+        Once `stopped()` is true the connection is closed, which makes
+        Ollama abort the generation; the request still counts as a success.
+        """
+        def call(backend: Backend, handle: Optional[StreamHandle] = None) -> Iterator[Dict[str, Any]]:
+            return backend.client.generate_stream(
+                prompt,
+                model=self.model,
+                system=self.system_prompt,
+                options=options,
+                handle=handle,
+                **fields
+            )
+
+        if self._hedging():
+            stream = hedged_stream(self.pool, call, self.hedge_policy, affinity=session_key)
+            try:
+                for chunk in stream:
+                    yield chunk
+                    if stopped():
+                        break
+            finally:
+                stream.close()
+            return
+
+        # The backend stays reserved until the stream is exhausted or closed
+        with self.pool.acquire(affinity=session_key) as backend:
+            started = time.perf_counter()
+            first = True
+            stream = call(backend)
+            try:
+                for chunk in stream:
+                    if first:
+                        self.pool.record_first_token(backend, time.perf_counter() - started)
+                        first = False
+                    yield chunk
+                    if stopped():
+                        break
+            finally:
+                stream.close()
+
+    def _stream_text(self, prompt: str, fields: Dict[str, Any], session_key: Optional[Hashable],
+                     options: Dict[str, Any], stats: GenerationStats) -> Iterator[str]:
+        """
+        Yield the completion text, cut short by early stopping in free-text
+        mode, and record the generation once it has ended
+        """
+        detector = EarlyStopDetector() if self.early_stop and self.output_format == OUTPUT_TEXT else None
+        stopped = (lambda: detector.stopped) if detector is not None else (lambda: False)
+
+        for chunk in self._stream_chunks(prompt, fields, session_key, options, stopped):
+            stats.add_chunk(chunk)
+            text = chunk.get('response', '')
+            if detector is not None:
+                text = detector.feed(text)
+                if detector.stopped:
+                    stats.done_reason = 'early_stop'
+                    metrics.incr('generation_early_stops', question_type=stats.question_type)
+            if text:
+                yield text
+        if detector is not None:
+            rest = detector.flush()
+            if rest:
+                yield rest
+        self._record_generation(stats)
+
+    def generate_medical_response(self, medical_record: Dict[str, Any], question: str,
+                                  session_key: Optional[Hashable] = None,
+                                  conversation: Optional[str] = None) -> Dict[str, str]:
         try:
             logger.info(f"Consultation for {medical_record['full_name']} | DOB: {medical_record['date_of_birth']}")
             logger.info(f"Clinical Query: '{question}'")
             logger.debug(f"Medical Context:\nAllergies: {medical_record['allergies']}\nMedications: {medical_record['medications']}")
             
-            prompt = self.prompt_template.format(
-                full_name=medical_record['full_name'],
-                date_of_birth=medical_record['date_of_birth'],
-                blood_type=medical_record['blood_type'],
-                allergies=medical_record['allergies'],
-                chronic_conditions=medical_record['chronic_conditions'],
-                medications=medical_record['medications'],
-                medical_history=medical_record['medical_history'],
-                question=question
-            )
+            prompt, budget, fields = self._request_fields(medical_record, question, session_key, conversation)
+            options, stats = self._generation_options(question)
             
             logger.debug(f"Generated clinical prompt:\n{prompt}")
             
-            response = self.ollama.invoke(prompt)
+            # Early stopping needs to see the tokens as they arrive
+            if self._hedging() or self.early_stop:
+                response = ''.join(self._stream_text(prompt, fields, session_key, options, stats))
+            else:
+                with self.pool.acquire(affinity=session_key) as backend:
+                    started = time.perf_counter()
+                    result = backend.client.generate(
+                        prompt,
+                        model=self.model,
+                        system=self.system_prompt,
+                        options=options,
+                        **fields
+                    )
+                    # Wall time minus token generation approximates time to first token
+                    first_token = time.perf_counter() - started - result.get('eval_duration', 0) / 1e9
+                    self.pool.record_first_token(backend, first_token)
+                stats.first_token_seconds = round(first_token + started - stats.started, 4)
+                stats.add_chunk(result)
+                self._record_generation(stats)
+                response = result.get('response', '')
             logger.debug(f"Raw Specialist Response:\n{response}")
             
             parsed_response = self._parse_medical_response(response)
+            parsed_response['meta'] = {'prompt': budget.to_dict(), 'generation': stats.to_dict()}
             logger.info("Successfully generated specialist-level response")
             
             return parsed_response
@@ -113,111 +429,83 @@ TREATMENT PLAN:
             logger.error(f"Consultation error: {str(e)}", exc_info=True)
             raise
 
+    def stream_medical_response(self, medical_record: Dict[str, Any], question: str,
+                                session_key: Optional[Hashable] = None,
+                                on_complete: Optional[Callable[[GenerationStats], None]] = None,
+                                conversation: Optional[str] = None) -> Iterator[str]:
+        """
+        Yield completion chunks as Ollama produces them.
+
+        The caller is responsible for joining the chunks and passing the
+        full text to parse_response() once the stream is exhausted;
+        on_complete then receives the generation's stats.
+        """
+        try:
+            logger.info(f"Streaming consultation for {medical_record['full_name']} | DOB: {medical_record['date_of_birth']}")
+            logger.info(f"Clinical Query: '{question}'")
+
+            prompt, _, fields = self._request_fields(medical_record, question, session_key, conversation)
+            options, stats = self._generation_options(question)
+            logger.debug(f"Generated clinical prompt:\n{prompt}")
+
+            yield from self._stream_text(prompt, fields, session_key, options, stats)
+            if on_complete is not None:
+                on_complete(stats)
+
+        except Exception as e:
+            logger.error(f"Streaming consultation error: {str(e)}", exc_info=True)
+            raise
+
+    def embed(self, text: str, model: str = "nomic-embed-text") -> List[float]:
+        with self.pool.acquire() as backend:
+            return backend.client.embeddings(text, model=model)
+
+    def parse_response(self, response: str) -> Dict[str, str]:
+        logger.debug(f"Raw Specialist Response:\n{response}")
+        return self._parse_medical_response(response)
+
     def _parse_medical_response(self, response: str) -> Dict[str, str]:
+        if self.output_format == OUTPUT_JSON:
+            return self._parse_structured_response(response)
+        return parse_medical_response(response)
+
+    def _parse_structured_response(self, response: str) -> Dict[str, str]:
+        """
+        Validate a JSON-mode completion. An invalid one gets a single
+        schema-constrained re-ask that only restructures the existing text;
+        if that fails too, the free-text parser salvages what it can.
+        """
         try:
-            # Clean unwanted patterns before parsing
-            response = re.sub(
-                r'\[Your\s*(signature|name|credentials?)\]\s*', 
-                '', 
-                response, 
-                flags=re.IGNORECASE
-            )
-            
-            # Remove trailing condition names like "GERD" at the end
-            response = re.sub(
-                r'[\n\s]+[A-Z]+\s*$', 
-                '', 
-                response
-            )
-            
-            # Normalize section headers
-            normalized_response = re.sub(
-                r'(?i)(\bdifferential\s*)?diagnosis\s*[:]?', 
-                'DIAGNOSIS:', 
-                response
-            )
-            normalized_response = re.sub(
-                r'(?i)treatment\s*plan\s*[:]?', 
-                'TREATMENT PLAN:', 
-                normalized_response
-            )
-            
-            # Split into sections using standardized headers
-            sections = re.split(
-                r'(?i)(DIAGNOSIS:|TREATMENT PLAN:)', 
-                normalized_response
-            )
-            
-            # Find positions of section headers
-            diagnosis_pos = None
-            treatment_pos = None
-            
-            for idx, section in enumerate(sections):
-                if section.upper() == "DIAGNOSIS:":
-                    diagnosis_pos = idx
-                elif section.upper() == "TREATMENT PLAN:":
-                    treatment_pos = idx
-            
-            # Validate section positions
-            if diagnosis_pos is None:
-                raise ValueError("DIAGNOSIS section header not found")
-            if treatment_pos is None:
-                raise ValueError("TREATMENT PLAN section header not found")
-            if treatment_pos <= diagnosis_pos:
-                raise ValueError("TREATMENT PLAN appears before DIAGNOSIS")
-            
-            # Extract diagnosis content
-            diagnosis_content = ''.join(sections[diagnosis_pos+1:treatment_pos]).strip()
-            
-            # Extract treatment content
-            treatment_content = ''.join(sections[treatment_pos+1:]).strip()
-            
-            # Extract ICD code if present
-            icd_match = re.search(r"ICD-11:\s*([A-Z0-9\.]+)", response, re.IGNORECASE)
-            icd_code = icd_match.group(1).strip() if icd_match else None
-            
-            # Additional cleaning of diagnosis content
-            diagnosis_content = re.sub(
-                r'Thank you for providing the patient\'s details\.?\s*', 
-                '', 
-                diagnosis_content, 
-                flags=re.IGNORECASE
-            )
-            
-            # Build result
-            result = {
-                "diagnosis": diagnosis_content,
-                "treatment_plan": treatment_content
-            }
-            
-            if icd_code:
-                result["icd_code"] = icd_code
-                
+            result = parse_structured_response(response)
+            metrics.incr('structured_output', outcome='valid')
             return result
-            
-        except Exception as e:
-            logger.error(f"Enhanced parsing failed: {str(e)}")
-            
-            # Fallback 1: Try to extract treatment content using different patterns
-            treatment_patterns = [
-                r'TREATMENT PLAN:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
-                r'MANAGEMENT:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
-                r'RECOMMENDATIONS:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
-                r'PLAN:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)'
-            ]
-            
-            for pattern in treatment_patterns:
-                treatment_match = re.search(pattern, response, re.IGNORECASE | re.DOTALL)
-                if treatment_match:
-                    treatment_content = treatment_match.group(1).strip()
-                    diagnosis_content = response.replace(treatment_match.group(0), '').strip()
-                    return {
-                        "diagnosis": diagnosis_content,
-                        "treatment_plan": treatment_content
-                    }
-            
-            # Fallback 2: If all else fails, return entire response as diagnosis
-            return {
-                "diagnosis": response.strip(),
-                "treatment_plan": "See diagnosis section for complete clinical assessment"
-            }
\ No newline at end of file
+        except StructuredOutputError as e:
+            error = e
+
+        logger.warning(f"Invalid structured response ({error}), re-asking once")
+        metrics.incr('structured_output_reasks')
+        try:
+            result = parse_structured_response(self._repair_structured_response(response, error))
+            metrics.incr('structured_output', outcome='repaired')
+            return result
+        except (OllamaError, StructuredOutputError) as e:
+            logger.warning(f"Structured response re-ask failed ({e}), falling back to the text parser")
+
+        metrics.incr('structured_output', outcome='fallback')
+        return parse_medical_response(response)
+
+    def _repair_structured_response(self, response: str, error: Exception) -> str:
+        # No patient context: the re-ask only has to restructure the answer
+        prompt = REPAIR_PROMPT.format(error=error, response=response[:REPAIR_MAX_CHARS])
+        with self.pool.acquire() as backend:
+            result = backend.client.generate(
+                prompt,
+                model=self.model,
+                system=self.system_prompt,
+                options={**self.options, 'temperature': 0},
+                format=self.response_format,
+                keep_alive=self.keep_alive
+            )
+        if result.get('eval_count') is not None:
+            metrics.incr('structured_output_reask_tokens', result['eval_count'])
+        return result.get('response', '')
@@ -0,0 +1,185 @@
+import math
+import re
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Tuple
+from .metrics import metrics
+
+_YEAR_RE = re.compile(r'^\s*(\d{4})\b')
+_SENTENCE_END_RE = re.compile(r'(?<=[.;!?])\s')
+
+# Fields that are always kept, in priority order
+CRITICAL_FIELDS = ('allergies', 'medications', 'chronic_conditions')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate for Llama-family tokenizers (~4 chars per token,
+    never fewer tokens than whitespace-separated words).
+    """
+    if not text:
+        return 0
+    return max(math.ceil(len(text) / 4), len(text.split()))
+
+
+def history_entries(medical_history: Any) -> List[str]:
+    """
+    Normalise medical_history (JSON list, or legacy newline text) to a list
+    """
+    if not medical_history:
+        return []
+    if isinstance(medical_history, str):
+        return [line.strip() for line in medical_history.split('\n') if line.strip()]
+    return [str(entry).strip() for entry in medical_history if str(entry).strip()]
+
+
+def newest_first(entries: List[str]) -> List[int]:
+    """
+    Indexes of history entries ordered from most to least recent; undated
+    narrative notes count as current
+    """
+    def key(index):
+        match = _YEAR_RE.match(entries[index])
+        year = int(match.group(1)) if match else 10 ** 4
+        return (-year, index)
+    return sorted(range(len(entries)), key=key)
+
+
+def compact_entry(entry: str, max_chars: int) -> str:
+    """
+    Keep the first sentence of a history entry, clipped to max_chars
+    """
+    first = _SENTENCE_END_RE.split(entry, maxsplit=1)[0]
+    if len(first) > max_chars:
+        first = first[:max_chars].rsplit(' ', 1)[0] + '…'
+    return first
+
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * 4].rsplit(' ', 1)[0] + ' …[truncated]'
+
+
+@dataclass
+class PromptBudget:
+    budget: int
+    used: int = 0
+    sections: Dict[str, int] = field(default_factory=dict)
+    history_total: int = 0
+    history_verbatim: int = 0
+    history_compacted: int = 0
+    history_dropped: int = 0
+    # Entries retrieved for the question from a long history (see retrieval.py)
+    history_retrieved: int = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class PromptBuilder:
+    """
+    Assemble the consultation prompt within a token budget.
+
+    Patient identity, allergies, medications, chronic conditions and the
+    question are always included (each critical field is capped at a
+    fraction of the budget). Medical history fills what is left. If it does
+    not fit whole, entries are ranked newest first (undated narrative notes
+    count as current); the most recent are kept verbatim up to
+    verbatim_share of the room, older ones are compacted to their first
+    sentence, and whatever still does not fit is dropped with a note
+    saying how many entries were omitted.
+    """
+
+    def __init__(self, template: str, budget_tokens: int, compact_chars: int = 120,
+                 critical_field_share: float = 0.15, verbatim_share: float = 0.6):
+        self.template = template
+        self.budget_tokens = budget_tokens
+        self.compact_chars = compact_chars
+        self.critical_field_share = critical_field_share
+        self.verbatim_share = verbatim_share
+
+    def _fit_history(self, entries: List[str], available: int, budget: PromptBudget) -> str:
+        budget.history_total = len(entries)
+        chosen: Dict[int, str] = {}
+        costs = [estimate_tokens(entry) + 1 for entry in entries]
+
+        if sum(costs) <= available:
+            chosen = dict(enumerate(entries))
+            budget.history_verbatim = len(entries)
+        else:
+            # Recent entries verbatim up to a share of the room, so older
+            # entries can still be represented in compact form after them.
+            verbatim_limit = int(available * self.verbatim_share)
+            remaining = available
+            compacting = False
+
+            for index in newest_first(entries):
+                entry = entries[index]
+                if not compacting and available - remaining + costs[index] <= verbatim_limit:
+                    chosen[index] = entry
+                    budget.history_verbatim += 1
+                    remaining -= costs[index]
+                    continue
+
+                compacting = True
+                compacted = compact_entry(entry, self.compact_chars)
+                cost = estimate_tokens(compacted) + 1
+                if cost <= remaining:
+                    chosen[index] = compacted
+                    if compacted == entry:
+                        budget.history_verbatim += 1
+                    else:
+                        budget.history_compacted += 1
+                    remaining -= cost
+                else:
+                    budget.history_dropped += 1
+
+        lines = [f"- {chosen[index]}" for index in sorted(chosen)]
+        if budget.history_dropped:
+            lines.append(f"- ({budget.history_dropped} older entries omitted)")
+        return '\n'.join(lines) if lines else 'No significant medical history recorded.'
+
+    def build(self, medical_record: Dict[str, Any], question: str,
+              reserved: Optional[Dict[str, int]] = None) -> Tuple[str, PromptBudget]:
+        """
+        `reserved` maps sections the caller adds to the prompt (e.g. the
+        conversation so far) to their tokens, which history cannot use
+        """
+        budget = PromptBudget(budget=self.budget_tokens)
+        field_cap = max(32, int(self.budget_tokens * self.critical_field_share))
+
+        values = {
+            'full_name': medical_record.get('full_name'),
+            'date_of_birth': medical_record.get('date_of_birth'),
+            'blood_type': medical_record.get('blood_type'),
+            'question': _truncate_to_tokens(question, field_cap),
+        }
+        for name in CRITICAL_FIELDS:
+            values[name] = _truncate_to_tokens(str(medical_record.get(name)), field_cap)
+
+        skeleton = self.template.format(medical_history='', **values)
+        fixed_tokens = estimate_tokens(skeleton)
+        budget.sections['fixed'] = estimate_tokens(self.template.format(
+            medical_history='', **{key: '' for key in values}
+        ))
+        for name in CRITICAL_FIELDS + ('question',):
+            budget.sections[name] = estimate_tokens(values[name])
+        budget.sections.update(reserved or {})
+        fixed_tokens += sum((reserved or {}).values())
+
+        history = self._fit_history(
+            history_entries(medical_record.get('medical_history')),
+            max(0, self.budget_tokens - fixed_tokens),
+            budget
+        )
+        budget.sections['medical_history'] = estimate_tokens(history)
+
+        prompt = self.template.format(medical_history=history, **values)
+        budget.used = estimate_tokens(prompt) + sum((reserved or {}).values())
+
+        metrics.observe('prompt_tokens_estimated', budget.used,
+                        buckets=(256, 512, 1024, 1536, 2048, 3072, 4096, float('inf')))
+        metrics.incr('prompt_history_entries', budget.history_verbatim, outcome='verbatim')
+        metrics.incr('prompt_history_entries', budget.history_compacted, outcome='compacted')
+        metrics.incr('prompt_history_entries', budget.history_dropped, outcome='dropped')
+        return prompt, budget
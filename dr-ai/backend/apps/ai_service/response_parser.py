@@ -0,0 +1,485 @@
+import re
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+from .metrics import metrics
+from ..utils.logger import setup_logger
+
+logger = setup_logger('response_parser')
+
+OUTCOME_SECTIONS = 'sections'
+OUTCOME_FALLBACK_PATTERN = 'fallback_pattern'
+OUTCOME_FALLBACK_RAW = 'fallback_raw'
+
+FALLBACK_TREATMENT = "See diagnosis section for complete clinical assessment"
+
+# The parser walks the completion once, stopping only where one of these
+# keywords occurs (found with str.find on the lower-cased text, which is far
+# cheaper than running a case-insensitive regex at every position) and
+# classifying each occurrence with an anchored, precompiled pattern.
+_KEYWORDS = ('[your', 'thank', 'differential', 'diagnosis', 'treatment', 'icd-11')
+
+_PLACEHOLDER = re.compile(r'\[your\s*(?:signature|name|credentials?)\]\s*')
+_THANKS = re.compile(r"thank\s+you\s+for\s+providing\s+the\s+patient's\s+details\.?\s*")
+# "Differential diagnosis" is content of the diagnosis section, never a header
+_DIFFERENTIAL = re.compile(r'differential\s+diagnosis')
+# A section name is a header when followed by a colon anywhere, or when it
+# stands alone on its line after optional markdown bullets, numbering or
+# emphasis. Words inside sentences ("suggests a diagnosis of") are not.
+_SECTION_NAME = re.compile(r'(?:diagnosis|treatment[ \t]*plan)\b([ \t*_]*:[ \t*_]*)?')
+_LINE_PREFIX = re.compile(r'[ \t]*(?:[#>*_-]+[ \t]*|\d+[.)][ \t]*)*')
+_LINE_PREFIX_CHARS = frozenset(' \t#>*_-.)0123456789')
+_LINE_SUFFIX = re.compile(r'[ \t*_]*(?=\r?\n|\Z)')
+
+_ICD_CODE = re.compile(r"ICD-11:\s*([A-Z0-9\.]+)", re.IGNORECASE)
+
+# Trailing stray all-caps word such as a lone "GERD" after the plan
+_TRAILING_CAPS = re.compile(r'[A-Z]+')
+
+# The original parser's header split, kept as a fallback until the scanner
+# splits at least as many completions: it accepts "diagnosis" and "treatment
+# plan" anywhere, including inside sentences, and uses the last of each
+_LEGACY_PLACEHOLDER = re.compile(r'\[Your\s*(?:signature|name|credentials?)\]\s*', re.IGNORECASE)
+_LEGACY_TRAILING_CAPS = re.compile(r'[\n\s]+[A-Z]+\s*$')
+_LEGACY_DIAGNOSIS = re.compile(r'(?:\bdifferential\s*)?diagnosis\s*:?', re.IGNORECASE)
+_LEGACY_TREATMENT = re.compile(r'treatment\s*plan\s*:?', re.IGNORECASE)
+_LEGACY_HEADERS = re.compile(r'(DIAGNOSIS:|TREATMENT PLAN:)')
+_LEGACY_THANKS = re.compile(r"Thank you for providing the patient's details\.?\s*", re.IGNORECASE)
+
+# Kept from the original parser for completions without usable headers
+_FALLBACK_TREATMENT_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE | re.DOTALL) for pattern in (
+        r'TREATMENT PLAN:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
+        r'MANAGEMENT:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
+        r'RECOMMENDATIONS:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
+        r'PLAN:\s*(.*?)(?=\n\s*[A-Z]+:|\Z)',
+    )
+]
+
+# Header variants the original parser accepted that are not headers by the
+# rules above. medllama2 sometimes labels each paragraph after the fact,
+# "... (DIAGNOSIS)\n... (TREATMENT PLAN)"; and it sometimes opens the plan
+# with a sentence instead of a header, "... The treatment plan should ...".
+_TRAILING_LABELS = re.compile(
+    r'(.*?)\(\s*diagnosis\s*\)[ \t]*\r?\n(.*?)\(\s*treatment\s*plan\s*\)', re.IGNORECASE | re.DOTALL
+)
+_PLAN_SENTENCE = re.compile(
+    r'(?:^|(?<=[.!?:])\s+)((?:the\s+)?treatment\s+plan\s+\w)', re.IGNORECASE | re.MULTILINE
+)
+
+_PREAMBLE, _DIAGNOSIS, _TREATMENT = range(3)
+
+
+def _strip_trailing_caps(text: str) -> str:
+    stripped = text.rstrip()
+    cut = max(stripped.rfind(' '), stripped.rfind('\n'), stripped.rfind('\t'), stripped.rfind('\r'))
+    if cut < 0 or not _TRAILING_CAPS.fullmatch(stripped, cut + 1):
+        return text
+    return stripped[:cut].rstrip()
+
+
+def _lowered(text: str) -> str:
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered
+    # A few characters lower-case to two code points; keep offsets aligned
+    return ''.join(c if len(c.lower()) != 1 else c.lower() for c in text)
+
+
+def _keyword_positions(lowered: str):
+    positions = []
+    for keyword in _KEYWORDS:
+        index = lowered.find(keyword)
+        while index != -1:
+            positions.append(index)
+            index = lowered.find(keyword, index + 1)
+    positions.sort()
+    return positions
+
+
+def _section_header(text: str, lowered: str, index: int, starts_line: bool = True) -> Tuple[str, int, int]:
+    """
+    Classify a section name at `index`: returns ('diagnosis' | 'treatment'
+    | '', header start, header end). An empty kind means plain content.
+    `starts_line` says whether offset 0 of `text` is the start of a line.
+    """
+    if index and lowered[index - 1].isalnum():
+        return '', index, index
+    name = _SECTION_NAME.match(lowered, index)
+    if name is None:
+        return '', index, index
+    kind = 'treatment' if lowered[index] == 't' else 'diagnosis'
+
+    # Walk back over bullet/numbering characters only, so the check stays
+    # cheap on long lines full of the word
+    line_start = index
+    while line_start and text[line_start - 1] in _LINE_PREFIX_CHARS:
+        line_start -= 1
+    at_line_start = (text[line_start - 1] == '\n' if line_start else starts_line) and \
+        _LINE_PREFIX.match(text, line_start).end() == index
+
+    if name.group(1) is not None:
+        return kind, line_start if at_line_start else index, name.end()
+    if at_line_start:
+        suffix = _LINE_SUFFIX.match(text, name.end())
+        if suffix is not None:
+            return kind, line_start, suffix.end()
+    return '', index, index
+
+
+def _legacy_sections(response: str) -> Optional[Dict[str, str]]:
+    """
+    Diagnosis and treatment plan as the original parser split them, or
+    None where it found no headers in order
+    """
+    response = _LEGACY_TRAILING_CAPS.sub('', _LEGACY_PLACEHOLDER.sub('', response))
+    normalized = _LEGACY_TREATMENT.sub('TREATMENT PLAN:', _LEGACY_DIAGNOSIS.sub('DIAGNOSIS:', response))
+    sections = _LEGACY_HEADERS.split(normalized)
+    diagnosis_at = treatment_at = None
+    for index in range(1, len(sections), 2):
+        if sections[index] == 'DIAGNOSIS:':
+            diagnosis_at = index
+        else:
+            treatment_at = index
+    if diagnosis_at is None or treatment_at is None or treatment_at <= diagnosis_at:
+        return None
+
+    result = {
+        'diagnosis': _LEGACY_THANKS.sub('', ''.join(sections[diagnosis_at + 1:treatment_at]).strip()),
+        'treatment_plan': ''.join(sections[treatment_at + 1:]).strip(),
+    }
+    icd_match = _ICD_CODE.search(response)
+    if icd_match:
+        result['icd_code'] = icd_match.group(1).strip()
+    return result
+
+
+def parse_with_outcome(response: str) -> Tuple[Dict[str, str], str]:
+    """
+    Split a completion into diagnosis, treatment plan and ICD-11 code.
+
+    Returns the parsed fields and which path produced them. 'sections':
+    the first DIAGNOSIS header and the first TREATMENT PLAN header after
+    it, trailing section labels, a sentence opening the treatment plan or,
+    failing those, the original parser's header split. Then the legacy
+    treatment-pattern fallback, then the whole completion as the diagnosis.
+    Every completion the original parser split is split here too.
+    """
+    text = _strip_trailing_caps(response)
+    lowered = _lowered(text)
+
+    state = _PREAMBLE
+    cleaned, diagnosis, treatment = [], [], []
+    current = None
+    icd_code = None
+    position = 0
+
+    def emit(chunk: str, keep_in_section: bool = True):
+        cleaned.append(chunk)
+        if current is not None and keep_in_section:
+            current.append(chunk)
+
+    for index in _keyword_positions(lowered):
+        if index < position:
+            # Inside a token already consumed
+            continue
+        char = lowered[index]
+
+        if char == '[':
+            match = _PLACEHOLDER.match(lowered, index)
+            if match is not None:
+                emit(text[position:index])
+                position = match.end()
+        elif char == 't' and lowered.startswith('thank', index):
+            match = _THANKS.match(lowered, index)
+            if match is not None:
+                emit(text[position:index])
+                emit(text[index:match.end()], keep_in_section=state != _DIAGNOSIS)
+                position = match.end()
+        elif char == 'i':
+            if icd_code is None:
+                match = _ICD_CODE.match(text, index)
+                if match is not None:
+                    icd_code = match.group(1).strip()
+        elif char == 'd' and lowered.startswith('differential', index):
+            match = _DIFFERENTIAL.match(lowered, index)
+            if match is not None:
+                emit(text[position:match.end()])
+                position = match.end()
+        else:
+            kind, start, end = _section_header(text, lowered, index)
+            if not kind:
+                continue
+            start = max(start, position)
+            if state == _PREAMBLE and kind == 'diagnosis':
+                emit(text[position:start])
+                emit(text[start:end], keep_in_section=False)
+                state, current = _DIAGNOSIS, diagnosis
+            elif state == _DIAGNOSIS and kind == 'treatment':
+                emit(text[position:start])
+                emit(text[start:end], keep_in_section=False)
+                state, current = _TREATMENT, treatment
+            else:
+                emit(text[position:end])
+            position = end
+
+    emit(text[position:])
+    cleaned = ''.join(cleaned)
+
+    def sections(diagnosis_text: str, treatment_text: str) -> Tuple[Dict[str, str], str]:
+        result = {'diagnosis': diagnosis_text.strip(), 'treatment_plan': treatment_text.strip()}
+        if icd_code:
+            result['icd_code'] = icd_code
+        return result, OUTCOME_SECTIONS
+
+    if state == _TREATMENT:
+        return sections(''.join(diagnosis), ''.join(treatment))
+
+    if state == _PREAMBLE:
+        labels = _TRAILING_LABELS.match(cleaned)
+        if labels is not None:
+            return sections(labels.group(1), labels.group(2))
+
+    # A sentence opening the treatment plan, inside the diagnosis section
+    # or a completion without headers
+    body = (''.join(diagnosis) if state == _DIAGNOSIS else cleaned).strip()
+    plan = _PLAN_SENTENCE.search(body)
+    if plan is not None and plan.start(1):
+        return sections(body[:plan.start(1)], body[plan.start(1):])
+
+    legacy = _legacy_sections(response)
+    if legacy is not None:
+        return legacy, OUTCOME_SECTIONS
+
+    for pattern in _FALLBACK_TREATMENT_PATTERNS:
+        treatment_match = pattern.search(cleaned)
+        if treatment_match:
+            return {
+                'diagnosis': cleaned.replace(treatment_match.group(0), '').strip(),
+                'treatment_plan': treatment_match.group(1).strip(),
+            }, OUTCOME_FALLBACK_PATTERN
+
+    # Whole completion as the diagnosis, minus a leading DIAGNOSIS header
+    return {
+        'diagnosis': body,
+        'treatment_plan': FALLBACK_TREATMENT,
+    }, OUTCOME_FALLBACK_RAW
+
+
+def parse_medical_response(response: str) -> Dict[str, str]:
+    result, outcome = parse_with_outcome(response)
+    metrics.incr('response_parse', outcome=outcome)
+    if outcome != OUTCOME_SECTIONS:
+        logger.warning(f"Section headers not found in order, used {outcome}")
+    return result
+
+
+SECTION_PREAMBLE = 'preamble'
+SECTION_DIAGNOSIS = 'diagnosis'
+SECTION_TREATMENT = 'treatment_plan'
+
+EVENT_START = 'section_start'
+EVENT_DELTA = 'section_delta'
+EVENT_END = 'section_end'
+EVENT_ICD_CODE = 'icd_code'
+
+_SECTION_NAMES = {_PREAMBLE: SECTION_PREAMBLE, _DIAGNOSIS: SECTION_DIAGNOSIS, _TREATMENT: SECTION_TREATMENT}
+
+
+@dataclass
+class SectionEvent:
+    type: str
+    section: str
+    text: str = ''
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {'section': self.section}
+        if self.type == EVENT_ICD_CODE:
+            data['icd_code'] = self.text
+        elif self.text:
+            data['text'] = self.text
+        return data
+
+
+class StreamingSectionParser:
+    """
+    Incremental counterpart of parse_with_outcome for streamed completions.
+
+    feed() takes chunks as Ollama produces them and returns typed events:
+    section_start / section_delta / section_end for the preamble, diagnosis
+    and treatment plan, plus icd_code once a code is seen. Headers split
+    across chunks are recognised because only a short tail (at most
+    `hold` characters that could still turn out to be a header,
+    placeholder or trailing stray word) is held back; everything else is
+    released immediately, so memory stays bounded regardless of the
+    completion length. Header rules and cleanup match the batch parser,
+    but events are provisional: the stored consultation is still parsed
+    from the full text, including its fallbacks.
+    """
+
+    def __init__(self, hold: int = 64):
+        self.hold = hold
+        self._buffer = ''
+        self._starts_line = True
+        self._state = _PREAMBLE
+        self._open = False
+        self._pending_ws = ''
+        self._icd_seen = False
+        self._events: List[SectionEvent] = []
+
+    def feed(self, chunk: str) -> List[SectionEvent]:
+        self._buffer += chunk
+        self._drain(final=False)
+        return self._take()
+
+    def close(self) -> List[SectionEvent]:
+        self._buffer = _strip_trailing_caps(self._buffer)
+        self._drain(final=True)
+        self._end_section()
+        return self._take()
+
+    @property
+    def section(self) -> str:
+        return _SECTION_NAMES[self._state]
+
+    def _take(self) -> List[SectionEvent]:
+        events, self._events = self._events, []
+        return events
+
+    def _end_section(self):
+        if self._open:
+            self._events.append(SectionEvent(EVENT_END, self.section))
+            self._open = False
+        self._pending_ws = ''
+
+    def _content(self, text: str):
+        """
+        Section text, with leading whitespace dropped and trailing
+        whitespace deferred until more content follows (sections are
+        stripped, as in the batch parser)
+        """
+        if not self._open:
+            text = text.lstrip()
+            if not text:
+                return
+            self._events.append(SectionEvent(EVENT_START, self.section))
+            self._open = True
+        body = text.rstrip()
+        if body:
+            self._events.append(SectionEvent(EVENT_DELTA, self.section, self._pending_ws + body))
+            self._pending_ws = text[len(body):]
+        else:
+            self._pending_ws += text
+        if len(self._pending_ws) > self.hold:
+            self._pending_ws = self._pending_ws[-self.hold:]
+
+    def _consume(self, length: int, text: Optional[str] = None):
+        """
+        Drop `length` characters from the buffer, passing `text` (default:
+        those characters) to the current section
+        """
+        consumed = self._buffer[:length]
+        if text is None:
+            text = consumed
+        if text:
+            self._content(text)
+        if consumed:
+            self._starts_line = consumed.endswith('\n')
+        self._buffer = self._buffer[length:]
+
+    def _switch(self, state: int):
+        self._end_section()
+        self._state = state
+
+    def _tail_hold(self, buffer: str, lowered: str) -> int:
+        """
+        Index from which the end of a keyword-free buffer must be kept:
+        a possible keyword prefix, a line that so far holds only bullet
+        characters, or a trailing all-caps word the batch parser would drop.
+        """
+        hold_from = len(buffer)
+        for keyword in _KEYWORDS:
+            for size in range(min(len(keyword) - 1, len(buffer)), 0, -1):
+                if lowered.endswith(keyword[:size]):
+                    hold_from = min(hold_from, len(buffer) - size)
+                    break
+
+        # Bullet characters opening the line belong to a header that may follow
+        line_start = hold_from
+        while line_start and buffer[line_start - 1] in _LINE_PREFIX_CHARS:
+            line_start -= 1
+        if (buffer[line_start - 1] == '\n' if line_start else self._starts_line):
+            hold_from = line_start
+
+        cut = max(buffer.rfind(' '), buffer.rfind('\n'), buffer.rfind('\t'), buffer.rfind('\r'))
+        if cut >= 0 and cut + 1 < len(buffer) and _TRAILING_CAPS.fullmatch(buffer, cut + 1):
+            while cut and buffer[cut - 1].isspace():
+                cut -= 1
+            hold_from = min(hold_from, cut)
+
+        return max(hold_from, len(buffer) - self.hold)
+
+    def _drain(self, final: bool):
+        while self._buffer:
+            buffer = self._buffer
+            lowered = _lowered(buffer)
+            found = [i for i in (lowered.find(keyword) for keyword in _KEYWORDS) if i != -1]
+
+            if not found:
+                self._consume(len(buffer) if final else self._tail_hold(buffer, lowered))
+                return
+
+            index = min(found)
+            # Release the text before the keyword, except a run of bullet
+            # characters at the start of its line, which belongs to a header
+            line_start = index
+            while line_start and buffer[line_start - 1] in _LINE_PREFIX_CHARS:
+                line_start -= 1
+            boundary = line_start if (buffer[line_start - 1] == '\n' if line_start else self._starts_line) else index
+            if boundary:
+                self._consume(boundary)
+                continue
+
+            if not final and len(buffer) - index < self.hold:
+                return
+            self._token(buffer, lowered, index)
+
+    def _token(self, buffer: str, lowered: str, index: int):
+        """
+        Classify the keyword at `index` (the buffer starts at its line
+        prefix or at the keyword itself) and consume it
+        """
+        char = lowered[index]
+        if char == '[':
+            match = _PLACEHOLDER.match(lowered, index)
+            if match is not None:
+                self._consume(match.end(), text='')
+                return
+        elif char == 't' and lowered.startswith('thank', index):
+            match = _THANKS.match(lowered, index)
+            if match is not None:
+                self._consume(match.end(), text='' if self._state == _DIAGNOSIS else None)
+                return
+        elif char == 'i':
+            match = _ICD_CODE.match(buffer, index)
+            if match is not None and not self._icd_seen:
+                self._icd_seen = True
+                self._events.append(SectionEvent(EVENT_ICD_CODE, self.section, match.group(1).strip()))
+        elif char == 'd' and lowered.startswith('differential', index):
+            match = _DIFFERENTIAL.match(lowered, index)
+            if match is not None:
+                self._consume(match.end())
+                return
+        else:
+            kind, start, end = _section_header(buffer, lowered, index, self._starts_line)
+            if kind:
+                if self._state == _PREAMBLE and kind == 'diagnosis':
+                    self._consume(end, text='')
+                    self._switch(_DIAGNOSIS)
+                elif self._state == _DIAGNOSIS and kind == 'treatment':
+                    self._consume(end, text='')
+                    self._switch(_TREATMENT)
+                else:
+                    self._consume(end)
+                return
+        # Not a token: the keyword's first character is plain content
+        self._consume(index + 1)
@@ -0,0 +1,218 @@
+import hashlib
+import math
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Optional, Tuple
+from .embeddings import content_words
+from .metrics import metrics
+from .prompt_builder import newest_first
+
+RELEVANT_HISTORY_HEADER = "**History Entries Relevant To This Query**"
+
+
+def _entry_key(entry: str) -> str:
+    return hashlib.sha1(entry.encode('utf-8')).hexdigest()
+
+
+def history_fingerprint(entries: List[str]) -> str:
+    return hashlib.sha1('\0'.join(entries).encode('utf-8')).hexdigest()
+
+
+class HistoryIndex:
+    """
+    Okapi BM25 over one record's history entries, optionally blended with
+    cosine similarity against a matrix of unit embedding vectors (one row
+    per entry)
+    """
+
+    def __init__(self, entries: List[str], terms: List[Counter], vectors=None, k1: float = 1.2, b: float = 0.75):
+        self.entries = entries
+        self.vectors = vectors
+        self.k1 = k1
+        self.b = b
+        self.lengths = [sum(counts.values()) for counts in terms]
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        for index, counts in enumerate(terms):
+            for term, frequency in counts.items():
+                self.postings.setdefault(term, []).append((index, frequency))
+        total = len(entries)
+        self.idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def __len__(self):
+        return len(self.entries)
+
+    def bm25(self, terms: List[str]) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for term in set(terms):
+            for index, frequency in self.postings.get(term, ()):
+                length_norm = 1 - self.b + self.b * self.lengths[index] / (self.average_length or 1.0)
+                scores[index] = scores.get(index, 0.0) + self.idf[term] * frequency * (self.k1 + 1) / (
+                    frequency + self.k1 * length_norm
+                )
+        return scores
+
+    def search(self, question: str, k: int, query_vector=None,
+               embedding_weight: float = 0.5) -> List[Tuple[int, float]]:
+        """
+        (entry index, score) of the k best entries for a question. With
+        vectors, the BM25 scores (scaled to 0..1) and cosine similarities
+        are mixed by embedding_weight.
+        """
+        scores = self.bm25(content_words(question))
+        if self.vectors is not None and query_vector is not None and len(self):
+            top = max(scores.values(), default=0.0)
+            similarities = self.vectors @ query_vector
+            blended = {}
+            for index in range(len(self)):
+                lexical = scores.get(index, 0.0) / top if top else 0.0
+                score = (1 - embedding_weight) * lexical + embedding_weight * max(0.0, float(similarities[index]))
+                if score > 0:
+                    blended[index] = score
+            scores = blended
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+
+@dataclass
+class HistorySelection:
+    """
+    The history entries a prompt carries: the most recent ones, which form
+    part of the stable patient prefix, and those retrieved for the question
+    """
+    recent: List[str]
+    relevant: List[str]
+    total: int
+
+    def block(self) -> str:
+        """
+        Retrieved entries as a prompt section that goes after the patient
+        prefix, so retrieval never invalidates the cached prompt context
+        """
+        older = self.total - len(self.recent)
+        if not self.relevant:
+            return f"{RELEVANT_HISTORY_HEADER}: none of the {older} older entries on file matches this query."
+        lines = '\n'.join(f"- {entry}" for entry in self.relevant)
+        return (
+            f"{RELEVANT_HISTORY_HEADER} ({len(self.relevant)} of {self.total} entries on file; "
+            f"the {len(self.recent)} most recent are listed above):\n{lines}"
+        )
+
+
+@dataclass
+class _RecordIndex:
+    fingerprint: str
+    index: HistoryIndex
+    # entry hash -> (term counts, embedding or None)
+    analysis: Dict[str, tuple]
+
+
+class HistoryRetriever:
+    """
+    Keeps long medical histories out of the prompt.
+
+    Histories of up to `min_entries` entries are left alone. Longer ones
+    are cut to the `recent` newest entries, which stay in the patient
+    prefix, plus the `top_k` entries that best match the question (BM25,
+    blended with local embeddings when an embedder is given).
+
+    Indexes are kept per record in a bounded LRU, tagged with a fingerprint
+    of the history. When the history changes the index is rebuilt
+    incrementally: only added or edited entries are analysed and embedded,
+    and the BM25 statistics and vector matrix are reassembled from the
+    cached per-entry analysis.
+    """
+
+    def __init__(self, min_entries: int = 24, top_k: int = 8, recent: int = 5, embedder=None,
+                 embedding_weight: float = 0.5, max_records: int = 1024):
+        self.min_entries = min_entries
+        self.top_k = top_k
+        self.recent = recent
+        self.embedder = embedder
+        self.embedding_weight = embedding_weight
+        self.max_records = max_records
+        self._records: 'OrderedDict[Hashable, _RecordIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def index(self, key: Hashable, entries: List[str]) -> HistoryIndex:
+        fingerprint = history_fingerprint(entries)
+        with self._lock:
+            cached = self._records.get(key)
+            if cached is not None and cached.fingerprint == fingerprint:
+                self._records.move_to_end(key)
+                metrics.incr('history_index_requests', result='hit')
+                return cached.index
+            previous = cached.analysis if cached is not None else {}
+        metrics.incr('history_index_requests', result='build')
+
+        # Analysis runs outside the lock: embedding can be slow
+        started = time.perf_counter()
+        analysis, analysed = {}, 0
+        for entry in entries:
+            entry_key = _entry_key(entry)
+            if entry_key in analysis:
+                continue
+            if entry_key in previous:
+                analysis[entry_key] = previous[entry_key]
+                continue
+            vector = self.embedder.embed(entry) if self.embedder is not None else None
+            analysis[entry_key] = (Counter(content_words(entry)), vector)
+            analysed += 1
+
+        rows = [analysis[_entry_key(entry)] for entry in entries]
+        vectors = None
+        if self.embedder is not None and rows:
+            import numpy as np
+            vectors = np.vstack([vector for _, vector in rows])
+        index = HistoryIndex(entries, [terms for terms, _ in rows], vectors)
+
+        with self._lock:
+            self._records[key] = _RecordIndex(fingerprint, index, analysis)
+            self._records.move_to_end(key)
+            while len(self._records) > self.max_records:
+                self._records.popitem(last=False)
+        metrics.incr('history_index_entries_analysed', analysed)
+        metrics.observe('history_index_build_seconds', time.perf_counter() - started)
+        return index
+
+    def refresh(self, key: Hashable, entries: List[str]):
+        """
+        Bring a record's index up to date after it was saved
+        """
+        if len(entries) > self.min_entries:
+            self.index(key, entries)
+        else:
+            self.invalidate_record(key)
+
+    def invalidate_record(self, key: Hashable):
+        with self._lock:
+            self._records.pop(key, None)
+
+    def select(self, entries: List[str], question: str,
+               key: Optional[Hashable] = None) -> Optional[HistorySelection]:
+        """
+        Recent and relevant entries for a question, or None when the
+        history is short enough to go into the prompt whole
+        """
+        if len(entries) <= self.min_entries:
+            return None
+        index = self.index(key if key is not None else history_fingerprint(entries), entries)
+
+        started = time.perf_counter()
+        recent = set(newest_first(entries)[:self.recent])
+        query_vector = self.embedder.embed(question) if index.vectors is not None else None
+        # Ask for extra hits: recent entries are in the prompt already
+        ranked = index.search(question, self.top_k + len(recent), query_vector, self.embedding_weight)
+        hits = [position for position, _ in ranked if position not in recent][:self.top_k]
+        metrics.observe('history_retrieval_seconds', time.perf_counter() - started)
+        metrics.histogram('history_retrieved_entries', buckets=(0, 1, 2, 4, 8, 16, float('inf'))).observe(len(hits))
+
+        return HistorySelection(
+            recent=[entries[position] for position in sorted(recent)],
+            relevant=[entries[position] for position in sorted(hits)],
+            total=len(entries)
+        )
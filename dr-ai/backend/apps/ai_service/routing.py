@@ -0,0 +1,142 @@
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, List, Optional
+from .metrics import metrics
+from .ollama_client import OllamaClient
+from ..utils.logger import setup_logger
+
+logger = setup_logger('model_router')
+
+ROUTE_DEFAULT = 'default'
+ROUTE_SIMPLE = 'simple'
+ROUTE_COMPLEX = 'complex'
+
+# Questions about what the record says rather than what it means
+_RECORD_FACT = re.compile(
+    r'\b(?:blood[ -]?(?:type|group)|allerg\w*|medications?|meds|medicines?|prescriptions?|'
+    r'(?:chronic )?conditions?|date of birth|dob|birthday|age|(?:medical )?history)\b',
+    re.IGNORECASE
+)
+LOOKUP_QUESTION = re.compile(
+    r"^\s*(?:what(?:'s| is| are| were)?|which|list|show|tell me|when (?:was|were|did)|do i have|"
+    r"am i|how many|how old|give me)\b",
+    re.IGNORECASE
+)
+# Anything asking for reasoning, advice or interpretation needs the medical model
+CLINICAL_QUESTION = re.compile(
+    r'\b(?:why|cause[sd]?|causing|should|could|would|can i|safe\w*|risk\w*|interact\w*|side[ -]effects?|'
+    r'dos(?:e|age|ing)|symptoms?|pain|ache\w*|fever|rash|swell\w*|bleed\w*|worse|better|treat\w*|'
+    r'manage\w*|differential|explain|mean|normal|serious|pregnan\w*|emergency|diagnos\w*|likely|'
+    r'contraindicat\w*|avoid\w*|adjust\w*|need(?:s|ed)?|due|next|recommend\w*)\b',
+    re.IGNORECASE
+)
+SIMPLE_MAX_WORDS = 14
+
+
+def classify_complexity(question: str) -> str:
+    """
+    'simple' for short look-ups of facts already in the record ("what is
+    my blood type", "list my meds"), 'complex' for everything else
+    """
+    question = question or ''
+    if (len(question.split()) <= SIMPLE_MAX_WORDS and LOOKUP_QUESTION.search(question)
+            and _RECORD_FACT.search(question) and not CLINICAL_QUESTION.search(question)):
+        return ROUTE_SIMPLE
+    return ROUTE_COMPLEX
+
+
+@dataclass
+class Route:
+    name: str
+    client: OllamaClient
+
+    @property
+    def model(self) -> str:
+        return self.client.model
+
+
+class ModelRouter:
+    """
+    Sends each consultation to the model its complexity calls for.
+
+    `routes` maps a complexity class to {'model', 'num_predict'}; a missing
+    class, or a model of None, uses the default client (OLLAMA_MODEL).
+    Clients for other models are built on first use by `client_factory`
+    and keep their own connection pool and prompt-prefix cache, since
+    Ollama contexts are model specific. A routed generation that fails is
+    retried once on the default client.
+    """
+
+    def __init__(self, default_client: OllamaClient, routes: Optional[Dict[str, Dict[str, Any]]] = None,
+                 client_factory: Optional[Callable[..., OllamaClient]] = None,
+                 classifier: Callable[[str], str] = classify_complexity, enabled: bool = True):
+        self.default_client = default_client
+        self.routes = routes or {}
+        self.client_factory = client_factory
+        self.classifier = classifier
+        self.enabled = enabled and client_factory is not None
+        self._clients: Dict[str, OllamaClient] = {}
+        self._lock = threading.Lock()
+
+    def _client_for(self, name: str) -> OllamaClient:
+        config = self.routes.get(name) or {}
+        model = config.get('model')
+        if not model or (model == self.default_client.model and not config.get('num_predict')):
+            return self.default_client
+        with self._lock:
+            client = self._clients.get(name)
+            if client is None:
+                options = {'num_predict': config['num_predict']} if config.get('num_predict') else None
+                client = self._clients[name] = self.client_factory(model=model, options=options)
+                logger.info(f"Route '{name}' uses model {model}")
+            return client
+
+    def route(self, question: str) -> Route:
+        if not self.enabled:
+            return Route(ROUTE_DEFAULT, self.default_client)
+        name = self.classifier(question)
+        return Route(name, self._client_for(name))
+
+    def clients(self, create: bool = False) -> List[OllamaClient]:
+        """
+        The default client and every routed client built so far; with
+        `create`, the clients of all configured routes are built first
+        (the warmer needs them before their first consultation)
+        """
+        if create and self.enabled:
+            for name in self.routes:
+                self._client_for(name)
+        with self._lock:
+            return [self.default_client, *self._clients.values()]
+
+    def record(self, route: Route, seconds: float, outcome: str = 'ok'):
+        metrics.incr('model_route_requests', route=route.name, model=route.model, outcome=outcome)
+        if outcome == 'ok':
+            metrics.observe('model_route_seconds', seconds, route=route.name)
+
+    def generate_medical_response(self, medical_record: Dict[str, Any], question: str,
+                                  session_key: Optional[Hashable] = None,
+                                  conversation: Optional[str] = None) -> Dict[str, Any]:
+        route = self.route(question)
+        started = time.perf_counter()
+        try:
+            response = route.client.generate_medical_response(
+                medical_record, question, session_key=session_key, conversation=conversation
+            )
+        except Exception as e:
+            self.record(route, time.perf_counter() - started, outcome='error')
+            if route.client is self.default_client:
+                raise
+            logger.warning(f"Route '{route.name}' ({route.model}) failed, using {self.default_client.model}: {str(e)}")
+            metrics.incr('model_route_fallbacks', route=route.name)
+            route = Route(route.name, self.default_client)
+            started = time.perf_counter()
+            response = route.client.generate_medical_response(
+                medical_record, question, session_key=session_key, conversation=conversation
+            )
+
+        self.record(route, time.perf_counter() - started)
+        response.setdefault('meta', {})['route'] = {'name': route.name, 'model': route.model}
+        return response
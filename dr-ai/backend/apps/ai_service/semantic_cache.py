@@ -0,0 +1,131 @@
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+import numpy as np
+from .metrics import metrics
+
+
+class VectorIndex:
+    """
+    Append-only matrix of unit vectors with brute-force cosine search.
+    Capacity grows geometrically up to max_entries, after which the oldest
+    rows are overwritten ring-buffer style.
+    """
+
+    def __init__(self, max_entries: int = 1024, initial_capacity: int = 16):
+        self.max_entries = max_entries
+        self._initial_capacity = min(initial_capacity, max_entries)
+        self._vectors = None
+        self._ids = []
+        self._next = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def add(self, vector: np.ndarray, item_id):
+        if self._vectors is None:
+            self._vectors = np.zeros((self._initial_capacity, vector.shape[0]), dtype=np.float32)
+
+        size = len(self._ids)
+        if size < self.max_entries:
+            if size == self._vectors.shape[0]:
+                grown = np.zeros((min(size * 2, self.max_entries), self._vectors.shape[1]), dtype=np.float32)
+                grown[:size] = self._vectors
+                self._vectors = grown
+            self._vectors[size] = vector
+            self._ids.append(item_id)
+        else:
+            self._vectors[self._next] = vector
+            self._ids[self._next] = item_id
+            self._next = (self._next + 1) % self.max_entries
+
+    def search(self, vector: np.ndarray) -> Optional[Tuple[object, float]]:
+        size = len(self._ids)
+        if not size or vector.shape[0] != self._vectors.shape[1]:
+            return None
+        scores = self._vectors[:size] @ vector
+        best = int(np.argmax(scores))
+        return self._ids[best], float(scores[best])
+
+
+class SemanticCache:
+    """
+    Per-MedicalRecord nearest-neighbour cache of consultation questions.
+
+    Each record gets its own VectorIndex tagged with the record fingerprint;
+    a fingerprint change (record edited) discards the index. Records are
+    kept in LRU order and bounded by max_records.
+    """
+
+    def __init__(self, embedder, threshold: float, max_entries_per_record: int = 1024,
+                 max_records: int = 1024):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries_per_record = max_entries_per_record
+        self.max_records = max_records
+        self._indexes: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, question: str) -> np.ndarray:
+        with metrics.timer('semantic_cache_embed_seconds'):
+            return self.embedder.embed(question)
+
+    def has_index(self, record_id: Hashable, fingerprint: str) -> bool:
+        with self._lock:
+            entry = self._indexes.get(record_id)
+            return entry is not None and entry[0] == fingerprint
+
+    def lookup(self, record_id: Hashable, fingerprint: str, vector: np.ndarray) -> Optional[Tuple[object, float]]:
+        """
+        Return (item_id, similarity) of the closest cached question when it
+        clears the threshold, otherwise None.
+        """
+        with metrics.timer('semantic_cache_lookup_seconds'):
+            with self._lock:
+                entry = self._indexes.get(record_id)
+                if entry is None or entry[0] != fingerprint:
+                    match = None
+                else:
+                    self._indexes.move_to_end(record_id)
+                    match = entry[1].search(vector)
+
+        if match is None or match[1] < self.threshold:
+            metrics.incr('semantic_cache_requests', result='miss')
+            return None
+
+        metrics.incr('semantic_cache_requests', result='hit')
+        metrics.observe('semantic_cache_hit_similarity', match[1], buckets=(0.8, 0.85, 0.9, 0.95, 0.98, 1.0, float('inf')))
+        return match
+
+    def add(self, record_id: Hashable, fingerprint: str, vector: np.ndarray, item_id):
+        with self._lock:
+            entry = self._indexes.get(record_id)
+            if entry is None or entry[0] != fingerprint:
+                entry = (fingerprint, VectorIndex(self.max_entries_per_record))
+                self._indexes[record_id] = entry
+            self._indexes.move_to_end(record_id)
+            entry[1].add(vector, item_id)
+
+            while len(self._indexes) > self.max_records:
+                self._indexes.popitem(last=False)
+
+    def warm(self, record_id: Hashable, fingerprint: str, vectors: np.ndarray, item_ids):
+        """
+        (Re)build a record's index from previously stored consultations
+        """
+        index = VectorIndex(self.max_entries_per_record)
+        for vector, item_id in zip(vectors, item_ids):
+            index.add(vector, item_id)
+        with self._lock:
+            self._indexes[record_id] = (fingerprint, index)
+            self._indexes.move_to_end(record_id)
+            while len(self._indexes) > self.max_records:
+                self._indexes.popitem(last=False)
+
+    def invalidate_record(self, record_id: Hashable):
+        with self._lock:
+            self._indexes.pop(record_id, None)
+
+    def size(self) -> int:
+        with self._lock:
+            return sum(len(index) for _, index in self._indexes.values())
@@ -0,0 +1,53 @@
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Hashable, List, Optional
+from .metrics import metrics
+
+
+class SessionContextCache:
+    """
+    Bounded LRU of Ollama `context` token arrays, one per patient.
+
+    Each entry is tagged with a fingerprint of the prompt prefix it was
+    evaluated from; a different fingerprint (record edited, prompt
+    template changed) is treated as a miss and the entry is replaced.
+    Token ids are stored as array('i') to keep long contexts compact.
+    """
+
+    def __init__(self, max_sessions: int = 256, ttl: float = 1800):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions: 'OrderedDict[Hashable, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_key: Hashable, fingerprint: str) -> Optional[List[int]]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.get(session_key)
+            if entry is None or entry[0] != fingerprint or entry[1] < now:
+                if entry is not None:
+                    del self._sessions[session_key]
+                metrics.incr('prompt_session_cache_requests', result='miss')
+                return None
+            self._sessions.move_to_end(session_key)
+            context = entry[2]
+
+        metrics.incr('prompt_session_cache_requests', result='hit')
+        return context.tolist()
+
+    def set(self, session_key: Hashable, fingerprint: str, context: List[int]):
+        with self._lock:
+            self._sessions[session_key] = (fingerprint, time.monotonic() + self.ttl, array('i', context))
+            self._sessions.move_to_end(session_key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                metrics.incr('prompt_session_cache_evictions')
+
+    def invalidate_record(self, session_key: Hashable):
+        with self._lock:
+            self._sessions.pop(session_key, None)
+
+    def __len__(self):
+        return len(self._sessions)
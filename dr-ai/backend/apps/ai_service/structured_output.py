@@ -0,0 +1,98 @@
+import json
+import re
+from typing import Any, Dict
+
+OUTPUT_TEXT = 'text'
+OUTPUT_JSON = 'json'
+OUTPUT_FORMATS = (OUTPUT_TEXT, OUTPUT_JSON)
+
+# Passed to Ollama as `format`; versions without structured outputs only
+# understand the plain string 'json' (see STRUCTURED_OUTPUT_SCHEMA).
+CONSULTATION_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'diagnosis': {'type': 'string'},
+        'treatment_plan': {'type': 'string'},
+        'icd_code': {'type': ['string', 'null']},
+    },
+    'required': ['diagnosis', 'treatment_plan'],
+}
+
+_ICD_CODE = re.compile(r'[A-Z0-9][A-Z0-9.]*', re.IGNORECASE)
+
+JSON_SYSTEM_PROMPT = """You are a chief medical specialist with 20+ years of experience.
+Provide authoritative diagnoses and evidence-based treatment plans.
+Reply with a single JSON object and nothing else:
+{"diagnosis": "...", "treatment_plan": "...", "icd_code": "..."}
+- diagnosis: pathophysiology, diagnostic criteria met and differential diagnosis
+- treatment_plan: numbered steps, one per line
+- icd_code: the ICD-11 code, or null
+Provide ONLY clinical content; no placeholders, names or credentials."""
+
+JSON_OUTPUT_INSTRUCTIONS = """**Required Output Format**:
+A JSON object with the keys "diagnosis" (clinical assessment including
+pathophysiology mechanism, diagnostic criteria met and differential
+diagnosis), "treatment_plan" (numbered steps: primary pharmacotherapy with
+drug class, dose and frequency; adjuvant therapies; lifestyle
+modifications; monitoring parameters; red flags requiring immediate
+attention) and "icd_code" (ICD-11 code or null)."""
+
+JSON_FOLLOW_UP_INSTRUCTIONS = "Answer with the JSON object required above."
+
+REPAIR_PROMPT = """The reply below was supposed to be a JSON object with the string keys
+"diagnosis" and "treatment_plan" and an optional "icd_code", but it is
+invalid ({error}). Return the same clinical content as that JSON object.
+Do not add new content.
+
+{response}"""
+
+# The re-ask only restructures an answer that already exists
+REPAIR_MAX_CHARS = 6000
+
+
+class StructuredOutputError(ValueError):
+    """
+    The model's reply is not a JSON object matching CONSULTATION_SCHEMA
+    """
+
+
+def _text(value: Any) -> str:
+    # Models sometimes return the numbered plan as a list of steps
+    if isinstance(value, list) and all(isinstance(item, str) for item in value):
+        return '\n'.join(item.strip() for item in value if item.strip())
+    if not isinstance(value, str):
+        raise StructuredOutputError(f"expected a string, got {type(value).__name__}")
+    return value.strip()
+
+
+def parse_structured_response(response: str) -> Dict[str, str]:
+    """
+    Decode and validate a JSON-mode completion into the same dict the
+    free-text parser returns. Raises StructuredOutputError.
+    """
+    try:
+        data = json.loads(response)
+    except ValueError as e:
+        raise StructuredOutputError(f"invalid JSON: {e}")
+    if not isinstance(data, dict):
+        raise StructuredOutputError(f"expected an object, got {type(data).__name__}")
+
+    result = {}
+    for key in CONSULTATION_SCHEMA['required']:
+        if key not in data:
+            raise StructuredOutputError(f"missing '{key}'")
+        try:
+            result[key] = _text(data[key])
+        except StructuredOutputError as e:
+            raise StructuredOutputError(f"'{key}': {e}")
+        if not result[key]:
+            raise StructuredOutputError(f"'{key}' is empty")
+
+    icd_code = data.get('icd_code')
+    if isinstance(icd_code, str):
+        match = _ICD_CODE.search(icd_code.replace('ICD-11:', ''))
+        if match:
+            result['icd_code'] = match.group(0)
+    elif icd_code is not None:
+        raise StructuredOutputError(f"'icd_code': expected a string or null, got {type(icd_code).__name__}")
+    return result
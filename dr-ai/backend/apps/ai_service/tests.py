@@ -0,0 +1,430 @@
+import json
+import threading
+import time
+from unittest import skipUnless
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase
+from rest_framework.test import APIClient
+from .admission import (
+    AdmissionController, AdmissionRejected, PRIORITY_EMERGENCY, PRIORITY_ROUTINE, REASON_PREEMPTED,
+    REASON_QUEUE_FULL, REASON_QUEUE_TIMEOUT
+)
+from .backends import BackendPool
+from .conf import ai_setting
+from .conversation import is_follow_up
+from .fake_ollama import FakeOllamaServer
+from .hedging import HedgePolicy, hedged_stream
+from .http_client import StreamCancelled, StreamHandle
+from .metrics import metrics
+from .ollama_client import OllamaClient
+from .management.commands.benchmark_response_parser import CORPUS_PATH, _mismatches, legacy_parse
+from .response_parser import (
+    EVENT_DELTA, EVENT_ICD_CODE, OUTCOME_FALLBACK_RAW, OUTCOME_SECTIONS,
+    StreamingSectionParser, parse_with_outcome
+)
+from .lookup import answer_lookup, match_intents, INTENT_ALLERGIES, INTENT_BLOOD_TYPE, INTENT_MEDICATIONS
+from .routing import classify_complexity, ModelRouter, ROUTE_COMPLEX, ROUTE_SIMPLE
+from .warmup import ModelWarmer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+RECORD = {
+    'full_name': 'Jane Doe',
+    'date_of_birth': '1980-05-01',
+    'blood_type': 'O+',
+    'allergies': 'Penicillin',
+    'chronic_conditions': 'Asthma, Hypertension',
+    'medications': 'Lisinopril 10mg, Salbutamol inhaler',
+    'medical_history': ['2019: Appendectomy'],
+}
+
+
+class LookupTests(SimpleTestCase):
+    # Clinical questions that mention a record field; none may be answered from the record
+    CLINICAL = (
+        'Which drugs are contraindicated for this patient?',
+        'What drugs are contraindicated with her kidney disease?',
+        'Which prescriptions need renal adjustment for her eGFR?',
+        'What procedures are needed next for the patient?',
+        'How old is the patient and what vaccines are due?',
+        'What is the likely diagnosis given chest tightness and wheeze?',
+        'What is the diagnosis for new onset chest tightness?',
+        'What is my diagnosis?',
+        'Are her medications safe to take together?',
+        'Which medications should she avoid?',
+    )
+    # Field mentions that ask for more than the field holds
+    TRAILING_CLAUSE = (
+        'What medications is she on for her heart?',
+        'What allergies does she have and what should I prescribe instead?',
+        "What are the patient's allergies, and is amoxicillin okay?",
+        "What is my mother's blood type?",
+    )
+    FIELD_REQUESTS = (
+        ('blood type', [INTENT_BLOOD_TYPE]),
+        ('What is my blood type?', [INTENT_BLOOD_TYPE]),
+        ("What are the patient's allergies?", [INTENT_ALLERGIES]),
+        ('Does the patient have any allergies?', [INTENT_ALLERGIES]),
+        ('List my current medications', [INTENT_MEDICATIONS]),
+        ('What medications is she on?', [INTENT_MEDICATIONS]),
+        ('Blood type and allergies', [INTENT_BLOOD_TYPE, INTENT_ALLERGIES]),
+    )
+
+    def test_clinical_questions_are_not_answered_from_the_record(self):
+        for question in self.CLINICAL + self.TRAILING_CLAUSE:
+            with self.subTest(question=question):
+                match = answer_lookup(RECORD, question)
+                self.assertIsNone(match.response)
+                self.assertLess(match_intents(question).confidence, 0.8)
+
+    def test_clinical_questions_go_to_the_large_model(self):
+        for question in self.CLINICAL:
+            with self.subTest(question=question):
+                self.assertEqual(classify_complexity(question), ROUTE_COMPLEX)
+
+    def test_field_requests_are_answered_from_the_record(self):
+        for question, intents in self.FIELD_REQUESTS:
+            with self.subTest(question=question):
+                match = answer_lookup(RECORD, question)
+                self.assertEqual(match.intents, intents)
+                self.assertEqual(match.confidence, 1.0)
+                self.assertIsNotNone(match.response)
+
+    def test_answer_quotes_the_record(self):
+        match = answer_lookup(RECORD, 'What is my blood type?')
+        self.assertIn('Blood type on record: O+.', match.response['diagnosis'])
+
+    def test_simple_route_for_field_requests(self):
+        self.assertEqual(classify_complexity('What is my blood type?'), ROUTE_SIMPLE)
+
+
+@skipUnless(numpy, 'the semantic cache needs numpy')
+class SemanticCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        from .embeddings import HashingEmbedder
+        from .semantic_cache import SemanticCache
+        self.embedder = HashingEmbedder(ai_setting('SEMANTIC_CACHE_DIM'))
+        self.cache = SemanticCache(self.embedder, threshold=ai_setting('SEMANTIC_CACHE_THRESHOLD'))
+
+    def hit(self, cached, asked):
+        self.cache.warm('record', 'fingerprint', self.embedder.embed_many([cached]), ['cached'])
+        return self.cache.lookup('record', 'fingerprint', self.embedder.embed(asked)) is not None
+
+    def test_questions_with_different_intent_miss(self):
+        from .management.commands.benchmark_semantic_cache import MUST_MISS
+        for first, second in MUST_MISS:
+            for cached, asked in ((first, second), (second, first)):
+                with self.subTest(cached=cached, asked=asked):
+                    self.assertFalse(self.hit(cached, asked))
+
+    def test_rewording_hits(self):
+        self.assertTrue(self.hit('Could penicillin cause my rash?', 'does penicillin cause rash'))
+
+
+class FollowUpTests(SimpleTestCase):
+
+    def test_standalone_questions(self):
+        for question in (
+            'What are the drug interactions?',
+            'Is this rash from penicillin?',
+            'What tests should be ordered for this patient?',
+            'Which tests?',
+            'Could that be asthma?',
+        ):
+            with self.subTest(question=question):
+                self.assertFalse(is_follow_up(question))
+
+    def test_follow_ups(self):
+        for question in (
+            'What about the dose?',
+            'And if it gets worse?',
+            'You mentioned an inhaler, which one?',
+            'How long should I follow your previous plan?',
+        ):
+            with self.subTest(question=question):
+                self.assertTrue(is_follow_up(question))
+
+    def test_client_flag_wins(self):
+        self.assertTrue(is_follow_up('Which tests?', explicit=True))
+        self.assertFalse(is_follow_up('What about the dose?', explicit=False))
+
+
+class HedgeCancellationTests(SimpleTestCase):
+
+    def setUp(self):
+        # The primary stalls in prompt evaluation, well past the hedge delay
+        self.stalled = FakeOllamaServer(prompt_delay=30).start()
+        self.fast = FakeOllamaServer().start()
+        self.addCleanup(self.stalled.stop)
+        self.addCleanup(self.fast.stop)
+        self.pool = BackendPool.from_urls([self.stalled.url, self.fast.url], 'medllama2', health_interval=60)
+        self.addCleanup(self.pool.stop)
+        self.policy = HedgePolicy(default_delay=0.2, min_samples=10 ** 6)
+
+    def call(self, backend, handle=None):
+        return backend.client.generate_stream('What causes a rash?', model='medllama2', handle=handle)
+
+    def test_loser_stalled_before_first_token_is_released(self):
+        stalled = self.pool.backends[0]
+        started = time.monotonic()
+        chunks = list(hedged_stream(self.pool, self.call, self.policy))
+        self.assertTrue(chunks[-1]['done'])
+        self.assertLess(time.monotonic() - started, 5)
+
+        # The loser's connection is shut down and its slot given back at once,
+        # not when its first token or the read timeout arrives
+        deadline = time.monotonic() + 2
+        while stalled.in_flight and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(stalled.in_flight, 0)
+        self.assertEqual(stalled.failures, 0)
+        self.assertEqual(self.pool.backends[1].in_flight, 0)
+
+    def test_cancel_before_headers_raises_stream_cancelled(self):
+        handle = StreamHandle()
+        stream = self.pool.backends[0].client.generate_stream('What causes a rash?', model='medllama2', handle=handle)
+        threading.Timer(0.2, handle.cancel).start()
+        started = time.monotonic()
+        with self.assertRaises(StreamCancelled):
+            next(stream)
+        self.assertLess(time.monotonic() - started, 5)
+
+
+class ResponseParserTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        with open(CORPUS_PATH, encoding='utf-8') as corpus_file:
+            cls.corpus = json.load(corpus_file)
+
+    def test_corpus_expectations(self):
+        for case in self.corpus:
+            with self.subTest(case=case['name']):
+                self.assertEqual(_mismatches(case, *parse_with_outcome(case['text'])), [])
+
+    def test_expectations_come_from_the_legacy_parser(self):
+        # Every difference from the original parser is documented, and every
+        # documented difference is real
+        for case in self.corpus:
+            with self.subTest(case=case['name']):
+                problems = _mismatches(case, *legacy_parse(case['text']))
+                if 'legacy_difference' in case:
+                    self.assertNotEqual(problems, [])
+                else:
+                    self.assertEqual(problems, [])
+
+    def test_header_variants(self):
+        for text in (
+            'DIAGNOSIS: Asthma.\nTREATMENT PLAN: Inhaler.',
+            'diagnosis:\nAsthma.\n\ntreatment plan:\nInhaler.',
+            '**Diagnosis:** Asthma.\n**Treatment Plan:** Inhaler.',
+            '## Diagnosis\nAsthma.\n## Treatment Plan\nInhaler.',
+            '1. Diagnosis\nAsthma.\n2. Treatment plan\nInhaler.',
+            'Thank you. DIAGNOSIS: Asthma. TREATMENT PLAN: Inhaler.',
+        ):
+            with self.subTest(text=text):
+                result, outcome = parse_with_outcome(text)
+                self.assertEqual(outcome, OUTCOME_SECTIONS)
+                self.assertEqual(result['diagnosis'], 'Asthma.')
+                self.assertEqual(result['treatment_plan'], 'Inhaler.')
+
+    def test_section_words_inside_sentences_fall_back_to_the_legacy_split(self):
+        text = 'Further tests will confirm the diagnosis and develop a treatment plan for the patient.'
+        result, outcome = parse_with_outcome(text)
+        self.assertEqual(outcome, OUTCOME_SECTIONS)
+        self.assertEqual((result, outcome), legacy_parse(text))
+
+    def test_parse_rates_are_not_below_legacy(self):
+        rates = {}
+        for label, parse in (('legacy', legacy_parse), ('single_pass', parse_with_outcome)):
+            outcomes = [parse(case['text'])[1] for case in self.corpus]
+            rates[label] = (
+                outcomes.count(OUTCOME_SECTIONS) / len(outcomes),
+                1 - outcomes.count(OUTCOME_FALLBACK_RAW) / len(outcomes),
+            )
+        self.assertGreaterEqual(rates['single_pass'][0], rates['legacy'][0])
+        self.assertGreaterEqual(rates['single_pass'][1], rates['legacy'][1])
+        # On the corpus as recorded: 65.8% sections found, 73.2% split
+        self.assertGreaterEqual(round(rates['single_pass'][0], 3), 0.658)
+        self.assertGreaterEqual(round(rates['single_pass'][1], 3), 0.732)
+
+    def test_trailing_section_labels(self):
+        result, outcome = parse_with_outcome('Stable asthma. (DIAGNOSIS)\nContinue the inhaler. (TREATMENT PLAN)')
+        self.assertEqual(outcome, OUTCOME_SECTIONS)
+        self.assertEqual(result, {'diagnosis': 'Stable asthma.', 'treatment_plan': 'Continue the inhaler.'})
+
+    def test_sentence_opening_the_treatment_plan(self):
+        result, outcome = parse_with_outcome(
+            'DIAGNOSIS: Likely asthma. The treatment plan should include an inhaler. Review in a week.'
+        )
+        self.assertEqual(outcome, OUTCOME_SECTIONS)
+        self.assertEqual(result['diagnosis'], 'Likely asthma.')
+        self.assertEqual(result['treatment_plan'], 'The treatment plan should include an inhaler. Review in a week.')
+
+    def stream(self, text, size):
+        parser = StreamingSectionParser()
+        events = []
+        for start in range(0, len(text), size):
+            events += parser.feed(text[start:start + size])
+        events += parser.close()
+        sections = {}
+        for event in events:
+            if event.type == EVENT_DELTA:
+                sections[event.section] = sections.get(event.section, '') + event.text
+        return sections, [event.text for event in events if event.type == EVENT_ICD_CODE]
+
+    def test_streaming_parser_matches_batch_parser_for_any_chunking(self):
+        compared = 0
+        for case in self.corpus:
+            result, outcome = parse_with_outcome(case['text'])
+            # Completions split by a fallback have no headers to stream
+            if outcome != OUTCOME_SECTIONS or 'treatment_plan' not in self.stream(case['text'], len(case['text']))[0]:
+                continue
+            compared += 1
+            for size in (1, 7, 64, len(case['text'])):
+                with self.subTest(case=case['name'], chunk_size=size):
+                    text, codes = self.stream(case['text'], size)
+                    self.assertEqual(text.get('diagnosis', ''), result['diagnosis'])
+                    self.assertEqual(text.get('treatment_plan', ''), result['treatment_plan'])
+                    self.assertEqual(codes[:1], [result['icd_code']] if 'icd_code' in result else [])
+        self.assertGreater(compared, 0)
+
+
+class AdmissionTests(SimpleTestCase):
+
+    def controller(self, **options):
+        options = {'max_concurrent': 1, 'max_queue': 4, 'queue_timeout': 5, **options}
+        controller = AdmissionController('test_admission', **options)
+        self.addCleanup(metrics._collectors.pop, 'test_admission', None)
+        return controller
+
+    def waiter(self, controller, priority, served, errors):
+        """
+        Start a thread that queues for a slot, records its turn and
+        releases at once; returns after the thread is queued
+        """
+        depth = f'test_admission_queue_depth{{priority={priority}}}'
+        queued = controller.gauges()[depth]
+
+        def run():
+            try:
+                with controller.admit(priority=priority):
+                    served.append(priority)
+            except AdmissionRejected as rejection:
+                errors.append((priority, rejection))
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join, 5)
+        deadline = time.monotonic() + 2
+        while controller.gauges()[depth] == queued and time.monotonic() < deadline:
+            time.sleep(0.005)
+        return thread
+
+    def test_routine_work_never_takes_the_reserved_slot(self):
+        controller = self.controller(max_concurrent=2, emergency_reserved=1)
+        with controller.admit(priority=PRIORITY_ROUTINE):
+            with self.assertRaises(AdmissionRejected) as rejected:
+                controller.acquire(timeout=0.05, priority=PRIORITY_ROUTINE)
+            self.assertEqual((rejected.exception.reason, rejected.exception.status), (REASON_QUEUE_TIMEOUT, 503))
+            controller.acquire(timeout=0, priority=PRIORITY_EMERGENCY).release()
+
+    def test_emergency_is_served_before_routine_queued_earlier(self):
+        controller = self.controller()
+        served, errors = [], []
+        slot = controller.acquire()
+        threads = [self.waiter(controller, priority, served, errors)
+                   for priority in (PRIORITY_ROUTINE, PRIORITY_EMERGENCY)]
+        slot.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(served, [PRIORITY_EMERGENCY, PRIORITY_ROUTINE])
+        self.assertEqual(errors, [])
+
+    def test_full_queue(self):
+        controller = self.controller(max_queue=1)
+        served, errors = [], []
+        slot = controller.acquire()
+        routine = self.waiter(controller, PRIORITY_ROUTINE, served, errors)
+
+        with self.assertRaises(AdmissionRejected) as rejected:
+            controller.acquire(priority=PRIORITY_ROUTINE)
+        self.assertEqual((rejected.exception.reason, rejected.exception.status), (REASON_QUEUE_FULL, 429))
+
+        # An emergency takes the queued routine request's place
+        emergency = self.waiter(controller, PRIORITY_EMERGENCY, served, errors)
+        routine.join(5)
+        self.assertEqual([(priority, rejection.reason) for priority, rejection in errors],
+                         [(PRIORITY_ROUTINE, REASON_PREEMPTED)])
+        slot.release()
+        emergency.join(5)
+        self.assertEqual(served, [PRIORITY_EMERGENCY])
+
+    def test_starved_routine_request_is_served_before_newer_emergencies(self):
+        controller = self.controller(starvation_timeout=0.1)
+        served, errors = [], []
+        slot = controller.acquire()
+        threads = [self.waiter(controller, PRIORITY_ROUTINE, served, errors)]
+        time.sleep(0.15)
+        threads.append(self.waiter(controller, PRIORITY_EMERGENCY, served, errors))
+        slot.release()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(served, [PRIORITY_ROUTINE, PRIORITY_EMERGENCY])
+        self.assertEqual(errors, [])
+
+
+class WarmupTests(SimpleTestCase):
+
+    def ollama_client(self, **options):
+        client = OllamaClient(base_url=self.server.url, session_cache=None, health_interval=60, **options)
+        self.addCleanup(client.pool.stop)
+        return client
+
+    def test_every_routed_model_is_warmed(self):
+        self.server = FakeOllamaServer(models=('medllama2', 'llama3.2'), preloaded=False).start()
+        self.addCleanup(self.server.stop)
+        default = self.ollama_client(model='medllama2')
+        router = ModelRouter(
+            default, client_factory=self.ollama_client,
+            routes={ROUTE_SIMPLE: {'model': 'llama3.2', 'num_predict': 256}, ROUTE_COMPLEX: {'model': None}}
+        )
+        warmer = ModelWarmer(default, clients=lambda: router.clients(create=True))
+
+        results = warmer.warm_all(prime=False)
+        self.assertEqual(sorted(result.model for result in results), ['llama3.2', 'medllama2'])
+        self.assertEqual([result.error for result in results], ['', ''])
+        self.assertEqual(self.server.httpd.loaded, {'medllama2', 'llama3.2'})
+        # The routed client built for warm-up is the one that serves the route
+        self.assertIs(router.route('What is my blood type?').client, router.clients()[1])
+
+
+class MetricsEndpointTests(TestCase):
+    URL = '/api/ai/metrics/'
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_requires_staff(self):
+        self.assertEqual(self.client.get(self.URL).status_code, 401)
+        user = get_user_model().objects.create(username='clinician', email='clinician@example.com')
+        self.client.force_authenticate(user)
+        self.assertEqual(self.client.get(self.URL).status_code, 403)
+
+    def test_staff_can_read_and_collector_errors_are_not_exposed(self):
+        def failing():
+            raise RuntimeError('secret connection string')
+
+        metrics.register_collector('test_failing', failing)
+        self.addCleanup(metrics._collectors.pop, 'test_failing', None)
+        staff = get_user_model().objects.create(username='ops', email='ops@example.com', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['gauges']['collector_error{collector=test_failing}'], 1)
+        self.assertNotIn('secret connection string', response.content.decode())
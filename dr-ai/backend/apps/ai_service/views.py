@@ -0,0 +1,14 @@
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from .metrics import metrics
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_snapshot(request):
+    """
+    Current AI service metrics for this worker process. Staff only: the
+    snapshot names the Ollama backends and their circuit-breaker state.
+    """
+    return Response(metrics.snapshot())
@@ -0,0 +1,150 @@
+import os
+import sys
+import threading
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, Callable, Dict, List, Optional
+from .backends import Backend, _model_names
+from .http_client import OllamaError
+from .metrics import metrics
+from .ollama_client import OllamaClient
+from ..utils.logger import setup_logger
+
+logger = setup_logger('ollama_warmup')
+
+WARMUP_PROMPT = "Reply only with: OK"
+
+
+@dataclass
+class WarmupResult:
+    url: str
+    model: str = ''
+    # None when /api/ps could not be read
+    was_resident: Optional[bool] = None
+    load_seconds: float = 0.0
+    prime_seconds: float = 0.0
+    total_seconds: float = 0.0
+    error: str = ''
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ModelWarmer:
+    """
+    Keeps the consultation models loaded on every backend.
+
+    warm_all() preloads each model (an empty-prompt /api/generate with its
+    client's keep_alive and num_ctx, so Ollama does not reload it for the
+    first real request) and runs a one-token priming prompt. start() does
+    that once in a background thread and then re-sends the preloads every
+    `refresh_interval` seconds, which resets Ollama's keep_alive timer
+    before it can evict a model between consultations. `clients` returns
+    the clients to keep warm (e.g. every routed model); by default only
+    `client`.
+    """
+
+    def __init__(self, client: OllamaClient, refresh_interval: float = 600.0, prompt: str = WARMUP_PROMPT,
+                 clients: Optional[Callable[[], List[OllamaClient]]] = None):
+        self.client = client
+        self.clients = clients or (lambda: [client])
+        self.refresh_interval = refresh_interval
+        self.prompt = prompt
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _options(client: OllamaClient, **extra) -> Dict[str, Any]:
+        # A different num_ctx than the consultations use would load the model twice
+        return {'num_ctx': client.options['num_ctx'], **extra}
+
+    def warm_backend(self, backend: Backend, prime: bool = True,
+                     client: Optional[OllamaClient] = None) -> WarmupResult:
+        client = client or self.client
+        model = client.model
+        result = WarmupResult(url=backend.url, model=model)
+        started = time.perf_counter()
+        try:
+            result.was_resident = model in _model_names(backend.client.ps(timeout=client.pool.health_timeout))
+        except OllamaError:
+            pass
+
+        try:
+            loaded = backend.client.generate(
+                '', model=model, options=self._options(client), keep_alive=client.keep_alive
+            )
+            result.load_seconds = round(loaded.get('load_duration', 0) / 1e9, 3)
+            if prime:
+                prime_started = time.perf_counter()
+                backend.client.generate(
+                    self.prompt, model=model, options=self._options(client, num_predict=1),
+                    keep_alive=client.keep_alive
+                )
+                result.prime_seconds = round(time.perf_counter() - prime_started, 3)
+            backend.model_resident = True
+        except OllamaError as e:
+            result.error = str(e)
+        result.total_seconds = round(time.perf_counter() - started, 3)
+
+        outcome = 'error' if result.error else ('resident' if result.was_resident else 'loaded')
+        metrics.incr('ollama_warmups', backend=backend.url, model=model, outcome=outcome)
+        if not result.error:
+            metrics.observe('ollama_model_load_seconds', result.load_seconds, backend=backend.url, model=model)
+            logger.info(
+                f"Warmed {model} on {backend.url}: "
+                f"{'already resident' if result.was_resident else f'loaded in {result.load_seconds:.2f}s'}"
+                f", {result.total_seconds:.2f}s total"
+            )
+        else:
+            logger.warning(f"Warm-up of {model} on {backend.url} failed: {result.error}")
+        return result
+
+    def warm_all(self, prime: bool = True) -> List[WarmupResult]:
+        results, seen = [], set()
+        for client in self.clients():
+            # Routes that share a model and num_ctx share its loaded copy
+            for backend in client.pool.backends:
+                key = (backend.url, client.model, client.options['num_ctx'])
+                if key not in seen:
+                    seen.add(key)
+                    results.append(self.warm_backend(backend, prime=prime, client=client))
+        return results
+
+    def start(self):
+        """
+        Warm up in the background, then keep the model resident
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='ollama-warmup', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        prime = True
+        while True:
+            try:
+                self.warm_all(prime=prime)
+            except Exception as e:
+                logger.error(f"Model warm-up crashed: {str(e)}", exc_info=True)
+            prime = False
+            if self.refresh_interval <= 0 or self._stop.wait(self.refresh_interval):
+                return
+
+    def stop(self):
+        self._stop.set()
+
+
+def serving_process() -> bool:
+    """
+    Whether this process serves requests: a WSGI/ASGI server, or the
+    runserver child that the autoreloader spawns. Other management
+    commands (migrate, shell, ...) should not warm the model.
+    """
+    argv = sys.argv
+    if not argv or os.path.basename(argv[0]) != 'manage.py':
+        return True
+    if len(argv) < 2 or argv[1] != 'runserver':
+        return False
+    return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import MedicalRecord, AIConsultation
+from .models import (
+    MedicalRecord, AIConsultation, ConsultationJob, ConsultationTelemetry, PatientSummary,
+    ConversationMemory
+)
 
 @admin.register(MedicalRecord)
 class MedicalRecordAdmin(admin.ModelAdmin):
@@ -41,4 +44,39 @@ class AIConsultationAdmin(admin.ModelAdmin):
     
     def diagnosis_short(self, obj):
         return obj.diagnosis[:50] + '...' if len(obj.diagnosis) > 50 else obj.diagnosis
-    diagnosis_short.short_description = 'Diagnosis'
\ No newline at end of file
+    diagnosis_short.short_description = 'Diagnosis'
+
+@admin.register(ConsultationTelemetry)
+class ConsultationTelemetryAdmin(admin.ModelAdmin):
+    list_display = (
+        'consultation', 'model', 'question_type', 'eval_tokens', 'load_seconds',
+        'prompt_eval_seconds', 'eval_seconds', 'first_token_seconds', 'tokens_per_second', 'created_at'
+    )
+    readonly_fields = ('created_at',)
+    list_filter = ('model', 'question_type', 'done_reason', 'created_at')
+
+@admin.register(PatientSummary)
+class PatientSummaryAdmin(admin.ModelAdmin):
+    list_display = ('medical_record', 'model', 'is_current', 'generation_seconds', 'record_version', 'generated_at')
+    list_select_related = ('medical_record',)
+    readonly_fields = ('record_version', 'generated_at')
+    search_fields = ('medical_record__full_name', 'medical_record__nfc_id')
+    list_filter = ('model', 'generated_at')
+
+    def is_current(self, obj):
+        return obj.is_current
+    is_current.boolean = True
+    is_current.short_description = 'Current'
+
+@admin.register(ConversationMemory)
+class ConversationMemoryAdmin(admin.ModelAdmin):
+    list_display = ('medical_record', 'summarised_turns', 'summarised_through', 'updated_at')
+    readonly_fields = ('summarised_through', 'updated_at')
+    search_fields = ('medical_record__full_name', 'medical_record__nfc_id')
+
+@admin.register(ConsultationJob)
+class ConsultationJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'medical_record', 'status', 'attempts', 'created_at', 'started_at', 'finished_at')
+    readonly_fields = ('created_at', 'started_at', 'finished_at', 'attempts')
+    search_fields = ('medical_record__full_name', 'medical_record__nfc_id', 'question')
+    list_filter = ('status', 'created_at')
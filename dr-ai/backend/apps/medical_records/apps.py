@@ -3,3 +3,12 @@ from django.apps import AppConfig
 class MedicalRecordsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.medical_records'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from ..ai_service.conf import ai_setting
+        from ..ai_service.warmup import serving_process
+
+        if ai_setting('WARMUP_ON_STARTUP') and serving_process():
+            from .services import model_warmer
+            model_warmer.start()
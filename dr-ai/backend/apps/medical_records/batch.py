@@ -0,0 +1,185 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from django.db import connection
+from .models import MedicalRecord, AIConsultation, ConsultationTelemetry
+from .serializers import MedicalRecordSerializer
+from .services import (
+    ConsultationAnswer, ConsultationCancelled, answer_question, build_telemetry, consultation_admission, remember_answer
+)
+from ..ai_service.admission import AdmissionRejected
+from ..ai_service.conf import ai_setting
+from ..ai_service.metrics import metrics
+from ..utils.logger import setup_logger
+
+logger = setup_logger('consultation_batch')
+
+STATUS_OK = 'ok'
+STATUS_ERROR = 'error'
+
+
+def parse_batch_items(data: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    Accept {"items": [{"nfc_id", "question"}, ...]} or the same question for
+    many records as {"nfc_ids": [...], "question": "..."}. Returns unique
+    (nfc_id, question) pairs in request order; raises ValueError.
+    """
+    if data.get('items') is not None:
+        items = data['items']
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError('items must be a list of {"nfc_id", "question"} objects')
+        pairs = [(str(item.get('nfc_id') or ''), item.get('question') or '') for item in items]
+    else:
+        nfc_ids = data.get('nfc_ids')
+        if not isinstance(nfc_ids, list):
+            raise ValueError('Either items or nfc_ids and question are required')
+        pairs = [(str(nfc_id or ''), data.get('question') or '') for nfc_id in nfc_ids]
+
+    if not pairs:
+        raise ValueError('At least one item is required')
+    if any(not nfc_id or not isinstance(question, str) or not question.strip() for nfc_id, question in pairs):
+        raise ValueError('Every item needs an nfc_id and a question')
+
+    max_items = ai_setting('BATCH_MAX_ITEMS')
+    unique = list(dict.fromkeys(pairs))
+    if len(unique) > max_items:
+        raise ValueError(f'A batch may contain at most {max_items} items')
+    return unique
+
+
+class BatchConsultation:
+    """
+    Answer many (record, question) pairs concurrently.
+
+    Records are fetched in one query. Generations run on a thread pool no
+    wider than the admission limit, so a batch queues behind interactive
+    consultations instead of swamping the backends. stream() yields each
+    item's result as soon as it is ready; all consultations are written
+    with a single bulk_create when the batch ends (or when the client
+    disconnects, for the items finished so far). A disconnect also stops
+    the remaining items from taking admission slots; generations already
+    running finish and land in the response cache.
+    """
+
+    def __init__(self, items: List[Tuple[str, str]]):
+        self.items = items
+        self.records = MedicalRecord.objects.in_bulk(
+            {nfc_id for nfc_id, _ in items}, field_name='nfc_id'
+        )
+        self.concurrency = max(1, min(
+            ai_setting('BATCH_CONCURRENCY') or consultation_admission.max_concurrent,
+            len(items)
+        ))
+        self._answers: Dict[int, ConsultationAnswer] = {}
+        self._saved: Dict[int, AIConsultation] = {}
+        self._cancelled = threading.Event()
+
+    def _answer(self, index: int, record: MedicalRecord, medical_record_data: Dict[str, Any]):
+        try:
+            # Batch questions stand alone, whatever the patient was asked before
+            return answer_question(
+                record, self.items[index][1], medical_record_data, follow_up=False, cancelled=self._cancelled
+            )
+        except ConsultationCancelled:
+            metrics.incr('consultation_batch_items', status='cancelled')
+            raise
+        finally:
+            # Worker threads get their own database connections
+            connection.close()
+
+    def _item_result(self, index: int, started: float, answer: Optional[ConsultationAnswer] = None,
+                     error: str = '', **extra) -> Dict[str, Any]:
+        nfc_id, question = self.items[index]
+        result = {'index': index, 'nfc_id': nfc_id, 'question': question}
+        if answer is not None:
+            result.update({
+                'status': STATUS_OK,
+                'source': answer.source,
+                'diagnosis': answer.response['diagnosis'],
+                'treatment_plan': answer.response['treatment_plan'],
+            })
+        else:
+            result.update({'status': STATUS_ERROR, 'error': error, **extra})
+        result['seconds'] = round(time.perf_counter() - started, 3)
+        metrics.incr('consultation_batch_items', status=result['status'])
+        return result
+
+    def stream(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Yield ('item', result) per item as it finishes, then ('done', summary)
+        """
+        started = time.perf_counter()
+        metrics.incr('consultation_batches')
+        logger.info(f"Batch of {len(self.items)} consultations, {self.concurrency} at a time")
+
+        serialized = {}
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='consultation-batch')
+        futures = {}
+        try:
+            for index, (nfc_id, _) in enumerate(self.items):
+                record = self.records.get(nfc_id)
+                if record is None:
+                    yield 'item', self._item_result(index, started, error='Medical record not found')
+                    continue
+                if nfc_id not in serialized:
+                    serialized[nfc_id] = MedicalRecordSerializer(record).data
+                futures[executor.submit(self._answer, index, record, serialized[nfc_id])] = index
+
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    answer = future.result()
+                except AdmissionRejected as rejection:
+                    yield 'item', self._item_result(
+                        index, started, error='AI service is busy, please retry later',
+                        retry_after=rejection.retry_after
+                    )
+                    continue
+                except Exception as e:
+                    logger.error(f"Batch item {index} ({self.items[index][0]}) failed: {str(e)}")
+                    yield 'item', self._item_result(index, started, error='AI service error, please try again')
+                    continue
+                self._answers[index] = answer
+                yield 'item', self._item_result(index, started, answer)
+        finally:
+            # Queued items are dropped; running ones give up before admission
+            self._cancelled.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._persist()
+
+        seconds = time.perf_counter() - started
+        metrics.observe('consultation_batch_seconds', seconds)
+        yield 'done', {
+            'total': len(self.items),
+            'succeeded': len(self._saved),
+            'failed': len(self.items) - len(self._saved),
+            'seconds': round(seconds, 3),
+            'consultations': [
+                {'index': index, 'nfc_id': self.items[index][0], 'id': consultation.pk}
+                for index, consultation in sorted(self._saved.items())
+            ],
+        }
+
+    def _persist(self):
+        if not self._answers:
+            return
+        pending = sorted(self._answers.items())
+        consultations = AIConsultation.objects.bulk_create([
+            AIConsultation(
+                medical_record=self.records[self.items[index][0]],
+                question=self.items[index][1],
+                diagnosis=answer.response['diagnosis'],
+                treatment_plan=answer.response['treatment_plan']
+            )
+            for index, answer in pending
+        ])
+        telemetry = []
+        for (index, answer), consultation in zip(pending, consultations):
+            self._saved[index] = consultation
+            remember_answer(consultation.medical_record, answer, consultation)
+            row = build_telemetry(consultation, answer.meta.get('generation'))
+            if row is not None:
+                telemetry.append(row)
+        ConsultationTelemetry.objects.bulk_create(telemetry)
+        self._answers = {}
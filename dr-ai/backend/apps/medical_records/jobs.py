@@ -0,0 +1,213 @@
+import threading
+import time
+from datetime import timedelta
+from typing import Optional
+from django.db import close_old_connections, connection
+from django.db.models import F, Min
+from django.utils import timezone
+from .models import ConsultationJob, MedicalRecord
+from .services import generate_consultation
+from ..ai_service.admission import AdmissionRejected
+from ..ai_service.conf import ai_setting
+from ..ai_service.http_client import OllamaError
+from ..ai_service.metrics import metrics
+from ..utils.logger import setup_logger
+
+logger = setup_logger('consultation_jobs')
+
+# Reason codes stored on failed jobs. Job status is readable by anyone with
+# the job id, so the exception text (backend URLs, HTTP error bodies, the
+# model's output) only goes to the log.
+FAILURE_AI_SERVICE = 'ai_service_error'
+FAILURE_INVALID_RESPONSE = 'invalid_response'
+FAILURE_INTERNAL = 'internal_error'
+
+
+def failure_reason(error: Exception) -> str:
+    if isinstance(error, OllamaError):
+        return FAILURE_AI_SERVICE
+    if isinstance(error, ValueError):
+        # validate_response and structured-output parsing
+        return FAILURE_INVALID_RESPONSE
+    return FAILURE_INTERNAL
+
+
+def enqueue_consultation(record: MedicalRecord, question: str) -> ConsultationJob:
+    """
+    Store a queued consultation job and wake the in-process workers
+    """
+    job = ConsultationJob.objects.create(medical_record=record, question=question)
+    metrics.incr('consultation_jobs_enqueued')
+
+    if ai_setting('JOB_IN_PROCESS_WORKERS'):
+        get_worker_pool().notify()
+    return job
+
+
+def claim_next_job() -> Optional[ConsultationJob]:
+    """
+    Atomically move the oldest queued job to running.
+    The conditional UPDATE makes this safe across threads and processes.
+    """
+    while True:
+        job = (
+            ConsultationJob.objects
+            .filter(status=ConsultationJob.STATUS_QUEUED)
+            .order_by('created_at')
+            .only('id')
+            .first()
+        )
+        if job is None:
+            return None
+
+        claimed = ConsultationJob.objects.filter(
+            pk=job.pk, status=ConsultationJob.STATUS_QUEUED
+        ).update(
+            status=ConsultationJob.STATUS_RUNNING,
+            started_at=timezone.now(),
+            attempts=F('attempts') + 1
+        )
+        if claimed:
+            return ConsultationJob.objects.select_related('medical_record').get(pk=job.pk)
+
+
+def run_job(job: ConsultationJob):
+    wait_seconds = (job.started_at - job.created_at).total_seconds()
+    metrics.observe('consultation_job_wait_seconds', wait_seconds)
+    logger.info(f"Running consultation job {job.id} after {wait_seconds:.2f}s in queue")
+
+    try:
+        with metrics.timer('consultation_job_run_seconds'):
+            outcome = generate_consultation(job.medical_record, job.question)
+        job.consultation = outcome.consultation
+        job.status = ConsultationJob.STATUS_DONE
+        job.error = ''
+    except AdmissionRejected as rejection:
+        # Interactive traffic has the generation slots; put the job back
+        # and let this worker back off instead of failing it.
+        logger.info(f"Consultation job {job.id} not admitted, requeueing for {rejection.retry_after}s")
+        ConsultationJob.objects.filter(pk=job.pk).update(
+            status=ConsultationJob.STATUS_QUEUED, started_at=None
+        )
+        metrics.incr('consultation_jobs_requeued', reason=rejection.reason)
+        time.sleep(rejection.retry_after)
+        return
+    except Exception as e:
+        reason = failure_reason(e)
+        logger.error(f"Consultation job {job.id} failed ({reason}): {str(e)}", exc_info=True)
+        job.status = ConsultationJob.STATUS_FAILED
+        job.error = f'Consultation failed ({reason})'
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['consultation', 'status', 'error', 'finished_at'])
+    metrics.incr('consultation_jobs_finished', status=job.status)
+
+
+def requeue_stale_jobs() -> int:
+    """
+    Put back jobs left running by a worker that died mid-generation
+    """
+    cutoff = timezone.now() - timedelta(seconds=ai_setting('JOB_STALE_AFTER'))
+    count = ConsultationJob.objects.filter(
+        status=ConsultationJob.STATUS_RUNNING, started_at__lt=cutoff
+    ).update(status=ConsultationJob.STATUS_QUEUED, started_at=None)
+    if count:
+        logger.warning(f"Re-queued {count} stale consultation jobs")
+    return count
+
+
+def queue_stats() -> dict:
+    queued = ConsultationJob.objects.filter(status=ConsultationJob.STATUS_QUEUED)
+    oldest = queued.aggregate(oldest=Min('created_at'))['oldest']
+    return {
+        'consultation_queue_depth': queued.count(),
+        'consultation_jobs_running': ConsultationJob.objects.filter(
+            status=ConsultationJob.STATUS_RUNNING
+        ).count(),
+        'consultation_queue_oldest_wait_seconds': (
+            (timezone.now() - oldest).total_seconds() if oldest else 0
+        ),
+    }
+
+
+class ConsultationWorkerPool:
+    """
+    Bounded pool of daemon threads draining the database-backed job queue.
+    Workers sleep on a condition and are woken by enqueue_consultation(),
+    falling back to polling so jobs from other processes are picked up too.
+    """
+
+    def __init__(self, max_workers: int, poll_interval: float):
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self._wake = threading.Condition()
+        self._pending_wakeups = 0
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            requeue_stale_jobs()
+            for index in range(self.max_workers):
+                thread = threading.Thread(
+                    target=self._worker_loop,
+                    name=f'consultation-worker-{index}',
+                    daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.max_workers} consultation workers")
+
+    def notify(self):
+        self.start()
+        with self._wake:
+            self._pending_wakeups += 1
+            self._wake.notify()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def join(self):
+        for thread in self._threads:
+            thread.join()
+
+    def _worker_loop(self):
+        try:
+            while not self._stop.is_set():
+                close_old_connections()
+                job = claim_next_job()
+                if job is not None:
+                    run_job(job)
+                    continue
+
+                with self._wake:
+                    if self._pending_wakeups == 0:
+                        self._wake.wait(self.poll_interval)
+                    self._pending_wakeups = max(0, self._pending_wakeups - 1)
+        finally:
+            connection.close()
+
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+def get_worker_pool() -> ConsultationWorkerPool:
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = ConsultationWorkerPool(
+                max_workers=ai_setting('JOB_WORKERS'),
+                poll_interval=ai_setting('JOB_POLL_INTERVAL')
+            )
+        return _worker_pool
+
+
+metrics.register_collector('consultation_queue', queue_stats)
@@ -0,0 +1,81 @@
+import json
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from apps.medical_records.models import ConsultationTelemetry
+
+PHASES = ('load_seconds', 'prompt_eval_seconds', 'eval_seconds')
+FIELDS = PHASES + ('first_token_seconds', 'total_seconds', 'tokens_per_second', 'prompt_tokens', 'eval_tokens')
+
+
+def _percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100.0 * (len(values) - 1))))]
+
+
+def _summarise(rows):
+    summary = {'consultations': len(rows)}
+    for name in FIELDS:
+        values = [row[name] for row in rows if row[name] is not None]
+        summary[name] = {
+            'p50': round(_percentile(values, 50), 3),
+            'p95': round(_percentile(values, 95), 3),
+        } if values else None
+    # Share of Ollama-reported time spent in each phase
+    totals = {name: sum(row[name] or 0 for row in rows) for name in PHASES}
+    spent = sum(totals.values())
+    summary['time_share'] = {name: round(total / spent, 4) if spent else 0.0 for name, total in totals.items()}
+    summary['model_loads'] = sum(1 for row in rows if row['load_seconds'])
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Summarise stored generation telemetry per model: p50/p95 of model load, prompt prefill, '
+        'generation, time to first token and tokens/s, and the share of time spent in each phase'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=float, default=7, help='Look back this many days')
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options['days'])
+        rows = ConsultationTelemetry.objects.filter(created_at__gte=since).values('model', *FIELDS)
+
+        by_model = {}
+        for row in rows:
+            by_model.setdefault(row['model'] or 'unknown', []).append(row)
+        summary = {model: _summarise(model_rows) for model, model_rows in sorted(by_model.items())}
+
+        if options['json']:
+            self.stdout.write(json.dumps(summary, indent=2))
+            return
+
+        if not summary:
+            self.stdout.write(self.style.WARNING(f"No generation telemetry in the last {options['days']:g} days"))
+            return
+
+        def pair(stats, unit='s', digits=2):
+            if stats is None:
+                return 'n/a'
+            return f"{stats['p50']:.{digits}f}{unit} / {stats['p95']:.{digits}f}{unit}"
+
+        for model, stats in summary.items():
+            self.stdout.write(self.style.SUCCESS(
+                f"{model}: {stats['consultations']} consultations, {stats['model_loads']} model loads "
+                f"(last {options['days']:g} days, p50 / p95)"
+            ))
+            self.stdout.write(f"  model load        {pair(stats['load_seconds'])}")
+            self.stdout.write(f"  prompt prefill    {pair(stats['prompt_eval_seconds'])}")
+            self.stdout.write(f"  generation        {pair(stats['eval_seconds'])}")
+            self.stdout.write(f"  first token       {pair(stats['first_token_seconds'])}")
+            self.stdout.write(f"  total             {pair(stats['total_seconds'])}")
+            self.stdout.write(f"  tokens/s          {pair(stats['tokens_per_second'], unit='', digits=1)}")
+            self.stdout.write(f"  prompt tokens     {pair(stats['prompt_tokens'], unit='', digits=0)}")
+            self.stdout.write(f"  generated tokens  {pair(stats['eval_tokens'], unit='', digits=0)}")
+            share = stats['time_share']
+            self.stdout.write(
+                f"  time share        load {share['load_seconds']:.1%} | prefill {share['prompt_eval_seconds']:.1%}"
+                f" | generation {share['eval_seconds']:.1%}"
+            )
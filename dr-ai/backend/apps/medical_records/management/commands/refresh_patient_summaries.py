@@ -0,0 +1,45 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from apps.medical_records.models import MedicalRecord
+from apps.medical_records.summaries import refresh_summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate the standing AI patient summary for records whose summary is missing or older '
+        'than the record (e.g. after enabling PATIENT_SUMMARY_ENABLED or an outage)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate current summaries too')
+        parser.add_argument('--limit', type=int, default=None, help='Summarise at most this many records')
+
+    def handle(self, *args, **options):
+        records = MedicalRecord.objects.order_by('-updated_at')
+        if not options['force']:
+            records = records.filter(
+                Q(ai_summary__isnull=True) | ~Q(ai_summary__record_version=F('updated_at'))
+            )
+        record_ids = list(records.values_list('pk', flat=True)[:options['limit']])
+        if not record_ids:
+            self.stdout.write(self.style.SUCCESS('All patient summaries are current'))
+            return
+
+        done = failed = 0
+        started = time.perf_counter()
+        for record_id in record_ids:
+            try:
+                retry_after = refresh_summary(record_id, force=options['force'])
+                while retry_after:
+                    time.sleep(retry_after)
+                    retry_after = refresh_summary(record_id, force=options['force'])
+                done += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Record {record_id}: {str(e)}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Summarised {done} records in {time.perf_counter() - started:.1f}s"
+            + (f", {failed} failed" if failed else '')
+        ))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from apps.ai_service.conf import ai_setting
+from apps.medical_records.jobs import ConsultationWorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Run a dedicated pool of workers draining the AI consultation job queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=ai_setting('JOB_WORKERS'),
+            help='Number of concurrent consultation workers'
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=ai_setting('JOB_POLL_INTERVAL'),
+            help='Seconds between queue polls when idle'
+        )
+
+    def handle(self, *args, **options):
+        pool = ConsultationWorkerPool(
+            max_workers=options['workers'],
+            poll_interval=options['poll_interval']
+        )
+        pool.start()
+        self.stdout.write(
+            self.style.SUCCESS(f"Consultation workers running ({options['workers']} threads). Press Ctrl+C to stop.")
+        )
+
+        try:
+            pool.join()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('Stopping consultation workers...'))
+            pool.stop(timeout=5)
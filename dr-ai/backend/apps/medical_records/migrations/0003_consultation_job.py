@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-17 19:49
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0002_convert_medical_history'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultationJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('question', models.TextField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('error', models.TextField(blank=True, default='')),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('consultation', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='job', to='medical_records.aiconsultation')),
+                ('medical_record', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consultation_jobs', to='medical_records.medicalrecord')),
+            ],
+            options={
+                'verbose_name': 'Consultation Job',
+                'verbose_name_plural': 'Consultation Jobs',
+                'db_table': 'ai_consultation_jobs',
+                'ordering': ['created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='ai_consulta_status_1ed699_idx')],
+            },
+        ),
+    ]
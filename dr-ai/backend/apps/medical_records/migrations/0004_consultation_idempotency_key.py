@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-17 19:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0003_consultation_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiconsultation',
+            name='idempotency_key',
+            field=models.CharField(blank=True, db_index=True, help_text='Client-supplied key used to replay retried requests', max_length=64, null=True),
+        ),
+    ]
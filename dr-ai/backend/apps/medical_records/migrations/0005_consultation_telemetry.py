@@ -0,0 +1,41 @@
+# Generated by Django 5.0 on 2026-10-17 20:26
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0004_consultation_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultationTelemetry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('model', models.CharField(blank=True, default='', max_length=100)),
+                ('question_type', models.CharField(blank=True, default='', max_length=20)),
+                ('done_reason', models.CharField(blank=True, default='', max_length=20)),
+                ('num_predict', models.IntegerField(blank=True, null=True)),
+                ('prompt_tokens', models.PositiveIntegerField(blank=True, null=True)),
+                ('eval_tokens', models.PositiveIntegerField(default=0)),
+                ('load_seconds', models.FloatField(blank=True, null=True)),
+                ('prompt_eval_seconds', models.FloatField(blank=True, null=True)),
+                ('eval_seconds', models.FloatField(blank=True, null=True)),
+                ('first_token_seconds', models.FloatField(blank=True, null=True)),
+                ('total_seconds', models.FloatField(blank=True, null=True)),
+                ('tokens_per_second', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('consultation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='telemetry', to='medical_records.aiconsultation')),
+            ],
+            options={
+                'verbose_name': 'Consultation Telemetry',
+                'verbose_name_plural': 'Consultation Telemetry',
+                'db_table': 'ai_consultation_telemetry',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
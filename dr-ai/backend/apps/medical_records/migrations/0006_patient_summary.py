@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-17 20:34
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0005_consultation_telemetry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSummary',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('record_version', models.DateTimeField()),
+                ('diagnosis', models.TextField()),
+                ('treatment_plan', models.TextField()),
+                ('model', models.CharField(blank=True, default='', max_length=100)),
+                ('generation_seconds', models.FloatField(blank=True, null=True)),
+                ('generated_at', models.DateTimeField(auto_now=True)),
+                ('medical_record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ai_summary', to='medical_records.medicalrecord')),
+            ],
+            options={
+                'verbose_name': 'Patient Summary',
+                'verbose_name_plural': 'Patient Summaries',
+                'db_table': 'ai_patient_summaries',
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0 on 2026-10-17 20:38
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('medical_records', '0006_patient_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationMemory',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('summary', models.TextField(blank=True, default='')),
+                ('summarised_turns', models.PositiveIntegerField(default=0)),
+                ('summarised_through', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('medical_record', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_memory', to='medical_records.medicalrecord')),
+            ],
+            options={
+                'verbose_name': 'Conversation Memory',
+                'verbose_name_plural': 'Conversation Memories',
+                'db_table': 'ai_conversation_memories',
+            },
+        ),
+    ]
@@ -49,6 +49,13 @@ class AIConsultation(models.Model):
     question = models.TextField()
     diagnosis = models.TextField()
     treatment_plan = models.TextField()
+    idempotency_key = models.CharField(
+        max_length=64,
+        blank=True,
+        null=True,
+        db_index=True,
+        help_text='Client-supplied key used to replay retried requests'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -58,4 +65,142 @@ class AIConsultation(models.Model):
         ordering = ['-created_at']
 
     def __str__(self):
-        return f"Consultation for {self.medical_record.full_name} at {self.created_at}"
\ No newline at end of file
+        return f"Consultation for {self.medical_record.full_name} at {self.created_at}"
+
+class ConsultationTelemetry(models.Model):
+    """
+    Where the LLM generation behind a consultation spent its time, as
+    reported by Ollama (model load, prompt prefill, token generation)
+    plus the time to first token seen by the client
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    consultation = models.OneToOneField(
+        AIConsultation,
+        on_delete=models.CASCADE,
+        related_name='telemetry'
+    )
+    model = models.CharField(max_length=100, blank=True, default='')
+    question_type = models.CharField(max_length=20, blank=True, default='')
+    done_reason = models.CharField(max_length=20, blank=True, default='')
+    num_predict = models.IntegerField(null=True, blank=True)
+    prompt_tokens = models.PositiveIntegerField(null=True, blank=True)
+    eval_tokens = models.PositiveIntegerField(default=0)
+    load_seconds = models.FloatField(null=True, blank=True)
+    prompt_eval_seconds = models.FloatField(null=True, blank=True)
+    eval_seconds = models.FloatField(null=True, blank=True)
+    first_token_seconds = models.FloatField(null=True, blank=True)
+    total_seconds = models.FloatField(null=True, blank=True)
+    tokens_per_second = models.FloatField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'ai_consultation_telemetry'
+        verbose_name = "Consultation Telemetry"
+        verbose_name_plural = "Consultation Telemetry"
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Telemetry for consultation {self.consultation_id}"
+
+class PatientSummary(models.Model):
+    """
+    Standing AI summary of a patient's risks (allergies, chronic
+    conditions, medications, history), precomputed in the background and
+    valid for the record version it was generated from
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    medical_record = models.OneToOneField(
+        MedicalRecord,
+        on_delete=models.CASCADE,
+        related_name='ai_summary'
+    )
+    # MedicalRecord.updated_at the summary was generated from
+    record_version = models.DateTimeField()
+    diagnosis = models.TextField()
+    treatment_plan = models.TextField()
+    model = models.CharField(max_length=100, blank=True, default='')
+    generation_seconds = models.FloatField(null=True, blank=True)
+    generated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ai_patient_summaries'
+        verbose_name = "Patient Summary"
+        verbose_name_plural = "Patient Summaries"
+
+    def __str__(self):
+        return f"AI summary for {self.medical_record.full_name}"
+
+    @property
+    def is_current(self) -> bool:
+        return self.record_version == self.medical_record.updated_at
+
+class ConversationMemory(models.Model):
+    """
+    Compact summary of the older turns of a patient's current conversation
+    (the recent turns are read verbatim from AIConsultation), folded in
+    incrementally up to `summarised_through`
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    medical_record = models.OneToOneField(
+        MedicalRecord,
+        on_delete=models.CASCADE,
+        related_name='conversation_memory'
+    )
+    summary = models.TextField(blank=True, default='')
+    summarised_turns = models.PositiveIntegerField(default=0)
+    # created_at of the last consultation folded into the summary
+    summarised_through = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ai_conversation_memories'
+        verbose_name = "Conversation Memory"
+        verbose_name_plural = "Conversation Memories"
+
+    def __str__(self):
+        return f"Conversation memory for {self.medical_record.full_name}"
+
+class ConsultationJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    medical_record = models.ForeignKey(
+        MedicalRecord,
+        on_delete=models.CASCADE,
+        related_name='consultation_jobs'
+    )
+    question = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    consultation = models.OneToOneField(
+        AIConsultation,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='job'
+    )
+    error = models.TextField(blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'ai_consultation_jobs'
+        verbose_name = "Consultation Job"
+        verbose_name_plural = "Consultation Jobs"
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Consultation job {self.id} ({self.status})"
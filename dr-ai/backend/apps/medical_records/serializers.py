@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import MedicalRecord, AIConsultation
+from .models import MedicalRecord, AIConsultation, ConsultationJob, PatientSummary
 
 class MedicalRecordSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,5 +10,20 @@ class MedicalRecordSerializer(serializers.ModelSerializer):
 class AIConsultationSerializer(serializers.ModelSerializer):
     class Meta:
         model = AIConsultation
-        fields = '__all__'
-        read_only_fields = ('id', 'created_at')
\ No newline at end of file
+        exclude = ('idempotency_key',)
+        read_only_fields = ('id', 'created_at')
+
+class ConsultationJobSerializer(serializers.ModelSerializer):
+    consultation = AIConsultationSerializer(read_only=True)
+
+    class Meta:
+        model = ConsultationJob
+        fields = ('id', 'status', 'question', 'consultation', 'error',
+                  'created_at', 'started_at', 'finished_at')
+        read_only_fields = fields
+
+class PatientSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PatientSummary
+        fields = ('diagnosis', 'treatment_plan', 'model', 'record_version', 'generated_at')
+        read_only_fields = fields
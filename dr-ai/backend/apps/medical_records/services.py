@@ -0,0 +1,597 @@
+import threading
+from datetime import timedelta
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Tuple
+from .models import MedicalRecord, AIConsultation, ConsultationTelemetry, ConversationMemory
+from .serializers import MedicalRecordSerializer
+from .summaries import STATE_FRESH, is_summary_question, summary_for
+from django.db import IntegrityError
+from django.utils import timezone
+from ..ai_service.admission import AdmissionController, PRIORITY_ROUTINE
+from ..ai_service.cache import response_cache, record_fingerprint
+from ..ai_service.conf import ai_setting
+from ..ai_service.conversation import ConversationContext, ConversationWindow, Turn, is_follow_up
+from ..ai_service.generation_control import OutputLengthPolicy
+from ..ai_service.hedging import HedgePolicy
+from ..ai_service.lookup import answer_lookup
+from ..ai_service.metrics import metrics
+from ..ai_service.ollama_client import OllamaClient
+from ..ai_service.retrieval import HistoryRetriever
+from ..ai_service.routing import ModelRouter
+from ..ai_service.session_cache import SessionContextCache
+from ..ai_service.singleflight import SingleFlight
+from ..ai_service.warmup import ModelWarmer
+
+
+def build_history_retriever() -> Optional[HistoryRetriever]:
+    """
+    Shared by every client: the index depends only on the record. The
+    optional 'hashing' embedder needs numpy.
+    """
+    if not ai_setting('HISTORY_RETRIEVAL_ENABLED'):
+        return None
+    embedder = None
+    if ai_setting('HISTORY_RETRIEVAL_EMBEDDER') == 'hashing':
+        from ..ai_service.embeddings import HashingEmbedder
+        embedder = HashingEmbedder(ai_setting('HISTORY_RETRIEVAL_DIM'))
+    return HistoryRetriever(
+        min_entries=ai_setting('HISTORY_RETRIEVAL_MIN_ENTRIES'),
+        top_k=ai_setting('HISTORY_RETRIEVAL_TOP_K'),
+        recent=ai_setting('HISTORY_RETRIEVAL_RECENT'),
+        embedder=embedder,
+        embedding_weight=ai_setting('HISTORY_RETRIEVAL_EMBEDDING_WEIGHT'),
+        max_records=ai_setting('HISTORY_RETRIEVAL_MAX_RECORDS')
+    )
+
+
+# Long medical histories: only recent and question-relevant entries reach the prompt
+history_retriever = build_history_retriever()
+
+
+def build_ollama_client(**overrides) -> OllamaClient:
+    """
+    An OllamaClient configured from AI_SERVICE; `overrides` replace
+    constructor arguments (the router passes model and options)
+    """
+    return OllamaClient(**{**_client_settings(), **overrides})
+
+
+def _client_settings() -> Dict[str, Any]:
+    # Built per client: caches and policies hold per-model state
+    return dict(
+        base_url=ai_setting('OLLAMA_BASE_URL'),
+        model=ai_setting('OLLAMA_MODEL'),
+        connect_timeout=ai_setting('OLLAMA_CONNECT_TIMEOUT'),
+        read_timeout=ai_setting('OLLAMA_READ_TIMEOUT'),
+        pool_size=ai_setting('OLLAMA_POOL_SIZE'),
+        backend_urls=ai_setting('OLLAMA_BACKENDS'),
+        breaker_options={
+            'failure_threshold': ai_setting('OLLAMA_BACKEND_FAILURE_THRESHOLD'),
+            'latency_slo': ai_setting('BREAKER_LATENCY_SLO'),
+            'slo_breaches': ai_setting('BREAKER_SLO_BREACHES'),
+            'reset_timeout': ai_setting('BREAKER_RESET_TIMEOUT'),
+        },
+        health_interval=ai_setting('OLLAMA_HEALTH_INTERVAL'),
+        health_timeout=ai_setting('OLLAMA_HEALTH_TIMEOUT'),
+        prompt_token_budget=ai_setting('PROMPT_TOKEN_BUDGET'),
+        keep_alive=ai_setting('OLLAMA_KEEP_ALIVE'),
+        output_format=ai_setting('OLLAMA_OUTPUT_FORMAT'),
+        structured_schema=ai_setting('STRUCTURED_OUTPUT_SCHEMA'),
+        early_stop=ai_setting('GENERATION_EARLY_STOP'),
+        length_policy=OutputLengthPolicy(
+            maximum=ai_setting('GENERATION_NUM_PREDICT_MAX'),
+            minimum=ai_setting('GENERATION_NUM_PREDICT_MIN'),
+            headroom=ai_setting('GENERATION_NUM_PREDICT_HEADROOM'),
+            min_samples=ai_setting('GENERATION_NUM_PREDICT_MIN_SAMPLES')
+        ) if ai_setting('GENERATION_ADAPTIVE_NUM_PREDICT') else None,
+        hedge_policy=HedgePolicy(
+            percentile=ai_setting('HEDGE_PERCENTILE'),
+            min_delay=ai_setting('HEDGE_MIN_DELAY'),
+            default_delay=ai_setting('HEDGE_DEFAULT_DELAY')
+        ) if ai_setting('HEDGE_ENABLED') else None,
+        session_cache=SessionContextCache(
+            max_sessions=ai_setting('PROMPT_SESSION_CACHE_MAX'),
+            ttl=ai_setting('PROMPT_SESSION_CACHE_TTL')
+        ) if ai_setting('PROMPT_SESSION_CACHE_ENABLED') else None,
+        history_retriever=history_retriever
+    )
+
+
+ollama_client = build_ollama_client()
+
+# Simple look-ups go to a smaller model, everything else to OLLAMA_MODEL
+model_router = ModelRouter(
+    ollama_client,
+    routes=ai_setting('MODEL_ROUTES'),
+    # Routed clients size their answers from the route's num_predict
+    client_factory=lambda **overrides: build_ollama_client(length_policy=None, **overrides),
+    enabled=ai_setting('MODEL_ROUTING_ENABLED')
+)
+
+# Loads every routed model ahead of its first consultation and keeps it resident
+model_warmer = ModelWarmer(
+    ollama_client, refresh_interval=ai_setting('WARMUP_REFRESH_INTERVAL'),
+    clients=lambda: model_router.clients(create=True)
+)
+
+# Bounds concurrent LLM generations; cache hits never take a slot
+consultation_admission = AdmissionController(
+    'consultation_admission',
+    max_concurrent=ai_setting('ADMISSION_MAX_CONCURRENT'),
+    max_queue=ai_setting('ADMISSION_MAX_QUEUE'),
+    queue_timeout=ai_setting('ADMISSION_QUEUE_TIMEOUT'),
+    emergency_reserved=ai_setting('ADMISSION_EMERGENCY_RESERVED'),
+    starvation_timeout=ai_setting('ADMISSION_STARVATION_TIMEOUT')
+)
+
+# Follow-ups see a compact summary of older turns plus the last few verbatim
+conversation_window = ConversationWindow(
+    max_turns=ai_setting('CONVERSATION_MAX_TURNS'),
+    max_tokens=ai_setting('CONVERSATION_MAX_TOKENS'),
+    summary_tokens=ai_setting('CONVERSATION_SUMMARY_TOKENS')
+)
+# Most recent consultations read when looking for the current conversation
+CONVERSATION_FETCH_LIMIT = 32
+
+SOURCE_LLM = 'llm'
+SOURCE_CACHE = 'cache'
+SOURCE_SEMANTIC_CACHE = 'semantic_cache'
+SOURCE_COALESCED = 'coalesced'
+SOURCE_IDEMPOTENT_REPLAY = 'idempotent_replay'
+SOURCE_LOOKUP = 'record_lookup'
+SOURCE_SUMMARY = 'patient_summary'
+# Answers served from an earlier generation; record look-ups never ran one
+CACHED_SOURCES = (SOURCE_CACHE, SOURCE_SEMANTIC_CACHE, SOURCE_COALESCED, SOURCE_IDEMPOTENT_REPLAY, SOURCE_SUMMARY)
+
+# Identical questions about the same record version share one generation
+consultation_flights = SingleFlight('consultation_singleflight')
+
+
+class ConsultationCancelled(Exception):
+    """
+    The caller no longer wants the answer (a batch whose client went away);
+    raised before a generation starts, never during one
+    """
+
+@dataclass
+class ConsultationOutcome:
+    consultation: AIConsultation
+    source: str = SOURCE_LLM
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def cached(self) -> bool:
+        return self.source in CACHED_SOURCES
+
+
+@dataclass
+class ConsultationAnswer:
+    """
+    A validated response not yet persisted, with what is needed to index
+    it in the semantic cache once it has been saved
+    """
+    response: Dict[str, Any]
+    source: str = SOURCE_LLM
+    meta: Dict[str, Any] = field(default_factory=dict)
+    semantic_key: Optional[Tuple[str, Any]] = None
+
+
+def validate_response(response: Dict[str, Any]):
+    if not isinstance(response, dict) or 'diagnosis' not in response or 'treatment_plan' not in response:
+        raise ValueError(f"Invalid AI response format: {response}")
+
+
+def save_consultation(record: MedicalRecord, question: str, response: Dict[str, Any],
+                      idempotency_key: Optional[str] = None) -> AIConsultation:
+    """
+    Validate a parsed AI response and persist it as an AIConsultation
+    """
+    validate_response(response)
+
+    return AIConsultation.objects.create(
+        medical_record=record,
+        question=question,
+        diagnosis=response['diagnosis'],
+        treatment_plan=response['treatment_plan'],
+        idempotency_key=idempotency_key or None
+    )
+
+
+def build_telemetry(consultation: AIConsultation,
+                    generation: Optional[Dict[str, Any]]) -> Optional[ConsultationTelemetry]:
+    """
+    Unsaved telemetry row for a consultation from its generation stats
+    (meta['generation']); None for cached answers or when disabled
+    """
+    if not generation or not ai_setting('GENERATION_TELEMETRY_STORE'):
+        return None
+    return ConsultationTelemetry(
+        consultation=consultation,
+        model=generation.get('model') or '',
+        question_type=generation.get('question_type') or '',
+        done_reason=generation.get('done_reason') or '',
+        num_predict=generation.get('num_predict'),
+        prompt_tokens=generation.get('prompt_tokens'),
+        eval_tokens=generation.get('tokens') or 0,
+        load_seconds=generation.get('load_seconds'),
+        prompt_eval_seconds=generation.get('prompt_eval_seconds'),
+        eval_seconds=generation.get('eval_seconds'),
+        first_token_seconds=generation.get('first_token_seconds'),
+        total_seconds=generation.get('total_seconds'),
+        tokens_per_second=generation.get('tokens_per_second')
+    )
+
+
+def save_telemetry(consultation: AIConsultation, generation: Optional[Dict[str, Any]]):
+    telemetry = build_telemetry(consultation, generation)
+    if telemetry is not None:
+        telemetry.save()
+
+
+def find_idempotent_consultation(record: MedicalRecord, idempotency_key: Optional[str]) -> Optional[AIConsultation]:
+    """
+    Return the consultation already created for this key within the
+    replay window, so client retries do not trigger a new generation.
+    """
+    if not idempotency_key:
+        return None
+    cutoff = timezone.now() - timedelta(seconds=ai_setting('IDEMPOTENCY_WINDOW'))
+    return (
+        AIConsultation.objects
+        .filter(medical_record=record, idempotency_key=idempotency_key, created_at__gte=cutoff)
+        .order_by('-created_at')
+        .first()
+    )
+
+
+def cached_response(record: MedicalRecord, question: str,
+                    medical_record_data: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    Return the response cache key for this record/question and the cached
+    response, if any.
+    """
+    if medical_record_data is None:
+        medical_record_data = MedicalRecordSerializer(record).data
+    key = response_cache.make_key(medical_record_data, question)
+    if not ai_setting('RESPONSE_CACHE_ENABLED'):
+        return key, None
+    return key, response_cache.get(key)
+
+
+def store_response(record: MedicalRecord, cache_key: str, response: Dict[str, Any]):
+    if ai_setting('RESPONSE_CACHE_ENABLED'):
+        response_cache.set(cache_key, record.pk, response)
+
+
+_semantic_cache = None
+_semantic_cache_lock = threading.Lock()
+
+
+def get_semantic_cache():
+    """
+    Build the semantic cache on first use so numpy and the embedder are
+    only loaded when SEMANTIC_CACHE_ENABLED is set.
+    """
+    global _semantic_cache
+    with _semantic_cache_lock:
+        if _semantic_cache is None:
+            from ..ai_service.embeddings import HashingEmbedder, OllamaEmbedder
+            from ..ai_service.semantic_cache import SemanticCache
+
+            if ai_setting('SEMANTIC_CACHE_EMBEDDER') == 'ollama':
+                embedder = OllamaEmbedder(ollama_client, ai_setting('SEMANTIC_CACHE_EMBEDDING_MODEL'))
+            else:
+                embedder = HashingEmbedder(ai_setting('SEMANTIC_CACHE_DIM'))
+
+            _semantic_cache = SemanticCache(
+                embedder,
+                threshold=ai_setting('SEMANTIC_CACHE_THRESHOLD'),
+                max_entries_per_record=ai_setting('SEMANTIC_CACHE_MAX_PER_RECORD'),
+                max_records=ai_setting('SEMANTIC_CACHE_MAX_RECORDS')
+            )
+        return _semantic_cache
+
+
+def invalidate_record_caches(record_id):
+    """
+    Forget per-record AI state held by this process (response cache
+    entries, semantic index, evaluated prompt prefix).
+    """
+    response_cache.invalidate_record(record_id)
+    if _semantic_cache is not None:
+        _semantic_cache.invalidate_record(record_id)
+    for client in model_router.clients():
+        if client.session_cache is not None:
+            client.session_cache.invalidate_record(record_id)
+
+
+def _warm_semantic_index(cache, record: MedicalRecord, fingerprint: str):
+    """
+    Rebuild a record's index from consultations created since the record
+    was last changed, so the cache survives restarts.
+    """
+    consultations = list(
+        AIConsultation.objects
+        .filter(medical_record=record, created_at__gte=record.updated_at)
+        .order_by('-created_at')
+        .values_list('id', 'question')[:ai_setting('SEMANTIC_CACHE_WARM_LIMIT')]
+    )
+    vectors = [cache.embed(question) for _, question in reversed(consultations)]
+    cache.warm(record.pk, fingerprint, vectors, [pk for pk, _ in reversed(consultations)])
+
+
+def semantic_lookup(record: MedicalRecord, fingerprint: str, question: str):
+    """
+    Return (question vector, matching prior AIConsultation or None)
+    """
+    cache = get_semantic_cache()
+    if not cache.has_index(record.pk, fingerprint):
+        _warm_semantic_index(cache, record, fingerprint)
+
+    vector = cache.embed(question)
+    match = cache.lookup(record.pk, fingerprint, vector)
+    if match is None:
+        return vector, None
+
+    prior = AIConsultation.objects.filter(pk=match[0], medical_record=record).first()
+    return vector, prior
+
+
+def generate_consultation(record: MedicalRecord, question: str, idempotency_key: Optional[str] = None,
+                          priority: str = PRIORITY_ROUTINE, follow_up: Optional[bool] = None) -> ConsultationOutcome:
+    """
+    Answer a consultation question and persist the result.
+
+    Retries carrying an idempotency key seen within the replay window get
+    the existing consultation back. Concurrent identical questions about
+    the same record version are coalesced into a single generation whose
+    AIConsultation is returned to every caller; a caller that sent its own
+    idempotency key gets a copy saved under that key, so its retries
+    replay too. Shared by the synchronous
+    view and the job workers; `priority` is the admission class of the
+    generation and `follow_up` the client's follow-up flag, if it sent one.
+    """
+    prior = find_idempotent_consultation(record, idempotency_key)
+    if prior is not None:
+        metrics.incr('consultation_idempotent_replays')
+        return ConsultationOutcome(consultation=prior, source=SOURCE_IDEMPOTENT_REPLAY)
+
+    medical_record_data = MedicalRecordSerializer(record).data
+    cache_key = response_cache.make_key(medical_record_data, question)
+
+    # A flagged follow-up is answered from the conversation, so it must not
+    # share a generation with the same question asked on its own
+    outcome, shared = consultation_flights.do(
+        cache_key if follow_up is None else f'{cache_key}:{int(follow_up)}',
+        lambda: _answer_and_save(record, question, medical_record_data, idempotency_key, priority, follow_up)
+    )
+    if shared:
+        consultation = outcome.consultation
+        if idempotency_key and idempotency_key != consultation.idempotency_key:
+            consultation = save_consultation(record, question, {
+                'diagnosis': consultation.diagnosis, 'treatment_plan': consultation.treatment_plan
+            }, idempotency_key)
+        return ConsultationOutcome(consultation=consultation, source=SOURCE_COALESCED, meta=outcome.meta)
+    return outcome
+
+
+def _answer_and_save(record: MedicalRecord, question: str, medical_record_data: Dict[str, Any],
+                     idempotency_key: Optional[str], priority: str = PRIORITY_ROUTINE,
+                     follow_up: Optional[bool] = None) -> ConsultationOutcome:
+    """
+    Answer a question (caches first, then the LLM) and persist the answer
+    """
+    answer = answer_question(record, question, medical_record_data, priority, follow_up)
+    consultation = save_consultation(record, question, answer.response, idempotency_key)
+    save_telemetry(consultation, answer.meta.get('generation'))
+    remember_answer(record, answer, consultation)
+    return ConsultationOutcome(consultation=consultation, source=answer.source, meta=answer.meta)
+
+
+def lookup_answer(question: str, medical_record_data: Dict[str, Any]) -> Optional[ConsultationAnswer]:
+    """
+    Answer a pure record look-up from the record's fields, or None when
+    the question needs the LLM. Counts the generation work this avoids,
+    estimated from the recent average generation.
+    """
+    if not ai_setting('LOOKUP_FAST_PATH_ENABLED'):
+        return None
+    match = answer_lookup(medical_record_data, question, ai_setting('LOOKUP_FAST_PATH_THRESHOLD'))
+    if match.response is None:
+        if match.intents:
+            metrics.incr('lookup_fast_path', outcome='fell_through')
+        return None
+
+    metrics.incr('lookup_fast_path', outcome='answered')
+    for intent in match.intents:
+        metrics.incr('lookup_answers', intent=intent)
+    avoided_seconds = metrics.average('llm_generation_seconds', model=ollama_client.model)
+    avoided_tokens = metrics.average('llm_eval_tokens', format=ollama_client.output_format)
+    if avoided_seconds is not None:
+        metrics.incr('lookup_llm_seconds_avoided', avoided_seconds)
+    if avoided_tokens is not None:
+        metrics.incr('lookup_llm_tokens_avoided', avoided_tokens)
+    return ConsultationAnswer(response=match.response, source=SOURCE_LOOKUP, meta={'lookup': match.to_dict()})
+
+
+def summary_answer(record: MedicalRecord, question: str) -> Optional[ConsultationAnswer]:
+    """
+    The precomputed patient summary for "summarize this patient's risks"
+    questions, or None when there is no summary for the record's current
+    version (one is then queued) and the question needs the LLM
+    """
+    if not ai_setting('PATIENT_SUMMARY_ENABLED') or not is_summary_question(question):
+        return None
+    summary, state = summary_for(record)
+    if state != STATE_FRESH:
+        return None
+    return ConsultationAnswer(
+        response={'diagnosis': summary.diagnosis, 'treatment_plan': summary.treatment_plan},
+        source=SOURCE_SUMMARY,
+        meta={'summary': {'model': summary.model, 'generated_at': summary.generated_at.isoformat()}}
+    )
+
+
+def _turn(consultation: AIConsultation) -> Turn:
+    return Turn(consultation.question, consultation.diagnosis, consultation.treatment_plan)
+
+
+def _save_conversation_memory(record: MedicalRecord, memory: Optional[ConversationMemory], **fields):
+    """
+    Store a folded summary. The update is conditional on the summary not
+    having moved since it was read, so concurrent follow-ups cannot fold
+    the same turns twice; the loser's prompt still uses its own fold.
+    """
+    if memory is None:
+        try:
+            ConversationMemory.objects.create(medical_record=record, **fields)
+            return
+        except IntegrityError:
+            memory = ConversationMemory.objects.filter(medical_record=record).first()
+            if memory is None:
+                return
+    ConversationMemory.objects.filter(
+        pk=memory.pk, summarised_through=memory.summarised_through
+    ).update(updated_at=timezone.now(), **fields)
+
+
+def conversation_context(record: MedicalRecord, question: str,
+                         follow_up: Optional[bool] = None) -> Optional[ConversationContext]:
+    """
+    The conversation so far for a follow-up question: the stored summary
+    of older turns plus the last CONVERSATION_MAX_TURNS consultations
+    verbatim. Turns that have left the verbatim window are folded into the
+    summary first. The conversation is the run of consultations with no
+    gap longer than CONVERSATION_IDLE_TIMEOUT. None for standalone
+    questions (see is_follow_up; `follow_up` is the client's flag) or when
+    there is no recent conversation.
+    """
+    if not ai_setting('CONVERSATION_MEMORY_ENABLED') or not is_follow_up(question, follow_up):
+        return None
+
+    idle = timedelta(seconds=ai_setting('CONVERSATION_IDLE_TIMEOUT'))
+    recent = (
+        AIConsultation.objects
+        .filter(medical_record=record)
+        .order_by('-created_at')
+        .only('question', 'diagnosis', 'treatment_plan', 'created_at')[:CONVERSATION_FETCH_LIMIT]
+    )
+    session = []
+    previous = timezone.now()
+    for consultation in recent:
+        if previous - consultation.created_at > idle:
+            break
+        session.append(consultation)
+        previous = consultation.created_at
+    if not session:
+        return None
+    session.reverse()
+
+    # A summary left over from an earlier conversation is discarded
+    memory = ConversationMemory.objects.filter(medical_record=record).first()
+    summary, summarised, through = '', 0, None
+    if memory is not None and memory.summarised_through is not None \
+            and memory.summarised_through >= session[0].created_at - idle:
+        summary, summarised, through = memory.summary, memory.summarised_turns, memory.summarised_through
+
+    pending = [consultation for consultation in session if through is None or consultation.created_at > through]
+    folding, verbatim = conversation_window.split(pending)
+    if folding:
+        summary = conversation_window.fold(summary, [_turn(consultation) for consultation in folding])
+        summarised += len(folding)
+        _save_conversation_memory(
+            record, memory, summary=summary, summarised_turns=summarised,
+            summarised_through=folding[-1].created_at
+        )
+        metrics.incr('conversation_turns_folded', len(folding))
+
+    context = conversation_window.render(summary, [_turn(consultation) for consultation in verbatim], summarised)
+    context.folded = len(folding)
+    metrics.incr('conversation_follow_ups')
+    metrics.histogram(
+        'conversation_context_tokens', buckets=(64, 128, 256, 512, 768, 1024, float('inf'))
+    ).observe(context.tokens)
+    return context
+
+
+def _generate(record: MedicalRecord, question: str, medical_record_data: Dict[str, Any], priority: str,
+              conversation: Optional[ConversationContext] = None,
+              cancelled: Optional[threading.Event] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Admit and run one LLM generation; returns the validated response and its meta.
+    Raises ConsultationCancelled if `cancelled` is set before the generation
+    starts, including while the request waited in the admission queue.
+    """
+    if cancelled is not None and cancelled.is_set():
+        raise ConsultationCancelled()
+    # Raises AdmissionRejected when the queue is full or the wait times out
+    with consultation_admission.admit(priority=priority):
+        if cancelled is not None and cancelled.is_set():
+            raise ConsultationCancelled()
+        response = model_router.generate_medical_response(
+            medical_record=medical_record_data,
+            question=question,
+            session_key=record.pk,
+            conversation=conversation.text if conversation is not None else None
+        )
+    meta = response.pop('meta', {})
+    validate_response(response)
+    if conversation is not None:
+        meta['conversation'] = conversation.to_dict()
+    return response, meta
+
+
+def answer_question(record: MedicalRecord, question: str, medical_record_data: Dict[str, Any],
+                    priority: str = PRIORITY_ROUTINE, follow_up: Optional[bool] = None,
+                    cancelled: Optional[threading.Event] = None) -> ConsultationAnswer:
+    """
+    Try a direct record look-up, the precomputed patient summary, the
+    exact-match cache, then the optional semantic cache, then a full LLM
+    generation. Follow-ups in an ongoing conversation (see
+    conversation_context; `follow_up` is the client's flag, False never
+    treats a question as one) skip the semantic cache and are generated
+    with the conversation so far; an exact repeat of an earlier standalone
+    question is still served from the cache. Only the conversation summary
+    is written to the database. Setting `cancelled` stops the question
+    from taking an admission slot (see _generate).
+    """
+    answer = lookup_answer(question, medical_record_data) or summary_answer(record, question)
+    if answer is not None:
+        return answer
+
+    cache_key, response = cached_response(record, question, medical_record_data)
+    if response is not None:
+        return ConsultationAnswer(response=response, source=SOURCE_CACHE)
+
+    # A follow-up's answer depends on the conversation, not just the question,
+    # so it is neither matched semantically nor cached
+    conversation = conversation_context(record, question, follow_up)
+    if conversation is not None:
+        response, meta = _generate(record, question, medical_record_data, priority, conversation, cancelled)
+        return ConsultationAnswer(response=response, source=SOURCE_LLM, meta=meta)
+
+    source = SOURCE_SEMANTIC_CACHE
+    semantic_key = None
+    if ai_setting('SEMANTIC_CACHE_ENABLED'):
+        fingerprint = record_fingerprint(medical_record_data)
+        vector, prior = semantic_lookup(record, fingerprint, question)
+        semantic_key = (fingerprint, vector)
+        if prior is not None:
+            response = {'diagnosis': prior.diagnosis, 'treatment_plan': prior.treatment_plan}
+
+    meta = {}
+    if response is None:
+        response, meta = _generate(record, question, medical_record_data, priority, cancelled=cancelled)
+        store_response(record, cache_key, response)
+        source = SOURCE_LLM
+
+    return ConsultationAnswer(response=response, source=source, meta=meta, semantic_key=semantic_key)
+
+
+def remember_answer(record: MedicalRecord, answer: ConsultationAnswer, consultation: AIConsultation):
+    """
+    Index a saved consultation in the semantic cache
+    """
+    if answer.semantic_key is not None:
+        fingerprint, vector = answer.semantic_key
+        get_semantic_cache().add(record.pk, fingerprint, vector, consultation.pk)
@@ -0,0 +1,56 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import MedicalRecord
+from ..ai_service.conf import ai_setting
+from ..ai_service.prompt_builder import history_entries
+from ..ai_service.warmup import serving_process
+
+
+@receiver(post_save, sender=MedicalRecord)
+@receiver(post_delete, sender=MedicalRecord)
+def invalidate_ai_caches(sender, instance, **kwargs):
+    """
+    Drop cached AI responses and prompt state for a record as soon as it changes
+    """
+    # Imported lazily: services builds the Ollama client on import
+    from .services import invalidate_record_caches
+
+    invalidate_record_caches(instance.pk)
+
+
+@receiver(post_save, sender=MedicalRecord)
+def schedule_patient_summary(sender, instance, raw=False, **kwargs):
+    """
+    Regenerate the standing patient summary off the request path once the
+    change is committed. Other management commands (loaddata, data
+    scripts) leave it to be regenerated lazily when next served.
+    """
+    if raw or not ai_setting('PATIENT_SUMMARY_ENABLED') or not serving_process():
+        return
+    from .summaries import get_summary_scheduler
+
+    transaction.on_commit(lambda: get_summary_scheduler().schedule(instance.pk))
+
+
+@receiver(post_save, sender=MedicalRecord)
+def reindex_medical_history(sender, instance, raw=False, **kwargs):
+    """
+    Bring the record's history retrieval index up to date; only entries
+    added or edited since the last build are analysed
+    """
+    from .services import history_retriever
+
+    if raw or history_retriever is None:
+        return
+    transaction.on_commit(
+        lambda: history_retriever.refresh(instance.pk, history_entries(instance.medical_history))
+    )
+
+
+@receiver(post_delete, sender=MedicalRecord)
+def drop_history_index(sender, instance, **kwargs):
+    from .services import history_retriever
+
+    if history_retriever is not None:
+        history_retriever.invalidate_record(instance.pk)
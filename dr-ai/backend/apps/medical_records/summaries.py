@@ -0,0 +1,263 @@
+import re
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+from django.db import IntegrityError, close_old_connections, connection
+from django.utils import timezone
+from .models import MedicalRecord, PatientSummary
+from .serializers import MedicalRecordSerializer, PatientSummarySerializer
+from ..ai_service.admission import AdmissionRejected, PRIORITY_ROUTINE
+from ..ai_service.conf import ai_setting
+from ..ai_service.metrics import metrics
+from ..utils.logger import setup_logger
+
+logger = setup_logger('patient_summaries')
+
+SUMMARY_QUESTION = (
+    "Summarize this patient's key clinical risks from the record: allergies, chronic conditions, "
+    "current medications and relevant medical history, including interactions or contraindications "
+    "a treating clinician must know about."
+)
+
+STATE_FRESH = 'fresh'
+STATE_STALE = 'stale'
+STATE_MISSING = 'missing'
+
+# "summarize this patient", "patient overview", "what are the key risks"
+_SUMMARY_REQUEST = re.compile(
+    r'\b(?:summar(?:y|ise|ize)|overview|risk profile|(?:main|key|major|biggest) (?:risks|concerns))\b',
+    re.IGNORECASE
+)
+# Risks of something specific need a generation of their own
+_SPECIFIC = re.compile(
+    r'\b(?:if|with|before|after|during|starting|taking|stopping|adding|switching|surgery|procedure|'
+    r'pregnan\w*|travel\w*|dose|dosing|vaccin\w*)\b',
+    re.IGNORECASE
+)
+SUMMARY_QUESTION_WORDS = 12
+
+
+def is_summary_question(question: str) -> bool:
+    """
+    Whether a question asks for the patient's overall risk summary, which
+    the precomputed summary answers
+    """
+    question = (question or '').strip()
+    return (len(question.split()) <= SUMMARY_QUESTION_WORDS and bool(_SUMMARY_REQUEST.search(question))
+            and not _SPECIFIC.search(question))
+
+
+def refresh_summary(record_id, force: bool = False) -> Optional[float]:
+    """
+    Generate and store the summary for a record's current version unless
+    it is already current. Returns the seconds to wait before retrying
+    when no generation slot was free, otherwise None.
+    """
+    # Imported lazily: services builds the Ollama client on import
+    from .services import consultation_admission, ollama_client, validate_response
+
+    record = MedicalRecord.objects.filter(pk=record_id).first()
+    if record is None:
+        return None
+    summary = PatientSummary.objects.filter(medical_record=record).only('record_version').first()
+    if summary is not None and summary.record_version == record.updated_at and not force:
+        metrics.incr('patient_summary_generations', outcome='current')
+        return None
+
+    started = time.perf_counter()
+    try:
+        # Background work: interactive consultations go first
+        with consultation_admission.admit(priority=PRIORITY_ROUTINE):
+            response = ollama_client.generate_medical_response(
+                medical_record=MedicalRecordSerializer(record).data,
+                question=SUMMARY_QUESTION,
+                session_key=record.pk
+            )
+    except AdmissionRejected as rejection:
+        metrics.incr('patient_summary_generations', outcome='rejected')
+        return rejection.retry_after
+    seconds = time.perf_counter() - started
+
+    meta = response.pop('meta', {})
+    validate_response(response)
+    fields = {
+        'record_version': record.updated_at,
+        'diagnosis': response['diagnosis'],
+        'treatment_plan': response['treatment_plan'],
+        'model': (meta.get('generation') or {}).get('model') or ollama_client.model,
+        'generation_seconds': seconds,
+        'generated_at': timezone.now(),
+    }
+    # Single-statement writes: a read-then-write transaction (update_or_create)
+    # fails at once on SQLite when a request thread is writing
+    if not PatientSummary.objects.filter(medical_record=record).update(**fields):
+        try:
+            PatientSummary.objects.create(medical_record=record, **fields)
+        except IntegrityError:
+            PatientSummary.objects.filter(medical_record=record).update(**fields)
+    metrics.incr('patient_summary_generations', outcome='ok')
+    metrics.observe('patient_summary_generation_seconds', seconds)
+    logger.info(f"Summarised record {record.nfc_id} (version {record.updated_at.isoformat()}) in {seconds:.2f}s")
+    return None
+
+
+class SummaryScheduler:
+    """
+    Debounced background regeneration of patient summaries on a bounded
+    pool of daemon threads.
+
+    schedule() pushes a record's due time `debounce` seconds out, so a
+    burst of saves costs one generation after the last of them. At most
+    `max_pending` records wait; requests beyond that are dropped and
+    picked up lazily the next time the stale summary is served. A record
+    is never generated by two workers at once: a save during its
+    generation queues another run once it finishes.
+    """
+
+    def __init__(self, workers: int, debounce: float, max_pending: int):
+        self.workers = workers
+        self.debounce = debounce
+        self.max_pending = max_pending
+        self._due: Dict[Any, float] = {}
+        self._running = set()
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f'summary-worker-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            logger.info(f"Started {self.workers} patient summary workers")
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def schedule(self, record_id, delay: Optional[float] = None, debounce: bool = True) -> bool:
+        """
+        Queue a record for regeneration after `delay` seconds (default
+        `debounce`). With debounce=False an already queued record keeps
+        its due time, so lazy requests never postpone a pending run.
+        """
+        self.start()
+        due = time.monotonic() + (self.debounce if delay is None else delay)
+        with self._cond:
+            if record_id in self._due:
+                if not debounce:
+                    return True
+            elif len(self._due) >= self.max_pending:
+                metrics.incr('patient_summary_scheduled', outcome='dropped')
+                return False
+            self._due[record_id] = due
+            self._cond.notify()
+        metrics.incr('patient_summary_scheduled', outcome='queued')
+        return True
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._due)
+
+    def _take(self):
+        with self._cond:
+            while not self._stop.is_set():
+                waiting = [(due, record_id) for record_id, due in self._due.items() if record_id not in self._running]
+                if not waiting:
+                    self._cond.wait()
+                    continue
+                due, record_id = min(waiting, key=lambda item: item[0])
+                remaining = due - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                del self._due[record_id]
+                self._running.add(record_id)
+                return record_id
+            return None
+
+    def _worker_loop(self):
+        try:
+            while not self._stop.is_set():
+                record_id = self._take()
+                if record_id is None:
+                    continue
+                retry_after = None
+                try:
+                    close_old_connections()
+                    retry_after = refresh_summary(record_id)
+                except Exception as e:
+                    metrics.incr('patient_summary_generations', outcome='error')
+                    logger.error(f"Summary for record {record_id} failed: {str(e)}", exc_info=True)
+                finally:
+                    with self._cond:
+                        self._running.discard(record_id)
+                        self._cond.notify_all()
+                if retry_after:
+                    self.schedule(record_id, delay=retry_after, debounce=False)
+        finally:
+            connection.close()
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_summary_scheduler() -> SummaryScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = SummaryScheduler(
+                workers=ai_setting('PATIENT_SUMMARY_WORKERS'),
+                debounce=ai_setting('PATIENT_SUMMARY_DEBOUNCE'),
+                max_pending=ai_setting('PATIENT_SUMMARY_MAX_PENDING')
+            )
+        return _scheduler
+
+
+def summary_for(record: MedicalRecord) -> Tuple[Optional[PatientSummary], str]:
+    """
+    The stored summary and whether it is fresh, stale or missing for the
+    record's current version. Stale and missing summaries are queued for
+    regeneration; a stale one is still returned.
+    """
+    summary = PatientSummary.objects.filter(medical_record=record).first()
+    if summary is None:
+        state = STATE_MISSING
+    elif summary.record_version == record.updated_at:
+        state = STATE_FRESH
+    else:
+        state = STATE_STALE
+    metrics.incr('patient_summary_served', state=state)
+
+    if state != STATE_FRESH:
+        get_summary_scheduler().schedule(record.pk, delay=0, debounce=False)
+    return summary, state
+
+
+def summary_payload(record: MedicalRecord) -> Dict[str, Any]:
+    """
+    The summary as served with the public record: its fields plus a
+    `status` of fresh, stale (previous version, being regenerated) or
+    missing (being generated)
+    """
+    summary, state = summary_for(record)
+    data = PatientSummarySerializer(summary).data if summary is not None else {}
+    data['status'] = state
+    return data
+
+
+def summary_stats() -> dict:
+    if _scheduler is None:
+        return {}
+    return {'patient_summary_pending': _scheduler.pending()}
+
+
+metrics.register_collector('patient_summaries', summary_stats)
@@ -0,0 +1,232 @@
+import datetime
+import threading
+import time
+from unittest import mock
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from ..ai_service.admission import AdmissionController
+from ..ai_service.http_client import OllamaError
+from ..ai_service.metrics import metrics
+from .batch import BatchConsultation
+from .jobs import claim_next_job, run_job
+from .models import AIConsultation, ConsultationJob, MedicalRecord
+from .services import (
+    ConsultationOutcome, consultation_flights, generate_consultation, SOURCE_CACHE, SOURCE_COALESCED,
+    SOURCE_IDEMPOTENT_REPLAY, SOURCE_LLM, SOURCE_LOOKUP
+)
+
+RESPONSE = {
+    'diagnosis': 'Findings are consistent with exercise-induced bronchoconstriction.',
+    'treatment_plan': '1. Spirometry with bronchodilator reversibility.',
+}
+
+
+def generated(record, question, medical_record_data, priority, conversation=None, cancelled=None):
+    return dict(RESPONSE), {}
+
+
+def conversation_of(call):
+    """
+    The conversation a mocked _generate call was given
+    """
+    return call.args[4] if len(call.args) > 4 else call.kwargs.get('conversation')
+
+
+def create_record():
+    user = get_user_model().objects.create(username='patient', email='patient@example.com')
+    return MedicalRecord.objects.create(
+        user=user, nfc_id='TEST0001', full_name='Jane Doe', date_of_birth=datetime.date(1980, 5, 1),
+        blood_type='O+', allergies='Penicillin', chronic_conditions='Asthma, Hypertension',
+        medications='Lisinopril 10mg', medical_history=['2019: Appendectomy']
+    )
+
+
+class ConsultationTestCase(TestCase):
+    """
+    A record and a client for the consultation endpoints, with the LLM
+    generation replaced by a canned answer
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.record = create_record()
+        patcher = mock.patch('apps.medical_records.services._generate', side_effect=generated)
+        self.generate = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def consult(self, question, headers=None, **data):
+        response = self.client.post(
+            f'/api/medical-records/consultation/{self.record.nfc_id}/', {'question': question, **data},
+            content_type='application/json', headers=headers or {}
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+
+class LookupConsultationTests(ConsultationTestCase):
+
+    def test_clinical_question_reaches_the_model(self):
+        data = self.consult('What is the diagnosis for new onset chest tightness?')
+        self.assertEqual(data['source'], SOURCE_LLM)
+        self.assertEqual(data['diagnosis'], RESPONSE['diagnosis'])
+        self.assertEqual(self.generate.call_count, 1)
+
+    def test_field_request_is_answered_from_the_record_and_not_reported_as_cached(self):
+        data = self.consult('What is my blood type?')
+        self.assertEqual(data['source'], SOURCE_LOOKUP)
+        self.assertFalse(data['cached'])
+        self.assertIn('O+', data['diagnosis'])
+        self.generate.assert_not_called()
+
+    def test_cached_flag(self):
+        self.assertFalse(ConsultationOutcome(consultation=None, source=SOURCE_LOOKUP).cached)
+        self.assertFalse(ConsultationOutcome(consultation=None, source=SOURCE_LLM).cached)
+        self.assertTrue(ConsultationOutcome(consultation=None, source=SOURCE_CACHE).cached)
+
+
+class ConversationCachingTests(ConsultationTestCase):
+
+    def test_repeated_question_is_served_from_cache_inside_a_conversation(self):
+        question = 'I have had chest tightness on exertion for two weeks, what is going on?'
+        self.assertEqual(self.consult(question)['source'], SOURCE_LLM)
+        self.assertEqual(self.consult('Is this rash from penicillin?')['source'], SOURCE_LLM)
+        self.assertEqual(self.consult(question)['source'], SOURCE_CACHE)
+        self.assertEqual(self.consult('Is this rash from penicillin?')['source'], SOURCE_CACHE)
+        self.assertEqual(self.generate.call_count, 2)
+        # Standalone questions carry no conversation
+        for call in self.generate.call_args_list:
+            self.assertIsNone(conversation_of(call))
+
+    def test_follow_up_is_generated_with_the_conversation(self):
+        self.consult('I have had chest tightness on exertion for two weeks, what is going on?')
+        data = self.consult('What about the dose?')
+        self.assertEqual(data['source'], SOURCE_LLM)
+        conversation = conversation_of(self.generate.call_args)
+        self.assertIn('chest tightness', conversation.text)
+
+    def test_client_flags(self):
+        self.consult('I have had chest tightness on exertion for two weeks, what is going on?')
+        self.assertEqual(self.consult('Which tests?', follow_up=True)['source'], SOURCE_LLM)
+        self.assertIsNotNone(conversation_of(self.generate.call_args))
+        self.assertEqual(self.consult('What about the dose?', follow_up=False)['source'], SOURCE_LLM)
+        self.assertIsNone(conversation_of(self.generate.call_args))
+
+
+class StreamConsultationTests(ConsultationTestCase):
+
+    def stream(self, question, headers=None):
+        response = self.client.post(
+            f'/api/medical-records/consultation/{self.record.nfc_id}/stream/', {'question': question},
+            content_type='application/json', headers=headers or {}
+        )
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_answered_requests_skip_the_response_cache(self):
+        question = 'Why does my chest feel tight when I run?'
+        headers = {'Idempotency-Key': 'stream-retry'}
+        self.consult(question, headers=headers)
+        with mock.patch('apps.medical_records.views.cached_response') as cached_response:
+            self.assertIn(SOURCE_IDEMPOTENT_REPLAY, self.stream(question, headers))
+            self.assertIn(SOURCE_LOOKUP, self.stream('What is my blood type?'))
+        cached_response.assert_not_called()
+
+
+class CoalescedIdempotencyTests(ConsultationTestCase):
+    QUESTION = 'Why does my chest feel tight when I run?'
+
+    def test_shared_result_is_stored_under_each_callers_key(self):
+        leader = generate_consultation(self.record, self.QUESTION, 'key-leader')
+        self.assertEqual(leader.source, SOURCE_LLM)
+
+        # A caller that joined the leader's generation while it was in flight
+        with mock.patch.object(consultation_flights, 'do', return_value=(leader, True)):
+            follower = generate_consultation(self.record, self.QUESTION, 'key-follower')
+        self.assertEqual(follower.source, SOURCE_COALESCED)
+        self.assertEqual(follower.consultation.idempotency_key, 'key-follower')
+        self.assertEqual(follower.consultation.diagnosis, leader.consultation.diagnosis)
+
+        # Retries of either request replay without generating again
+        for key, outcome in (('key-leader', leader), ('key-follower', follower)):
+            replay = generate_consultation(self.record, self.QUESTION, key)
+            self.assertEqual(replay.source, SOURCE_IDEMPOTENT_REPLAY)
+            self.assertEqual(replay.consultation.pk, outcome.consultation.pk)
+        self.assertEqual(self.generate.call_count, 1)
+
+    def test_follower_without_key_shares_the_leaders_consultation(self):
+        leader = generate_consultation(self.record, self.QUESTION, 'key-leader')
+        with mock.patch.object(consultation_flights, 'do', return_value=(leader, True)):
+            follower = generate_consultation(self.record, self.QUESTION)
+        self.assertEqual(follower.consultation.pk, leader.consultation.pk)
+
+
+class BatchCancellationTests(TestCase):
+    QUESTIONS = (
+        'Why does my chest feel tight when I run?',
+        'What could cause night sweats for a month?',
+        'Why do my ankles swell in the evening?',
+        'What causes a dry cough after a cold?',
+    )
+
+    def setUp(self):
+        cache.clear()
+        self.record = create_record()
+        self.release = threading.Event()
+        self.calls = []
+        self.admission = AdmissionController('test_batch_admission', max_concurrent=2, max_queue=8,
+                                             queue_timeout=10)
+        self.addCleanup(metrics._collectors.pop, 'test_batch_admission', None)
+        for target, value in (
+            ('apps.medical_records.services.consultation_admission', self.admission),
+            ('apps.medical_records.services.model_router.generate_medical_response', self.generate),
+        ):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.release.set)
+
+    def generate(self, medical_record, question, **kwargs):
+        self.calls.append(question)
+        # The first generation finishes at once, the others until released
+        if len(self.calls) > 1:
+            self.release.wait(10)
+        return dict(RESPONSE)
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_disconnect_stops_items_waiting_for_admission(self):
+        batch = BatchConsultation([(self.record.nfc_id, question) for question in self.QUESTIONS])
+        stream = batch.stream()
+        event, item = next(stream)
+        self.assertEqual((event, item['status']), ('item', 'ok'))
+
+        # Two generations are running and the last item waits for a slot
+        self.wait_for(lambda: len(self.calls) == 3 and
+                      self.admission.gauges()['test_batch_admission_queue_depth'] == 1)
+        stream.close()
+        self.release.set()
+
+        self.wait_for(lambda: self.admission.gauges()['test_batch_admission_active'] == 0)
+        self.assertEqual(len(self.calls), 3)
+        # The item finished before the disconnect is saved
+        self.assertEqual(AIConsultation.objects.filter(question=item['question']).count(), 1)
+
+
+class ConsultationJobTests(ConsultationTestCase):
+
+    def test_failed_job_does_not_expose_the_error(self):
+        ConsultationJob.objects.create(medical_record=self.record, question='Why is my chest tight?')
+        failure = OllamaError('POST http://10.0.0.7:11434/api/generate failed: 500 model crashed')
+        with mock.patch('apps.medical_records.jobs.generate_consultation', side_effect=failure):
+            run_job(claim_next_job())
+
+        job = ConsultationJob.objects.get()
+        self.assertEqual(job.status, ConsultationJob.STATUS_FAILED)
+        response = self.client.get(f'/api/medical-records/consultation/jobs/{job.id}/')
+        self.assertEqual(response.json()['error'], 'Consultation failed (ai_service_error)')
+        self.assertNotIn('10.0.0.7', response.content.decode())
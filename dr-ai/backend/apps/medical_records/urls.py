@@ -6,7 +6,11 @@ from . import utils
 urlpatterns = [
     path('record/', views.medical_record, name='medical_record'),
     path('record/<str:nfc_id>/', views.public_medical_record, name='public_medical_record'),
+    path('consultation/batch/', views.batch_ai_consultation, name='batch_ai_consultation'),
     path('consultation/<str:nfc_id>/', views.ai_consultation, name='ai_consultation'),
+    path('consultation/<str:nfc_id>/stream/', views.ai_consultation_stream, name='ai_consultation_stream'),
+    path('consultation/<str:nfc_id>/jobs/', views.enqueue_ai_consultation, name='enqueue_ai_consultation'),
+    path('consultation/jobs/<uuid:job_id>/', views.consultation_job_status, name='consultation_job_status'),
     path('record/<str:nfc_id>/pdf/', lambda request, nfc_id: FileResponse(
         utils.generate_medical_record_pdf(views.get_object_or_404(views.MedicalRecord, nfc_id=nfc_id)),
         filename=f'medical_record_{nfc_id}.pdf'
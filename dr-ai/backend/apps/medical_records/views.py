@@ -1,15 +1,31 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import MedicalRecord, AIConsultation
-from .serializers import MedicalRecordSerializer, AIConsultationSerializer
-from ..ai_service.ollama_client import OllamaClient
+from .models import MedicalRecord, AIConsultation, ConsultationJob
+from .serializers import MedicalRecordSerializer, AIConsultationSerializer, ConsultationJobSerializer
+from .renderers import EventStreamRenderer, sse_event
+from .services import (
+    model_router, generate_consultation, save_consultation, save_telemetry, find_idempotent_consultation,
+    cached_response, store_response, validate_response, consultation_admission, lookup_answer, summary_answer,
+    conversation_context,
+    CACHED_SOURCES, SOURCE_CACHE, SOURCE_LLM, SOURCE_IDEMPOTENT_REPLAY, SOURCE_LOOKUP, SOURCE_SUMMARY
+)
+from .summaries import summary_payload
+from .jobs import enqueue_consultation
+from .batch import BatchConsultation, parse_batch_items
+from ..ai_service.admission import (
+    AdmissionRejected, ReleasingIterator, PRIORITIES, PRIORITY_ROUTINE
+)
+from ..ai_service.conf import ai_setting
+from ..ai_service.response_parser import StreamingSectionParser
+from ..ai_service.structured_output import OUTPUT_TEXT
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
 from uuid import UUID
 import json
-
-ollama_client = OllamaClient()
+import time
 
 @api_view(['GET', 'POST'])
 @permission_classes([IsAuthenticated])
@@ -42,6 +58,10 @@ def public_medical_record(request, nfc_id):
         # Add NFC URL to response
         data['nfc_url'] = f"http://localhost:5173/record/{record.nfc_id}"
         
+        # Precomputed risk summary; stale or missing ones are regenerated in the background
+        if ai_setting('PATIENT_SUMMARY_ENABLED'):
+            data['ai_summary'] = summary_payload(record)
+        
         return Response(data)
     except MedicalRecord.DoesNotExist:
         return Response(
@@ -54,6 +74,51 @@ def public_medical_record(request, nfc_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+def _idempotency_key(request):
+    """
+    Client retry key from the Idempotency-Key header or request body
+    """
+    return request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+
+def _follow_up_flag(request):
+    """
+    The client's `follow_up` flag from the request body or query string:
+    True or False when sent, None to let the server decide
+    """
+    value = request.data.get('follow_up', request.query_params.get('follow_up'))
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+
+PRIORITY_HEADER = 'X-Consultation-Priority'
+
+def _request_priority(request, default=PRIORITY_ROUTINE):
+    """
+    Admission class for a consultation request: the endpoint's default,
+    routine for signed-in non-staff users, and the X-Consultation-Priority
+    header, which may always lower the class but only raise it for staff
+    """
+    user = request.user
+    is_staff = bool(user and user.is_authenticated and user.is_staff)
+    priority = PRIORITY_ROUTINE if user and user.is_authenticated and not is_staff else default
+
+    requested = (request.headers.get(PRIORITY_HEADER) or '').strip().lower()
+    if requested in PRIORITIES and (requested == PRIORITY_ROUTINE or is_staff):
+        priority = requested
+    return priority
+
+def _rejected_response(rejection):
+    """
+    429/503 with Retry-After for a generation that was not admitted
+    """
+    return Response(
+        {'error': 'AI service is busy, please retry later', 'retry_after': rejection.retry_after},
+        status=rejection.status,
+        headers={'Retry-After': str(rejection.retry_after)}
+    )
+
 @api_view(['POST'])
 def ai_consultation(request, nfc_id):
     """
@@ -70,32 +135,34 @@ def ai_consultation(request, nfc_id):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Serialize medical record
-        medical_record_data = MedicalRecordSerializer(record).data
+        idempotency_key = _idempotency_key(request)
+        if idempotency_key and len(idempotency_key) > 64:
+            return Response(
+                {'error': 'Idempotency key must be at most 64 characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
         try:
-            # Get AI response with error catching
-            response = ollama_client.generate_medical_response(
-                medical_record=medical_record_data,
-                question=question
+            # Get AI response (cached or generated) and persist it
+            outcome = generate_consultation(
+                record, question, idempotency_key=idempotency_key,
+                priority=_request_priority(request, ai_setting('PUBLIC_CONSULTATION_PRIORITY')),
+                follow_up=_follow_up_flag(request)
             )
             
-            if not isinstance(response, dict) or 'diagnosis' not in response or 'treatment_plan' not in response:
-                raise ValueError(f"Invalid AI response format: {response}")
+            data = AIConsultationSerializer(outcome.consultation).data
+            data['cached'] = outcome.cached
+            data['source'] = outcome.source
+            if outcome.meta:
+                data['meta'] = outcome.meta
+            return Response(data)
             
-            # Create consultation record
-            consultation = AIConsultation.objects.create(
-                medical_record=record,
-                question=question,
-                diagnosis=response['diagnosis'],
-                treatment_plan=response['treatment_plan']
-            )
-            
-            return Response(AIConsultationSerializer(consultation).data)
+        except AdmissionRejected as rejection:
+            return _rejected_response(rejection)
             
         except Exception as ai_error:
             print(f"AI Service Error: {str(ai_error)}")
-            print(f"Medical Record: {medical_record_data}")
+            print(f"Medical Record: {record.nfc_id}")
             print(f"Question: {question}")
             return Response(
                 {'error': 'AI service error, please try again'}, 
@@ -109,6 +176,188 @@ def ai_consultation(request, nfc_id):
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
         )
 
+@api_view(['GET', 'POST'])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def ai_consultation_stream(request, nfc_id):
+    """
+    Streaming variant of ai_consultation.
+    Forwards model tokens as Server-Sent Events while they are generated,
+    alongside section_start / section_delta / section_end / icd_code events
+    as the DIAGNOSIS and TREATMENT PLAN sections are recognised, and
+    persists the AIConsultation once the stream completes. GET is accepted
+    (with ?question=) so browsers can consume it through EventSource.
+    """
+    record = get_object_or_404(MedicalRecord, nfc_id=nfc_id)
+    question = request.data.get('question') or request.query_params.get('question')
+
+    if not question:
+        return Response(
+            {'error': 'Question is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    idempotency_key = _idempotency_key(request)
+    if idempotency_key and len(idempotency_key) > 64:
+        return Response(
+            {'error': 'Idempotency key must be at most 64 characters'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    medical_record_data = MedicalRecordSerializer(record).data
+
+    def replay_stream(consultation, source):
+        data = AIConsultationSerializer(consultation).data
+        data.update({'cached': source in CACHED_SOURCES, 'source': source})
+        yield sse_event('done', data)
+
+    def event_stream(cache_key, conversation=None):
+        chunks = []
+        generation = {}
+        route = model_router.route(question)
+        client = route.client
+        # JSON-mode completions have no section headers to stream
+        sections = StreamingSectionParser() if client.output_format == OUTPUT_TEXT else None
+        started = time.perf_counter()
+        try:
+            for chunk in client.stream_medical_response(
+                medical_record=medical_record_data,
+                question=question,
+                session_key=record.pk,
+                on_complete=lambda stats: generation.update(stats.to_dict()),
+                conversation=conversation.text if conversation is not None else None
+            ):
+                chunks.append(chunk)
+                yield sse_event('token', {'text': chunk})
+                for event in sections.feed(chunk) if sections else ():
+                    yield sse_event(event.type, event.to_dict())
+            for event in sections.close() if sections else ():
+                yield sse_event(event.type, event.to_dict())
+
+            response = client.parse_response(''.join(chunks))
+            validate_response(response)
+            model_router.record(route, time.perf_counter() - started)
+            # Follow-up answers depend on the conversation and are not cached
+            if conversation is None:
+                store_response(record, cache_key, response)
+            consultation = save_consultation(record, question, response, idempotency_key)
+            save_telemetry(consultation, generation)
+
+            data = AIConsultationSerializer(consultation).data
+            data.update({'cached': False, 'source': SOURCE_LLM})
+            yield sse_event('done', data)
+
+        except Exception as ai_error:
+            model_router.record(route, time.perf_counter() - started, outcome='error')
+            print(f"AI Streaming Error: {str(ai_error)}")
+            print(f"Question: {question}")
+            yield sse_event('error', {'error': 'AI service error, please try again'})
+
+    # Replays and cache hits are answered without a generation slot; a
+    # generation is admitted before the stream starts so that rejections
+    # keep their 429/503 status instead of surfacing mid-stream.
+    prior = find_idempotent_consultation(record, idempotency_key)
+    looked_up = lookup_answer(question, medical_record_data) if prior is None else None
+    summarised = summary_answer(record, question) if prior is None and looked_up is None else None
+    answered = prior is not None or looked_up is not None or summarised is not None
+    cache_key, cached, conversation = None, None, None
+    if not answered:
+        cache_key, cached = cached_response(record, question, medical_record_data)
+        if cached is None:
+            conversation = conversation_context(record, question, _follow_up_flag(request))
+    if prior is not None:
+        stream = replay_stream(prior, SOURCE_IDEMPOTENT_REPLAY)
+    elif looked_up is not None:
+        stream = replay_stream(
+            save_consultation(record, question, looked_up.response, idempotency_key), SOURCE_LOOKUP
+        )
+    elif summarised is not None:
+        stream = replay_stream(
+            save_consultation(record, question, summarised.response, idempotency_key), SOURCE_SUMMARY
+        )
+    elif cached is not None:
+        stream = replay_stream(save_consultation(record, question, cached, idempotency_key), SOURCE_CACHE)
+    else:
+        try:
+            slot = consultation_admission.acquire(
+                priority=_request_priority(request, ai_setting('PUBLIC_CONSULTATION_PRIORITY'))
+            )
+        except AdmissionRejected as rejection:
+            return _rejected_response(rejection)
+        stream = ReleasingIterator(event_stream(cache_key, conversation), slot)
+
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the whole stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([JSONRenderer, EventStreamRenderer])
+def batch_ai_consultation(request):
+    """
+    Ask questions about many records at once (e.g. the same screening
+    question for a whole ward). Streams an `item` event per record as its
+    answer is ready and a final `done` event listing the saved
+    consultations.
+    """
+    try:
+        items = parse_batch_items(request.data)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    batch = BatchConsultation(items)
+
+    def event_stream():
+        try:
+            for event, data in batch.stream():
+                yield sse_event(event, data)
+        except Exception as e:
+            print(f"Batch Consultation Error: {str(e)}")
+            yield sse_event('error', {'error': 'AI service error, please try again'})
+
+    response = StreamingHttpResponse(event_stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+@api_view(['POST'])
+def enqueue_ai_consultation(request, nfc_id):
+    """
+    Queue an AI consultation and return immediately with a job id.
+    Poll consultation_job_status until the job is done or failed.
+    """
+    record = get_object_or_404(MedicalRecord, nfc_id=nfc_id)
+    question = request.data.get('question')
+
+    if not question:
+        return Response(
+            {'error': 'Question is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    job = enqueue_consultation(record, question)
+    return Response(ConsultationJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+@api_view(['GET'])
+def consultation_job_status(request, job_id):
+    """
+    Report queued/running/done/failed for a consultation job
+    """
+    job = get_object_or_404(
+        ConsultationJob.objects.select_related('consultation'),
+        id=job_id
+    )
+    data = ConsultationJobSerializer(job).data
+
+    if job.status == ConsultationJob.STATUS_QUEUED:
+        data['queue_position'] = ConsultationJob.objects.filter(
+            status=ConsultationJob.STATUS_QUEUED,
+            created_at__lte=job.created_at
+        ).count()
+
+    return Response(data)
+
 from django.http import FileResponse, Http404
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
@@ -40,6 +40,7 @@ INSTALLED_APPS = [
     'corsheaders',
     'apps.authentication',
     'apps.medical_records',
+    'apps.ai_service',
 ]
 
 MIDDLEWARE = [
@@ -142,6 +143,98 @@ CORS_ALLOW_ALL_ORIGINS = True
 #     "https://rj8vq174-5173.uks1.devtunnels.ms",
 # ]
 
+# AI service settings (defaults live in apps/ai_service/conf.py)
+AI_SERVICE = {
+    'OLLAMA_BASE_URL': os.environ.get('OLLAMA_BASE_URL', 'http://localhost:11434'),
+    'OLLAMA_MODEL': 'medllama2',
+    # Seconds; connect fails fast, read covers a full CPU generation
+    'OLLAMA_CONNECT_TIMEOUT': 3.05,
+    'OLLAMA_READ_TIMEOUT': 300.0,
+    # Keep-alive connections kept per Ollama host
+    'OLLAMA_POOL_SIZE': 10,
+    # Comma-separated Ollama hosts to load-balance across (least outstanding
+    # requests, with health checks); empty means OLLAMA_BASE_URL only
+    'OLLAMA_BACKENDS': [url for url in os.environ.get('OLLAMA_BACKENDS', '').split(',') if url.strip()],
+    'OLLAMA_HEALTH_INTERVAL': 10.0,
+    # Circuit breaker per backend: trip on failures or a slow first token
+    'BREAKER_LATENCY_SLO': 30.0,
+    'BREAKER_RESET_TIMEOUT': 30.0,
+    # Send a duplicate to a second backend when the first token is late
+    # (p95 of recent first-token latency); needs two or more backends
+    'HEDGE_ENABLED': False,
+    'OLLAMA_KEEP_ALIVE': '30m',
+    # Load the model when the server starts and keep it resident (refreshed
+    # well inside OLLAMA_KEEP_ALIVE); `manage.py warm_model` does it on demand
+    'WARMUP_ON_STARTUP': os.environ.get('OLLAMA_WARMUP_ON_STARTUP', '').lower() in ('1', 'true', 'yes'),
+    'WARMUP_REFRESH_INTERVAL': 600.0,
+    # 'json' asks for {diagnosis, treatment_plan, icd_code} via Ollama's
+    # structured output instead of parsing DIAGNOSIS:/TREATMENT PLAN: headers
+    'OLLAMA_OUTPUT_FORMAT': os.environ.get('OLLAMA_OUTPUT_FORMAT', 'text'),
+    # Cut answers off at the sign-off after the treatment plan, and size
+    # num_predict per question type from recent answer lengths
+    'GENERATION_EARLY_STOP': True,
+    'GENERATION_ADAPTIVE_NUM_PREDICT': True,
+    # Send simple record look-ups to a small fast model (pull it first:
+    # `ollama pull llama3.2:1b`); diagnoses stay on OLLAMA_MODEL
+    'MODEL_ROUTING_ENABLED': os.environ.get('MODEL_ROUTING_ENABLED', '').lower() in ('1', 'true', 'yes'),
+    'MODEL_ROUTES': {
+        'simple': {'model': os.environ.get('OLLAMA_FAST_MODEL', 'llama3.2:1b'), 'num_predict': 256},
+        'complex': {'model': None},
+    },
+    # Answer blood type / allergy / medication look-ups from the record
+    # without a generation when the intent match is confident enough
+    'LOOKUP_FAST_PATH_ENABLED': True,
+    'LOOKUP_FAST_PATH_THRESHOLD': 0.8,
+    # Long medical histories: send the newest entries plus those relevant to
+    # the question (BM25; set the embedder to 'hashing' to blend in local
+    # embeddings) instead of the whole list. `manage.py
+    # benchmark_history_retrieval` compares prompt size and latency.
+    'HISTORY_RETRIEVAL_ENABLED': True,
+    'HISTORY_RETRIEVAL_MIN_ENTRIES': 24,
+    'HISTORY_RETRIEVAL_TOP_K': 8,
+    'HISTORY_RETRIEVAL_EMBEDDER': None,
+    # Follow-up questions see the last few answers verbatim and a compact
+    # summary of older ones, bounded so they fit the 4096-token context
+    'CONVERSATION_MEMORY_ENABLED': True,
+    'CONVERSATION_MAX_TURNS': 3,
+    'CONVERSATION_MAX_TOKENS': 600,
+    # Precompute each patient's risk summary after the record changes (once
+    # edits settle) and serve it instantly; stale summaries are redone lazily
+    'PATIENT_SUMMARY_ENABLED': True,
+    'PATIENT_SUMMARY_DEBOUNCE': 5.0,
+    'PATIENT_SUMMARY_WORKERS': 1,
+    # Keep per-consultation load / prefill / generation timings
+    'GENERATION_TELEMETRY_STORE': True,
+    # Reuse each patient's evaluated prompt prefix between questions
+    'PROMPT_SESSION_CACHE_ENABLED': True,
+    'PROMPT_SESSION_CACHE_MAX': 256,
+    # Generations allowed to run at once and how many more may wait (up to
+    # ADMISSION_QUEUE_TIMEOUT seconds) before requests get 429/503 + Retry-After
+    'ADMISSION_MAX_CONCURRENT': 4,
+    'ADMISSION_MAX_QUEUE': 16,
+    'ADMISSION_QUEUE_TIMEOUT': 30.0,
+    # NFC scans (paramedics) run as 'emergency': one slot is kept free for
+    # them and they jump queued routine work; routine requests queued for
+    # ADMISSION_STARVATION_TIMEOUT seconds are served first regardless
+    'ADMISSION_EMERGENCY_RESERVED': 1,
+    'ADMISSION_STARVATION_TIMEOUT': 10.0,
+    'PUBLIC_CONSULTATION_PRIORITY': 'emergency',
+    # Most (record, question) pairs accepted by the batch consultation endpoint
+    'BATCH_MAX_ITEMS': 100,
+    # Background workers draining the consultation job queue. Set
+    # JOB_IN_PROCESS_WORKERS to False when running `manage.py run_consultation_workers`.
+    'JOB_WORKERS': 2,
+    'JOB_IN_PROCESS_WORKERS': True,
+    # Exact-match response cache (per process, LRU + TTL in seconds)
+    'RESPONSE_CACHE_ENABLED': True,
+    'RESPONSE_CACHE_MAX_ENTRIES': 512,
+    'RESPONSE_CACHE_TTL': 3600,
+    # Reuse answers to paraphrased questions ('hashing' or 'ollama' embedder)
+    'SEMANTIC_CACHE_ENABLED': False,
+    'SEMANTIC_CACHE_EMBEDDER': 'hashing',
+    'SEMANTIC_CACHE_THRESHOLD': 0.85,
+}
+
 # Admin Interface settings
 X_FRAME_OPTIONS = 'SAMEORIGIN'
 SILENCED_SYSTEM_CHECKS = ['security.W019']
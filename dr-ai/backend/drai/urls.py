@@ -11,6 +11,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('apps.authentication.urls')),
     path('api/medical-records/', include('apps.medical_records.urls')),
+    path('api/ai/', include('apps.ai_service.urls')),
 ]
 
 # Serve static files in development